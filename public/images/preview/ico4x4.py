@@ -38,7 +38,8 @@ FUNCIONALIDAD:
 OPCIÓN 1:
     - Convertir TODOS los archivos .webp a .ico en el directorio.
       Se genera un .ico por cada .webp con el mismo nombre base,
-      forzando reemplazo si el .ico ya existía.
+      forzando reemplazo si el .ico ya existía. Cada archivo corre aislado,
+      con tope de tiempo y memoria; los que fallan quedan en cuarentena.
 
 OPCIÓN 2:
     - A partir de 'logo.png' (o el que se indique en las constantes), generar:
@@ -46,25 +47,85 @@ OPCIÓN 2:
         * favicon-32x32.png (32x32)   -> mantiene transparencia si existiera
         * apple-touch-icon.png (180x180)  -> mantiene transparencia si existiera
         * favicon.ico con múltiples tamaños (16,32,48,64), manteniendo transparencia
+        * android-chrome-{192,512}.png y sus variantes "maskable" (con zona segura)
+        * mstile-*.png (mosaicos de Windows)
+        * site.webmanifest -> manifest PWA que referencia los íconos anteriores
         * preview.png  -> copia exacta (mantiene transparencia, si hay)
         * preview.jpg  -> forzosamente sin transparencia (el formato JPG no la soporta)
         * preview.webp -> mantiene transparencia si existiera
+        * preview-animated.webp / .png (APNG) -> sólo si el logo es animado
+      Las salidas no llevan los metadatos del origen (EXIF, XMP, textos,
+      fechas) y la misma entrada produce siempre los mismos bytes.
+
+OPCIÓN 3:
+    - Generar una tarjeta Open Graph (1200x630) por cada post de /blogs,
+      en og/<slug>.png, regenerando sólo los posts que cambiaron.
+
+OPCIÓN 4:
+    - Reducir los .webp del directorio a íconos de 64px y empaquetarlos en
+      sprite sheets (sprites-N.png) con su mapa sprites.json / sprites.css.
+
+OPCIÓN 5:
+    - Indexar los hashes perceptuales (aHash/dHash) de todas las imágenes del
+      árbol y reportar grupos de casi-duplicados (mismo contenido en otro
+      formato o tamaño). El índice se actualiza sólo para archivos modificados.
 
 Se reemplazan los archivos existentes, si ya estaban.
 
 REQUISITOS:
     pip install Pillow
+    (opcional) pip install brotli  -> sidecars .br además de .gz
 
 USO:
     cd /ruta/donde/esta/este/script
     python generate_missing_icons.py
+    python generate_missing_icons.py --profile[=cprofile]  -> perfil por trabajo
+    python generate_missing_icons.py --self-check          -> verificar salidas y tiempos
+    python generate_missing_icons.py --benchmark-resize    -> costo/calidad (SSIM) del resize
+    python generate_missing_icons.py --decoded-cache       -> no volver a decodificar orígenes sin cambios
+    python generate_missing_icons.py --verify=all          -> decodificar todas las salidas escritas
+    python generate_missing_icons.py --storage=s3          -> publicar también en un bucket S3
+    python generate_missing_icons.py --object-store-server DIR  -> bucket S3 local de prueba
 
 ==============================================================================
 """
 
+import io
+import json
+import mmap
 import os
+import re
+import tempfile
+import argparse
 import asyncio
-from PIL import Image
+import base64
+import cProfile
+import gzip
+import hashlib
+import heapq
+import hmac
+import http.client
+import marshal
+import mimetypes
+import multiprocessing
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import warnings
+import weakref
+import zlib
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from contextlib import ExitStack, asynccontextmanager, contextmanager, redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
+from functools import partial
+from typing import AsyncIterator, Callable, Iterator
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageStat, TiffImagePlugin, UnidentifiedImageError
 
 ###############################################################################
 #                       CONFIGURACIÓN RÁPIDAMENTE EDITABLE
@@ -73,10 +134,60 @@ from PIL import Image
 # Archivo base para generar íconos y previews
 LOGO_FILENAME: str = "logo.png"
 
+# Modo SVG: rasterizar 'logo.svg' directamente a cada tamaño en lugar de
+# reducir 'logo.png'. Requiere cairosvg, rsvg-convert, inkscape o magick;
+# si no hay ninguno se usa LOGO_FILENAME.
+USE_SVG_SOURCE: bool = False
+LOGO_SVG_FILENAME: str = "logo.svg"
+# Tamaño al que se rasteriza el SVG para los previews
+SVG_PREVIEW_SIZE: tuple[int, int] = (1024, 1024)
+# Carpeta (relativa al script) de la caché de rasterizados
+SVG_RENDER_CACHE_DIR: str = os.path.join(".ico4x4-cache", "svg")
+
+# Caché persistente de orígenes decodificados (logo y .webp ya en RGBA): las
+# corridas siguientes mapean los píxeles con mmap en lugar de decodificar.
+# Ocupa 4 bytes por píxel, por eso es opcional (o '--decoded-cache').
+DECODED_CACHE: bool = False
+DECODED_CACHE_DIR: str = os.path.join(".ico4x4-cache", "decoded")
+DECODED_CACHE_MAX_MB: int = 1024
+DECODED_CACHE_MIN_PIXELS: int = 512 * 512  # más chicos se decodifican siempre
+
+# Builds incrementales en CI: sólo se procesan los orígenes que git reporta
+# como cambiados desde esta referencia (p.e. "origin/main" o "HEAD~1"), más
+# sus destinos dependientes (todo el set de favicons si cambió el logo). Con
+# "HEAD" se toman los cambios sin commitear (git los detecta con el stat del
+# índice, sin leer cada archivo). None = procesar todo (o '--since REF').
+INCREMENTAL_SINCE: str | None = None
+GIT_TIMEOUT_SECONDS: float = 30.0
+
+# Gestión de color: las imágenes con perfil ICC (CMYK, Display P3...) se
+# convierten a sRGB. Las transformaciones se cachean (LRU) por perfil.
+COLOR_MANAGEMENT: bool = True
+COLOR_RENDERING_INTENT: str = "perceptual"  # perceptual, relative, saturation, absolute
+ICC_TRANSFORM_CACHE_SIZE: int = 32
+
 # Para la conversión de .webp a .ico
 # (tamaño único para el .ico resultante; se puede cambiar a gusto)
 WEBP_TO_ICO_SIZE: int = 64
 
+# Redimensionado: en reducciones grandes se promedia por bloques ('reduce')
+# hasta quedar a RESIZE_REDUCING_GAP veces el destino y se termina con
+# LANCZOS (3.0 no se distingue de LANCZOS directo; ver --benchmark-resize).
+# Los tamaños chicos se derivan de uno ya calculado si es al menos
+# RESIZE_CHAIN_MIN_RATIO veces más grande.
+RESIZE_REDUCING_GAP: float | None = 3.0   # None = siempre una pasada LANCZOS completa
+RESIZE_CHAIN_MIN_RATIO: float = 2.0
+RESIZE_MIN_SSIM: float = 0.99             # calidad mínima exigida en --benchmark-resize
+
+# Frame que representa a una imagen animada en salidas estáticas (.ico, PNG):
+# "first", "largest-change" (el que más cambia respecto del anterior) o un índice
+ANIMATION_FRAME_SELECTION: str | int = "first"
+
+# Previews animados (sólo si el logo es animado): lado máximo y formatos
+ANIMATED_PREVIEW_MAX_SIDE: int = 512
+ANIMATED_PREVIEW_WEBP: str = "preview-animated.webp"
+ANIMATED_PREVIEW_APNG: str = "preview-animated.png"
+
 # Nombre y tamaños de los íconos PNG a generar
 FAVICON_16: str = "favicon-16x16.png"
 FAVICON_16_SIZE: tuple[int, int] = (16, 16)
@@ -96,11 +207,311 @@ PREVIEW_PNG: str = "preview.png"
 PREVIEW_JPG: str = "preview.jpg"
 PREVIEW_WEBP: str = "preview.webp"
 
+# Salidas deterministas: la misma entrada da siempre los mismos bytes, así los
+# cachés por hash de contenido (CDN, ETag) aciertan entre builds. Se quitan los
+# metadatos del origen (EXIF, XMP, comentarios, textos, fechas, pHYs...) y los
+# parámetros de cada codificador quedan fijos.
+DETERMINISTIC_OUTPUT: bool = True
+# Chunks PNG auxiliares que se conservan (los críticos se conservan siempre)
+METADATA_KEEP_PNG_CHUNKS: tuple[str, ...] = ("tRNS", "iCCP", "gAMA", "cHRM", "acTL", "fcTL", "fdAT")
+# Conservar perfiles ICC que no son sRGB (los sRGB se quitan: son redundantes)
+METADATA_KEEP_ICC: bool = True
+# Parámetros fijos por formato (los que pase cada llamada tienen prioridad).
+# PNG y WebP quedan en su nivel por defecto: 'optimize' (PNG) y 'method' 6
+# (WebP con alpha o animado) tardan de 5 a 10 veces más.
+OUTPUT_ENCODER_OPTIONS: dict[str, dict] = {
+    "PNG": {"compress_level": 6},
+    "JPEG": {"optimize": True, "progressive": False, "subsampling": "4:2:0"},
+    "WEBP": {"method": 4},
+}
+
+# Íconos PWA/Android: purpose "any" y "maskable" (mismos tamaños)
+PWA_ICON_SIZES: list[int] = [192, 512]
+PWA_ICON_PATTERN: str = "android-chrome-{size}x{size}.png"
+PWA_MASKABLE_PATTERN: str = "android-chrome-maskable-{size}x{size}.png"
+
+# Zona segura de los íconos maskable (spec W3C): un círculo centrado de radio
+# 40% del lado. El lienzo del logo es el cuadrado más grande inscripto en ese
+# círculo (lado 0.8 / √2 ≈ 57%), así ninguna máscara recorta el logo.
+MASKABLE_SAFE_ZONE_RADIUS: float = 0.4
+MASKABLE_BACKGROUND: tuple[int, int, int, int] = (255, 255, 255, 255)
+
+# Mosaicos de Windows: (archivo, tamaño del lienzo, tamaño del logo centrado)
+MSTILE_TARGETS: list[tuple[str, tuple[int, int], tuple[int, int]]] = [
+    ("mstile-70x70.png", (70, 70), (70, 70)),
+    ("mstile-150x150.png", (150, 150), (150, 150)),
+    ("mstile-310x150.png", (310, 150), (150, 150)),
+    ("mstile-310x310.png", (310, 310), (310, 310)),
+]
+
+# Manifest PWA
+WEB_MANIFEST: str = "site.webmanifest"
+WEB_MANIFEST_NAME: str = "Talberos"
+WEB_MANIFEST_SHORT_NAME: str = "Talberos"
+WEB_MANIFEST_THEME_COLOR: str = "#1f1f1f"
+WEB_MANIFEST_BACKGROUND_COLOR: str = "#ffffff"
+
+# Atlas de íconos (sprite sheets) a partir de los .webp del directorio
+ATLAS_SOURCE_EXTENSIONS: tuple[str, ...] = (".webp",)
+ATLAS_ICON_SIZE: int = 64
+ATLAS_MAX_SHEET_SIZE: tuple[int, int] = (1024, 1024)
+ATLAS_PADDING: int = 2                    # separación para que no se mezclen bordes
+ATLAS_SHEET_PATTERN: str = "sprites-{index}.png"
+ATLAS_MAP_JSON: str = "sprites.json"
+ATLAS_MAP_CSS: str = "sprites.css"
+
+# Índice de hashes perceptuales para detectar casi-duplicados
+PHASH_SOURCE_EXTENSIONS: tuple[str, ...] = (".png", ".jpg", ".jpeg", ".webp", ".ico", ".gif")
+PHASH_INDEX_FILE: str = os.path.join(".ico4x4-cache", "phash-index.json")
+PHASH_HASH_SIZE: int = 8                # grilla de 8x8 -> hashes de 64 bits
+PHASH_MAX_DISTANCE: int = 6             # bits distintos tolerados en aHash y dHash
+
+# Tarjetas Open Graph por post: los posts se buscan desde la raíz del
+# repositorio (igual desde cualquier copia del script) y las tarjetas y la
+# caché quedan junto al script
+SOCIAL_CARDS_POSTS_DIR: str = "blogs"
+SOCIAL_CARDS_OUTPUT_DIR: str = "og"
+SOCIAL_CARDS_CACHE_FILE: str = os.path.join(".ico4x4-cache", "og-cards.json")
+SOCIAL_CARD_SIZE: tuple[int, int] = (1200, 630)
+SOCIAL_CARD_BACKGROUND: str = "#1f1f1f"
+SOCIAL_CARD_TEXT_COLOR: str = "#ffffff"
+SOCIAL_CARD_MUTED_COLOR: str = "#b0b0b0"
+SOCIAL_CARD_LOGO_SIZE: int = 120
+# Ruta a una fuente .ttf; None busca una común y si no usa la de Pillow
+SOCIAL_CARD_FONT: str | None = None
+
+# Pipeline por etapas (lectura -> codificación -> escritura)
+PIPELINE_READ_WORKERS: int = 2          # lecturas anticipadas simultáneas
+PIPELINE_ENCODE_WORKERS: int = os.cpu_count() or 1
+PIPELINE_QUEUE_SIZE: int = 8            # tamaño de las colas entre etapas (backpressure)
+PIPELINE_WRITE_BATCH: int = 16          # archivos por lote de escritura
+PIPELINE_FSYNC: bool = True             # sincronizar a disco cada lote escrito
+PIPELINE_USE_PROCESSES: bool = False    # codificar en procesos en lugar de hilos
+
+# Prioridades de los trabajos de codificación, compartidas por todas las
+# corridas del proceso: los íconos del logo ("interactive") no esperan detrás
+# de un lote grande de .webp ("bulk"). Dentro de cada clase va primero el
+# trabajo más chico (píxeles leídos del encabezado).
+SCHEDULER_CLASSES: tuple[str, ...] = ("interactive", "normal", "bulk")
+SCHEDULER_SLOTS: int = PIPELINE_ENCODE_WORKERS   # trabajos codificándose a la vez
+# Fracción máxima de los slots que puede ocupar cada clase mientras una más
+# prioritaria espera (sin competencia, cualquier clase usa todos los slots)
+SCHEDULER_SHARES: dict[str, float] = {"interactive": 1.0, "normal": 1.0, "bulk": 0.75}
+SCHEDULER_INTERACTIVE_BURST: int = 1    # slots extra reservados para "interactive"
+
+# Verificación posterior a la escritura, en paralelo con la codificación: cada
+# salida se relee del disco y se compara con lo codificado (detecta archivos
+# truncados, p.e. con el disco lleno) y con lo esperado (formato, tamaño,
+# alpha y tamaños del .ico). Si falla se reescribe; si sigue fallando, la
+# corrida termina con código de salida 1. Es opcional: se activa con
+# '--verify[=modo]' (sin modo, "sample") o cambiando VERIFY_OUTPUTS.
+#   None = no verificar, "header" = sólo encabezados,
+#   "sample" = además decodifica por completo una muestra, "all" = decodifica todo
+VERIFY_MODES: tuple[str, ...] = ("header", "sample", "all")
+VERIFY_OUTPUTS: str | None = None
+VERIFY_SAMPLE_RATE: float = 0.1         # fracción decodificada por completo con "sample"
+VERIFY_WORKERS: int = 2
+VERIFY_RETRIES: int = 2                 # reescrituras antes de darla por fallida
+
+# Aislamiento de la conversión .webp -> .ico: cada archivo corre en un proceso
+# con tope de tiempo y de memoria; si se cuelga o lo supera, el proceso se mata
+# y se reemplaza, y el archivo queda en cuarentena (no se reintenta mientras
+# no cambie, o hasta '--clear-quarantine'). Los demás errores (disco lleno,
+# permisos...) sólo cuentan como fallidos: se reintentan en la próxima corrida.
+TASK_ISOLATION: bool = True
+TASK_TIMEOUT_SECONDS: float = 60.0
+TASK_MEMORY_LIMIT_MB: int | None = 2048
+TASK_MAX_IMAGE_PIXELS: int = 64_000_000  # más píxeles = bomba de descompresión
+QUARANTINE_FILE: str = os.path.join(".ico4x4-cache", "quarantine.json")
+
+# Sidecars precomprimidos (.gz y, si está instalado 'brotli', .br) para que el
+# servidor estático los sirva sin comprimir en cada pedido
+PRECOMPRESS_SIDECARS: bool = False
+# Ahorro mínimo (fracción del original) para que valga la pena el sidecar
+SIDECAR_MIN_SAVING: float = 0.10
+# Formatos ya comprimidos: no se les generan sidecars
+SIDECAR_SKIP_EXTENSIONS: tuple[str, ...] = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".avif", ".br", ".gz")
+
+# Raíz del sitio publicado (la carpeta estática de Next.js, servida en "/"): de
+# ahí salen las claves del bucket y las URLs del manifest, así cada copia del
+# script (public/, public/images/, ...) usa las rutas reales de sus salidas.
+# None = la carpeta SITE_ROOT_DIRNAME más cercana hacia arriba (o la del
+# script si no hay ninguna).
+SITE_ROOT_DIRNAME: str = "public"
+SITE_ROOT_DIR: str | None = None
+
+# Destino de las salidas del pipeline: "local" (disco) o "s3" (bucket compatible
+# con S3: AWS, MinIO, R2 o el servidor local de '--object-store-server').
+# Con "s3" las salidas se suben desde memoria; las que ya están con el mismo
+# ETag no se vuelven a subir.
+STORAGE_BACKEND: str = "local"
+STORAGE_KEEP_LOCAL: bool = True         # con "s3", escribir también en disco
+S3_ENDPOINT: str = "http://127.0.0.1:9000"
+S3_BUCKET: str = "talberos-public"
+S3_PREFIX: str = ""                     # p.e. "static/" -> public/images/logo.png en static/images/logo.png
+S3_REGION: str = "us-east-1"
+S3_ACCESS_KEY: str = os.environ.get("ICO4X4_S3_ACCESS_KEY", "")  # vacío = pedidos sin firmar
+S3_SECRET_KEY: str = os.environ.get("ICO4X4_S3_SECRET_KEY", "")
+S3_POOL_SIZE: int = 8                   # conexiones persistentes y subidas simultáneas
+S3_MULTIPART_THRESHOLD: int = 8 * 1024 * 1024  # más grande que esto -> multipart
+S3_PART_SIZE: int = 8 * 1024 * 1024
+
+# Métricas (formato de texto de Prometheus) y progreso de las corridas
+METRICS_PROM_FILE: str | None = None    # p.e. ".ico4x4-cache/ico4x4.prom" (textfile collector)
+METRICS_HTTP_PORT: int | None = None    # p.e. 9464 -> http://127.0.0.1:9464/metrics
+METRICS_INTERVAL: float = 2.0           # segundos entre actualizaciones
+METRICS_PROGRESS: bool = True           # línea de progreso con ETA (en stderr)
+METRICS_LATENCY_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Perfilado por trabajo: None, "sampling" (pilas para flamegraph) o "cprofile".
+# También se activa con 'python ico4x4.py --profile[=cprofile]'.
+PROFILE_MODES: tuple[str, ...] = ("sampling", "cprofile")
+PROFILE_MODE: str | None = None
+PROFILE_SAMPLE_INTERVAL: float = 0.001  # segundos entre muestras de pila
+PROFILE_OUTPUT_DIR: str = os.path.join(".ico4x4-cache", "profile")
+
+# Autoverificación (--self-check): salidas de referencia y presupuestos.
+# Los tiempos se miden en unidades de un bucle de calibración. Las referencias
+# van en la raíz del repositorio, fuera de public/ (no se publican), y las
+# comparten todas las copias del script; '--golden RUTA' usa otro archivo.
+SELF_CHECK_GOLDEN_FILE: str = "ico4x4-golden.json"
+SELF_CHECK_HUGE_SIZE: tuple[int, int] = (6000, 4000)
+SELF_CHECK_THUMB_SIZE: tuple[int, int] = (8, 8)
+SELF_CHECK_CORRUPT_WEBP: str = "corrupt.webp"  # .webp truncado del escenario de cuarentena
+SELF_CHECK_PIXEL_TOLERANCE: int = 6       # niveles por canal en la miniatura
+SELF_CHECK_TIME_TOLERANCE: float = 2.0    # más lento que 2x la referencia = regresión
+SELF_CHECK_TIME_FLOOR: float = 3.0        # por debajo de esto (en unidades) no se controla
+SELF_CHECK_MEMORY_TOLERANCE: float = 1.5  # pico de píxeles vivos admitido vs. referencia
+SELF_CHECK_CALIBRATION_ROUNDS: int = 5
+
 ###############################################################################
 # Ruta del script
 ###############################################################################
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+###############################################################################
+# RESPONSABILIDAD: Contabilizar archivos abiertos y memoria de píxeles viva
+###############################################################################
+class ResourceTracker:
+    """
+    Lleva la cuenta de los descriptores de archivo abiertos y de los bytes de
+    píxeles que siguen vivos, registrando el máximo alcanzado (high-water mark).
+    Permite comprobar que la memoria se mantiene plana aunque el lote crezca.
+    Si un trabajo corre en otro proceso, el tracker viaja como un token: el
+    worker cuenta en una copia vacía y sus máximos vuelven con el resultado
+    (ver 'collect_received' y 'merge_remote').
+    """
+
+    # Bytes por banda para los modos que no usan 8 bits por canal
+    _BYTES_PER_BAND: dict[str, int] = {"I": 4, "F": 4, "I;16": 2, "I;16B": 2, "I;16L": 2}
+    # Proceso padre: trackers enviados a otros procesos, por token
+    _sent: "weakref.WeakValueDictionary[str, ResourceTracker]" = weakref.WeakValueDictionary()
+    # Proceso worker: copias recibidas con la tarea en curso
+    _received: list["ResourceTracker"] = []
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._live: dict[int, int] = {}
+        self.open_handles = 0
+        self.peak_open_handles = 0
+        self.live_pixel_bytes = 0
+        self.peak_pixel_bytes = 0
+
+    def __getstate__(self) -> dict:
+        # Cada proceso lleva su propia cuenta: al serializarse viaja vacío,
+        # con un token para devolverle lo medido en el worker
+        token = f"{os.getpid()}:{id(self)}"
+        ResourceTracker._sent[token] = self
+        return {"token": token}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.token = state.get("token")
+        ResourceTracker._received.append(self)
+
+    @staticmethod
+    def collect_received() -> dict[str, tuple[int, int]]:
+        """
+        En el worker: máximos (bytes de píxeles, archivos abiertos) de cada
+        tracker recibido desde la última llamada, por token.
+        """
+        usage: dict[str, tuple[int, int]] = {}
+        for tracker in ResourceTracker._received:
+            pixels, handles = usage.get(tracker.token, (0, 0))
+            usage[tracker.token] = (
+                max(pixels, tracker.peak_pixel_bytes),
+                max(handles, tracker.peak_open_handles),
+            )
+        ResourceTracker._received.clear()
+        return usage
+
+    @staticmethod
+    def merge_remote(usage: dict[str, tuple[int, int]]) -> None:
+        """
+        En el padre: suma los máximos medidos en un worker a lo vivo en cada
+        tracker de origen, como si el trabajo hubiese corrido en este proceso.
+        """
+        for token, (pixels, handles) in usage.items():
+            tracker = ResourceTracker._sent.get(token)
+            if tracker is None:
+                continue
+            with tracker._lock:
+                tracker.peak_pixel_bytes = max(tracker.peak_pixel_bytes, tracker.live_pixel_bytes + pixels)
+                tracker.peak_open_handles = max(tracker.peak_open_handles, tracker.open_handles + handles)
+
+    @classmethod
+    def pixel_bytes(cls, img: Image.Image) -> int:
+        """
+        Estima los bytes que ocupan los píxeles decodificados de 'img'.
+        """
+        bands = len(img.getbands())
+        return img.width * img.height * bands * cls._BYTES_PER_BAND.get(img.mode, 1)
+
+    def handle_opened(self) -> None:
+        with self._lock:
+            self.open_handles += 1
+            self.peak_open_handles = max(self.peak_open_handles, self.open_handles)
+
+    def handle_closed(self) -> None:
+        with self._lock:
+            self.open_handles -= 1
+
+    def track(self, img: Image.Image) -> Image.Image:
+        """
+        Registra 'img' como buffer de píxeles vivo y la retorna sin cambios.
+        Registrar dos veces el mismo objeto no suma dos veces.
+        """
+        with self._lock:
+            if id(img) not in self._live:
+                size = self.pixel_bytes(img)
+                self._live[id(img)] = size
+                self.live_pixel_bytes += size
+                self.peak_pixel_bytes = max(self.peak_pixel_bytes, self.live_pixel_bytes)
+        return img
+
+    def release(self, *images: Image.Image) -> None:
+        """
+        Cierra las imágenes indicadas y descuenta sus píxeles de la memoria viva.
+        Es seguro liberar varias veces el mismo objeto.
+        """
+        for img in images:
+            if img is None:
+                continue
+            with self._lock:
+                size = self._live.pop(id(img), 0)
+                self.live_pixel_bytes -= size
+            img.close()
+
+    def report(self) -> str:
+        """
+        Retorna un resumen legible de los máximos alcanzados.
+        """
+        return (
+            f"📊 Máximo de archivos abiertos: {self.peak_open_handles} | "
+            f"máximo de píxeles vivos: {self.peak_pixel_bytes / (1024 * 1024):.1f} MiB | "
+            f"píxeles vivos al terminar: {self.live_pixel_bytes} bytes"
+        )
+
 ###############################################################################
 # RESPONSABILIDAD: Manejo de carga/guardado de imágenes
 ###############################################################################
@@ -111,14 +522,57 @@ class ImageIOManager:
     """
 
     @staticmethod
-    def load_image(path: str) -> Image.Image:
+    def read_bytes(path: str, tracker: ResourceTracker | None = None) -> bytes:
         """
-        Carga una imagen desde 'path' y la retorna como objeto PIL.Image.
-        Lanza excepción si no puede cargar la imagen.
+        Lee el contenido completo de 'path' y cierra el archivo de inmediato.
+        Lanza excepción si el archivo no existe.
         """
         if not path or not os.path.exists(path):
             raise FileNotFoundError(f"No se encontró el archivo: {path}")
-        return Image.open(path)
+        if tracker:
+            tracker.handle_opened()
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        finally:
+            if tracker:
+                tracker.handle_closed()
+
+    @staticmethod
+    def load_image(path: str, tracker: ResourceTracker | None = None) -> Image.Image:
+        """
+        Carga una imagen desde 'path' y la retorna como objeto PIL.Image.
+        El archivo se lee completo y se cierra antes de retornar, por lo que
+        la imagen no retiene ningún descriptor abierto.
+        Lanza excepción si no puede cargar la imagen.
+        """
+        return ImageIOManager.decode_bytes(ImageIOManager.read_bytes(path, tracker), tracker)
+
+    @staticmethod
+    def decode_bytes(data: bytes, tracker: ResourceTracker | None = None) -> Image.Image:
+        """
+        Decodifica una imagen ya leída en memoria (p.e. por la etapa de lectura
+        del pipeline) y la retorna completamente cargada.
+        """
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return tracker.track(img) if tracker else img
+
+    @staticmethod
+    @contextmanager
+    def open_image(path: str, tracker: ResourceTracker | None = None) -> Iterator[Image.Image]:
+        """
+        Versión con administrador de contexto de 'load_image': al salir del
+        bloque 'with' la imagen se cierra y sus píxeles se liberan.
+        """
+        img = ImageIOManager.load_image(path, tracker)
+        try:
+            yield img
+        finally:
+            if tracker:
+                tracker.release(img)
+            else:
+                img.close()
 
     @staticmethod
     def save_image(img: Image.Image, path: str, img_format: str, **kwargs) -> None:
@@ -134,12 +588,481 @@ class ImageIOManager:
 
         img.save(path, format=img_format, **kwargs)
 
+    @staticmethod
+    def encode_image(img: Image.Image, img_format: str, **kwargs) -> bytes:
+        """
+        Codifica 'img' en memoria con 'img_format' y retorna los bytes, sin tocar
+        el disco. La escritura queda a cargo de 'write_batch'. Con
+        DETERMINISTIC_OUTPUT se fijan los parámetros del codificador y se
+        quitan los metadatos (MetadataStripper).
+        """
+        if not img:
+            raise ValueError("No se puede codificar una imagen nula.")
+        if DETERMINISTIC_OUTPUT:
+            kwargs = {**OUTPUT_ENCODER_OPTIONS.get(img_format, {}), **kwargs}
+        buffer = io.BytesIO()
+        img.save(buffer, format=img_format, **kwargs)
+        if DETERMINISTIC_OUTPUT:
+            return MetadataStripper.strip(buffer.getvalue(), img_format)
+        return buffer.getvalue()
+
+    @staticmethod
+    def write_batch(
+        outputs: list[tuple[str, bytes | None]],
+        fsync: bool = True,
+        tracker: ResourceTracker | None = None,
+    ) -> None:
+        """
+        Escribe un lote de (ruta, bytes). Cada archivo se escribe en un temporal
+        y se renombra al final, de modo que nunca queda un archivo a medias.
+        Con 'fsync' se sincroniza cada archivo y, una sola vez por lote, cada
+        directorio afectado. Un par (ruta, None) elimina la ruta si existe.
+        """
+        directories = set()
+        for path, data in outputs:
+            if not path:
+                raise ValueError("Ruta de destino no válida.")
+            if data is None:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    continue
+                directories.add(os.path.dirname(os.path.abspath(path)))
+                continue
+            tmp_path = f"{path}.tmp"
+            if tracker:
+                tracker.handle_opened()
+            try:
+                with open(tmp_path, "wb") as fh:
+                    fh.write(data)
+                    if fsync:
+                        fh.flush()
+                        os.fsync(fh.fileno())
+            finally:
+                if tracker:
+                    tracker.handle_closed()
+            os.replace(tmp_path, path)
+            directories.add(os.path.dirname(os.path.abspath(path)))
+
+        if fsync and hasattr(os, "O_DIRECTORY"):
+            for directory in directories:
+                dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+
+###############################################################################
+# RESPONSABILIDAD: Caché persistente de orígenes ya decodificados (mmap)
+###############################################################################
+class DecodedSourceCache:
+    """
+    Caché en disco de orígenes decodificados y normalizados a RGBA, con clave
+    el hash de sus bytes (más el frame elegido y la gestión de color). Cada
+    entrada es el buffer crudo de píxeles seguido de un pie de 16 bytes; al
+    leerla se mapea con mmap y se envuelve con 'Image.frombuffer', sin copiar
+    ni decodificar, y los procesos que mapean la misma entrada comparten el
+    page cache. Si se supera 'max_bytes' se borran las menos usadas.
+    """
+
+    MAGIC: bytes = b"ICO4X4\x01\x00"   # formato y versión del pie
+    FOOTER_SIZE: int = 16
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = DECODED_CACHE_MAX_MB * 1024 * 1024,
+        min_pixels: int = DECODED_CACHE_MIN_PIXELS,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.min_pixels = min_pixels
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(data: bytes, frame_selection: str | int) -> str:
+        """
+        Clave de la entrada: cambia si cambian los bytes del origen o algo
+        que altere los píxeles decodificados.
+        """
+        variant = f"{hashlib.sha256(data).hexdigest()}|{frame_selection}|{COLOR_MANAGEMENT}|{COLOR_RENDERING_INTENT}"
+        return hashlib.sha256(variant.encode("utf-8")).hexdigest()[:40]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.rgba")
+
+    def load(self, key: str) -> Image.Image | None:
+        """
+        Image RGBA de sólo lectura apoyada sobre el mapeo de la entrada, o None
+        si no está. El mapeo se libera al cerrar (o descartar) la imagen.
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        footer = mapped[-self.FOOTER_SIZE:]
+        width = int.from_bytes(footer[8:12], "little")
+        height = int.from_bytes(footer[12:16], "little")
+        if footer[:8] != self.MAGIC or width * height * 4 + self.FOOTER_SIZE != len(mapped):
+            mapped.close()
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.hits += 1
+        return Image.frombuffer("RGBA", (width, height), mapped, "raw", "RGBA", 0, 1)
+
+    def store(self, key: str, img: Image.Image) -> None:
+        """
+        Guarda los píxeles de 'img' (RGBA). Los orígenes chicos no se guardan:
+        decodificarlos cuesta menos que leer la entrada. Un error de disco no
+        interrumpe la corrida: la caché es opcional.
+        """
+        if img.mode != "RGBA" or img.width * img.height < self.min_pixels:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        footer = self.MAGIC + img.width.to_bytes(4, "little") + img.height.to_bytes(4, "little")
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "wb") as fh:
+                fh.write(img.tobytes())
+                fh.write(footer)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar en la caché de decodificados: {e}")
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        """
+        Borra las entradas usadas hace más tiempo hasta volver a 'max_bytes'.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".rgba"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+###############################################################################
+# RESPONSABILIDAD: Gestión de color (perfiles ICC -> sRGB) con caché LRU
+###############################################################################
+class IccTransformCache:
+    """
+    LRU seguro entre hilos para perfiles ICC ya interpretados y
+    transformaciones ya construidas. Construir una transformación cuesta
+    mucho más que aplicarla; con la caché, miles de assets que comparten
+    unos pocos perfiles pagan ese costo una sola vez por proceso.
+    """
+
+    def __init__(self, max_size: int = ICC_TRANSFORM_CACHE_SIZE):
+        self.max_size = max(1, max_size)
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, build: Callable[[], object]) -> object:
+        """
+        Retorna el valor de 'key' o lo construye con 'build' y lo guarda,
+        descartando el usado hace más tiempo si se supera 'max_size'.
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        # Se construye fuera del lock: dos hilos pueden construirlo a la vez,
+        # pero ninguno bloquea a los que usan otras claves
+        value = build()
+        with self._lock:
+            self.misses += 1
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+
+class ColorManager:
+    """
+    Convierte a sRGB las imágenes con un perfil ICC embebido (CMYK,
+    Display P3, Adobe RGB, grises...), en lugar de reinterpretar sus valores
+    como si ya fueran sRGB. Las transformaciones se cachean por
+    (hash del perfil, modo, intent). Sin perfil, con un perfil sRGB, sin
+    ImageCms o con un perfil ilegible retorna None y se usa 'convert' común.
+    """
+
+    cache = IccTransformCache()
+    # Modo de Pillow con el que se leen los datos de cada espacio de color ICC
+    SPACE_MODES: dict[str, str] = {"RGB ": "RGB", "CMYK": "CMYK", "GRAY": "L"}
+    INTENTS: dict[str, int] = {
+        "perceptual": 0, "relative": 1, "saturation": 2, "absolute": 3,
+    }
+
+    @staticmethod
+    def _image_cms():
+        """
+        Retorna ImageCms si Pillow se compiló con LittleCMS; es opcional.
+        """
+        try:
+            from PIL import ImageCms
+        except ImportError:
+            return None
+        return ImageCms
+
+    @classmethod
+    def _profile(cls, image_cms, icc: bytes, icc_hash: str):
+        """
+        (perfil, modo de lectura) o None si el perfil es sRGB o no sirve.
+        """
+        def build():
+            try:
+                profile = image_cms.ImageCmsProfile(io.BytesIO(icc))
+            except (image_cms.PyCMSError, OSError, ValueError):
+                return None
+            mode = cls.SPACE_MODES.get(profile.profile.xcolor_space)
+            description = profile.profile.profile_description or ""
+            if mode is None or (mode == "RGB" and "sRGB" in description):
+                return None
+            return profile, mode
+
+        return cls.cache.get((icc_hash, "profile"), build)
+
+    @classmethod
+    def is_srgb(cls, icc: bytes) -> bool:
+        """
+        True si 'icc' es un perfil sRGB (redundante: sin perfil se asume sRGB).
+        Sin ImageCms o con un perfil ilegible retorna False.
+        """
+        image_cms = cls._image_cms()
+        if image_cms is None:
+            return False
+        try:
+            profile = image_cms.ImageCmsProfile(io.BytesIO(icc))
+        except (image_cms.PyCMSError, OSError, ValueError):
+            return False
+        return profile.profile.xcolor_space == "RGB " and "sRGB" in (profile.profile.profile_description or "")
+
+    @classmethod
+    def to_srgb(cls, img: Image.Image, out_mode: str) -> Image.Image | None:
+        """
+        Retorna 'img' convertida a sRGB en 'out_mode' ("RGB" o "RGBA",
+        conservando el alpha) o None si no hace falta gestión de color.
+        """
+        icc = img.info.get("icc_profile")
+        image_cms = cls._image_cms() if COLOR_MANAGEMENT and icc else None
+        if image_cms is None:
+            return None
+        icc_hash = hashlib.sha256(icc).hexdigest()
+        source = cls._profile(image_cms, icc, icc_hash)
+        if source is None:
+            return None
+        profile, mode = source
+        intent = cls.INTENTS.get(COLOR_RENDERING_INTENT, 0)
+        transform = cls.cache.get(
+            (icc_hash, mode, intent),
+            lambda: image_cms.buildTransform(
+                profile, image_cms.createProfile("sRGB"), mode, "RGB",
+                renderingIntent=intent, flags=image_cms.Flags.NOCACHE,
+            ),
+        )
+
+        # La paleta se expande una sola vez (y con ella su transparencia)
+        working = img.convert("RGBA") if img.mode in ("P", "PA") else img
+        alpha = working.getchannel("A") if out_mode == "RGBA" and "A" in working.getbands() else None
+        source_img = working.convert(mode) if working.mode != mode else working
+        try:
+            result = image_cms.applyTransform(source_img, transform)
+        finally:
+            for temp in {id(working): working, id(source_img): source_img}.values():
+                if temp is not img:
+                    temp.close()
+        if out_mode == "RGBA":
+            result.putalpha(alpha if alpha is not None else 255)
+            if alpha is not None:
+                alpha.close()
+        return result
+
+###############################################################################
+# RESPONSABILIDAD: Quitar metadatos de las salidas (bytes reproducibles)
+###############################################################################
+class MetadataStripper:
+    """
+    Reescribe el contenedor de una salida ya codificada (sin tocar los
+    píxeles) dejando sólo lo que hace falta para mostrarla: quita EXIF, XMP,
+    comentarios, textos, fechas y demás metadatos del origen. Los perfiles
+    ICC se conservan sólo si no son sRGB (sin perfil ya se asume sRGB).
+    Si el contenedor no se puede interpretar, se retorna tal cual.
+    """
+
+    PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+    # Segmentos JPEG que se conservan: APP0 (JFIF), APP2 (ICC) y APP14 (Adobe,
+    # necesario para decodificar bien CMYK/YCCK); el resto de APPn y COM se quitan
+    JPEG_KEEP_APP: tuple[int, ...] = (0xE0, 0xE2, 0xEE)
+    # Bits del encabezado VP8X de WebP
+    WEBP_FLAGS: dict[bytes, int] = {b"ICCP": 0x20, b"EXIF": 0x08, b"XMP ": 0x04}
+
+    @staticmethod
+    def strip(data: bytes, img_format: str | None) -> bytes:
+        strippers = {
+            "PNG": MetadataStripper._strip_png,
+            "JPEG": MetadataStripper._strip_jpeg,
+            "WEBP": MetadataStripper._strip_webp,
+            "ICO": MetadataStripper._strip_ico,
+        }
+        stripper = strippers.get(img_format or "")
+        if not stripper or not data:
+            return data
+        try:
+            return stripper(data)
+        except (IndexError, ValueError, zlib.error):
+            return data
+
+    @staticmethod
+    def _keep_icc(icc: bytes) -> bool:
+        return METADATA_KEEP_ICC and not ColorManager.is_srgb(icc)
+
+    @staticmethod
+    def drops_color_profile(icc: bytes | None) -> bool:
+        """
+        True si 'strip' quitaría el perfil 'icc' y no es sRGB: sin él, los
+        colores se interpretarían como sRGB y cambiarían.
+        """
+        return bool(icc) and not METADATA_KEEP_ICC and not ColorManager.is_srgb(icc)
+
+    @staticmethod
+    def _strip_png(data: bytes) -> bytes:
+        if not data.startswith(MetadataStripper.PNG_SIGNATURE):
+            raise ValueError("no es un PNG")
+        out = [MetadataStripper.PNG_SIGNATURE]
+        pos = len(MetadataStripper.PNG_SIGNATURE)
+        while pos < len(data):
+            length = int.from_bytes(data[pos:pos + 4], "big")
+            chunk_type = data[pos + 4:pos + 8]
+            end = pos + 12 + length
+            if end > len(data):
+                raise ValueError("chunk truncado")
+            name = chunk_type.decode("latin-1")
+            keep = chunk_type[0:1].isupper() or name in METADATA_KEEP_PNG_CHUNKS
+            if keep and name == "iCCP":
+                body = data[pos + 8:pos + 8 + length]
+                keep = MetadataStripper._keep_icc(zlib.decompress(body[body.index(b"\0") + 2:]))
+            if keep:
+                out.append(data[pos:end])
+            pos = end
+            if chunk_type == b"IEND":
+                break
+        return b"".join(out)
+
+    @staticmethod
+    def _strip_jpeg(data: bytes) -> bytes:
+        if data[:2] != b"\xff\xd8":
+            raise ValueError("no es un JPEG")
+        segments = []
+        icc = []
+        pos = 2
+        while True:
+            if data[pos] != 0xFF:
+                raise ValueError("marcador JPEG inválido")
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0xDA:
+                # Desde el inicio del scan (SOS) se copia todo tal cual
+                tail = data[pos:]
+                break
+            length = int.from_bytes(data[pos + 2:pos + 4], "big")
+            segment = data[pos:pos + 2 + length]
+            pos += 2 + length
+            if marker == 0xE2 and segment[4:16] == b"ICC_PROFILE\0":
+                icc.append(segment)
+                segments.append(("icc", segment))
+            elif marker == 0xFE or (0xE0 <= marker <= 0xEF and marker not in MetadataStripper.JPEG_KEEP_APP):
+                continue
+            else:
+                segments.append(("keep", segment))
+        keep_icc = bool(icc) and MetadataStripper._keep_icc(b"".join(segment[18:] for segment in icc))
+        body = b"".join(segment for kind, segment in segments if kind == "keep" or keep_icc)
+        return b"\xff\xd8" + body + tail
+
+    @staticmethod
+    def _strip_webp(data: bytes) -> bytes:
+        if data[:4] != b"RIFF" or data[8:12] != b"WEBP":
+            raise ValueError("no es un WebP")
+        chunks = []
+        pos = 12
+        while pos + 8 <= len(data):
+            fourcc = data[pos:pos + 4]
+            size = int.from_bytes(data[pos + 4:pos + 8], "little")
+            end = pos + 8 + size + (size & 1)
+            chunks.append((fourcc, data[pos:end]))
+            pos = end
+        if not chunks or chunks[0][0] != b"VP8X":
+            return data
+        flags = chunks[0][1][8]
+        kept = []
+        for fourcc, chunk in chunks[1:]:
+            payload = chunk[8:8 + int.from_bytes(chunk[4:8], "little")]
+            if fourcc in (b"EXIF", b"XMP ") or (fourcc == b"ICCP" and not MetadataStripper._keep_icc(payload)):
+                flags &= ~MetadataStripper.WEBP_FLAGS[fourcc]
+            else:
+                kept.append(chunk)
+        vp8x = chunks[0][1]
+        body = b"WEBP" + vp8x[:8] + bytes([flags]) + vp8x[9:] + b"".join(kept)
+        return b"RIFF" + len(body).to_bytes(4, "little") + body
+
+    @staticmethod
+    def _strip_ico(data: bytes) -> bytes:
+        """
+        Limpia los PNG embebidos en el .ico y recalcula los offsets.
+        """
+        count = int.from_bytes(data[4:6], "little")
+        entries, images = [], []
+        for index in range(count):
+            entry = data[6 + 16 * index:6 + 16 * (index + 1)]
+            size = int.from_bytes(entry[8:12], "little")
+            offset = int.from_bytes(entry[12:16], "little")
+            image = data[offset:offset + size]
+            if len(image) != size:
+                raise ValueError("entrada del .ico truncada")
+            if image.startswith(MetadataStripper.PNG_SIGNATURE):
+                image = MetadataStripper._strip_png(image)
+            entries.append(entry[:8])
+            images.append(image)
+        offset = 6 + 16 * count
+        directory = []
+        for entry, image in zip(entries, images):
+            directory.append(entry + len(image).to_bytes(4, "little") + offset.to_bytes(4, "little"))
+            offset += len(image)
+        return data[:6] + b"".join(directory) + b"".join(images)
+
 ###############################################################################
 # RESPONSABILIDAD: Conversión de modo para mantener/corregir alpha
 ###############################################################################
 class ImageModeConverter:
     """
     Clase para manejar la conversión de modo de color.
+    Si la imagen trae un perfil ICC que no es sRGB, la conversión pasa por
+    ColorManager para que los colores no cambien.
     """
 
     @staticmethod
@@ -148,6 +1071,9 @@ class ImageModeConverter:
         Convierte la imagen a RGBA si no lo está ya, para
         mantener transparencia en formatos que la soportan.
         """
+        managed = ColorManager.to_srgb(img, "RGBA")
+        if managed is not None:
+            return managed
         if img.mode != "RGBA":
             return img.convert("RGBA")
         return img
@@ -158,6 +1084,9 @@ class ImageModeConverter:
         Convierte la imagen a RGB. Útil para formatos como JPEG
         que no soportan transparencia.
         """
+        managed = ColorManager.to_srgb(img, "RGB")
+        if managed is not None:
+            return managed
         if img.mode != "RGB":
             return img.convert("RGB")
         return img
@@ -167,236 +1096,4522 @@ class ImageModeConverter:
 ###############################################################################
 class ImageResizer:
     """
-    Clase encargada de redimensionar una imagen a un tamaño dado.
+    Clase encargada de redimensionar una imagen a un tamaño dado, eligiendo
+    la estrategia según la escala:
+      - Reducciones grandes: 'reduce' entero (promedio por bloques, muy
+        barato) hasta quedar a RESIZE_REDUCING_GAP veces el destino, y una
+        pasada final LANCZOS sobre esa imagen chica.
+      - Reducciones chicas y ampliaciones: una sola pasada LANCZOS.
+    Las imágenes con alpha se premultiplican una vez para toda la cadena;
+    'premultiply' permite además reutilizar esa copia entre varios tamaños.
     """
 
+    # modo con alpha -> modo premultiplicado equivalente
+    PREMULTIPLIED: dict[str, str] = {"RGBA": "RGBa", "LA": "La"}
+
+    @staticmethod
+    def premultiply(img: Image.Image) -> Image.Image:
+        """
+        Copia premultiplicada de 'img' (o 'img' misma si no tiene alpha),
+        lista para pasar a 'resize' varias veces sin repetir la conversión.
+        """
+        mode = ImageResizer.PREMULTIPLIED.get(img.mode)
+        return img.convert(mode) if mode else img
+
+    @staticmethod
+    def resize(img: Image.Image, size: tuple[int, int], reducing_gap: float | None = RESIZE_REDUCING_GAP) -> Image.Image:
+        """
+        Redimensiona 'img' a 'size' (w, h) y retorna la nueva imagen. Acepta
+        una imagen ya premultiplicada (RGBa/La); el resultado vuelve a RGBA/LA.
+        Con 'reducing_gap' None se hace una única pasada LANCZOS.
+        """
+        straight = {v: k for k, v in ImageResizer.PREMULTIPLIED.items()}
+        if img.mode not in ImageResizer.PREMULTIPLIED and img.mode not in straight and img.mode not in ("RGB", "L"):
+            return img.resize(size, Image.LANCZOS)
+
+        source = ImageResizer.premultiply(img)
+        factors = (1, 1)
+        if reducing_gap:
+            factors = tuple(max(1, int(src / dst / reducing_gap)) for src, dst in zip(source.size, size))
+        reduced = source.reduce(factors) if max(factors) > 1 else source
+        result = reduced.resize(size, Image.LANCZOS)
+        for intermediate in (source, reduced):
+            if intermediate is not img and intermediate is not result:
+                intermediate.close()
+        if result.mode in straight:
+            premultiplied = result
+            result = premultiplied.convert(straight[premultiplied.mode])
+            premultiplied.close()
+        return result
+
+    @staticmethod
+    def chain_sources(
+        source_size: tuple[int, int], sizes: list[tuple[int, int]], min_ratio: float = RESIZE_CHAIN_MIN_RATIO
+    ) -> dict[tuple[int, int], tuple[int, int] | None]:
+        """
+        Para cada tamaño de 'sizes', el tamaño ya calculado más chico desde el
+        que se puede derivar (al menos 'min_ratio' veces más grande y con la
+        misma proporción), o None si conviene partir del original.
+        """
+        parents: dict[tuple[int, int], tuple[int, int] | None] = {}
+        for size in sorted(sizes, key=lambda s: s[0] * s[1], reverse=True):
+            candidates = [
+                done for done in parents
+                if done[0] >= size[0] * min_ratio and done[1] >= size[1] * min_ratio
+                and abs(done[0] * size[1] - done[1] * size[0]) <= max(done)
+                and done[0] < source_size[0]
+            ]
+            parents[size] = min(candidates, key=lambda s: s[0] * s[1]) if candidates else None
+        return parents
+
     @staticmethod
-    def resize(img: Image.Image, size: tuple[int, int]) -> Image.Image:
+    def fit_size(size: tuple[int, int], box: tuple[int, int]) -> tuple[int, int]:
         """
-        Redimensiona 'img' a 'size' (w, h) usando LANCZOS y retorna la nueva imagen.
+        Tamaño que ocupa 'size' escalado para entrar en 'box' sin deformarse.
         """
-        return img.resize(size, Image.LANCZOS)
+        scale = min(box[0] / size[0], box[1] / size[1])
+        return (max(1, round(size[0] * scale)), max(1, round(size[1] * scale)))
 
 ###############################################################################
-# RESPONSABILIDAD: Convertir todos los archivos .webp a .ico
+# RESPONSABILIDAD: Recorrer animaciones frame a frame (sin tenerlas en memoria)
 ###############################################################################
-class WebpToIcoConverter:
+class AnimationFrames:
     """
-    Convierte todos los .webp encontrados en el directorio en .ico,
-    siempre reemplazando si ya existía el archivo .ico.
+    Utilidades para imágenes animadas (WebP, APNG, GIF). Los frames se
+    recorren con 'seek', así que en cada momento hay un solo frame decodificado.
     """
 
-    def __init__(self, script_dir: str, ico_size: int = 64):
-        self.script_dir = script_dir
-        self.ico_size = ico_size
+    # Lado del thumbnail en gris usado para medir cambios entre frames
+    _CHANGE_PROBE_SIZE: tuple[int, int] = (64, 64)
 
-    async def convert_all_webp_to_ico(self) -> None:
+    @staticmethod
+    def frame_count(img: Image.Image) -> int:
+        return getattr(img, "n_frames", 1)
+
+    @staticmethod
+    def iter_frames(img: Image.Image) -> Iterator[tuple[int, Image.Image]]:
         """
-        Busca todos los .webp en el directorio y los convierte a .ico
-        con el mismo nombre base, siempre sobrescribiendo el .ico.
+        Recorre los frames de 'img' retornando (índice, img). El objeto es
+        siempre el mismo: cada frame sólo es válido hasta el siguiente.
         """
-        webp_files = [
-            f for f in os.listdir(self.script_dir) if f.lower().endswith(".webp")
-        ]
-        if not webp_files:
-            print("No se encontraron archivos .webp en el directorio.")
-            return
-
-        tasks = [self._convert_single_webp(file_name) for file_name in webp_files]
-        await asyncio.gather(*tasks)
+        for index in range(AnimationFrames.frame_count(img)):
+            img.seek(index)
+            yield index, img
 
-    async def _convert_single_webp(self, file_name: str) -> None:
+    @staticmethod
+    def select_index(img: Image.Image, selection: str | int) -> int:
         """
-        Lógica interna para convertir un archivo .webp en .ico,
-        redimensionado a self.ico_size, conservando transparencia.
+        Elige el frame representativo según 'selection':
+          - "first": el primer frame.
+          - "largest-change": el frame que más difiere del anterior.
+          - un entero: ese índice (los negativos cuentan desde el final).
         """
-        base_name, _ = os.path.splitext(file_name)
-        source_path = os.path.join(self.script_dir, file_name)
-        ico_path = os.path.join(self.script_dir, f"{base_name}.ico")
+        count = AnimationFrames.frame_count(img)
+        if count == 1 or selection == "first":
+            return 0
+        if isinstance(selection, int):
+            if not -count <= selection < count:
+                raise IndexError(f"La animación tiene {count} frames; no existe el frame {selection}.")
+            return selection % count
+        if selection != "largest-change":
+            raise ValueError(f"Selección de frame no válida: {selection!r}")
 
+        best_index, best_score = 0, -1.0
+        previous = None
         try:
-            img = ImageIOManager.load_image(source_path)
-            # Convertir a RGBA para mantener alpha si existe
-            img_rgba = ImageModeConverter.ensure_rgba(img)
+            for index, frame in AnimationFrames.iter_frames(img):
+                probe = frame.convert("L").resize(AnimationFrames._CHANGE_PROBE_SIZE, Image.BILINEAR)
+                if previous is not None:
+                    score = sum(ImageStat.Stat(ImageChops.difference(previous, probe)).sum)
+                    if score > best_score:
+                        best_index, best_score = index, score
+                    previous.close()
+                previous = probe
+        finally:
+            if previous is not None:
+                previous.close()
+        return best_index
 
-            # Redimensionar (por defecto a 64x64, salvo que se cambie la constante)
-            resized = ImageResizer.resize(img_rgba, (self.ico_size, self.ico_size))
+    @staticmethod
+    def seek_representative(img: Image.Image, selection: str | int) -> Image.Image:
+        """
+        Deja 'img' posicionada en el frame representativo y la retorna.
+        """
+        if AnimationFrames.frame_count(img) > 1:
+            img.seek(AnimationFrames.select_index(img, selection))
+        return img
 
-            # Guardar .ico (un solo tamaño)
-            ImageIOManager.save_image(resized, ico_path, "ICO", sizes=[(self.ico_size, self.ico_size)])
-            print(f"✅ Generado (reemplazado si existía): {base_name}.ico")
-        except Exception as e:
-            print(f"❌ Error convirtiendo '{file_name}' a .ico: {e}")
 
-###############################################################################
-# RESPONSABILIDAD: Generar íconos y previsualizaciones desde 'logo.png'
-###############################################################################
-class LogoAssetsGenerator:
+class FrameSpool:
     """
-    Genera:
-      - favicon-16x16.png (16x16)
-      - favicon-32x32.png (32x32)
-      - apple-touch-icon.png (180x180)
-      - favicon.ico con múltiples tamaños (16,32,48,64)
-      - preview.png  (mismo tamaño, manteniendo transparencia)
-      - preview.jpg  (mismo tamaño, sin transparencia, JPG no soporta alpha)
-      - preview.webp (mismo tamaño, manteniendo transparencia)
-    Siempre sobrescribe si el archivo ya existe.
+    Acumula frames ya reducidos (mismo modo y tamaño) en un TIFF temporal sin
+    comprimir, en disco y no en el heap. Al codificar se abre como una imagen
+    de varios frames que Pillow carga de a uno en cada seek, así que un
+    codificador que recorre los frames (el de WebP) nunca tiene más de uno
+    decodificado. No sirve para codificadores que copian todos los frames
+    (el de APNG de Pillow): para eso está ApngWriter.
     """
 
-    def __init__(self, script_dir: str, logo_filename: str = "logo.png"):
-        self.script_dir = script_dir
-        self.logo_filename = logo_filename
-        self.logo_path = os.path.join(script_dir, logo_filename)
+    def __init__(self, mode: str, size: tuple[int, int]):
+        self.mode = mode
+        self.size = size
+        self.durations: list[int] = []
+        self._file = tempfile.TemporaryFile(prefix="ico4x4-frames-")
+        self._writer = TiffImagePlugin.AppendingTiffWriter(self._file, new=True)
 
-    async def generate_all_assets(self) -> None:
+    def append(self, img: Image.Image, duration: int) -> None:
         """
-        Genera todos los archivos de íconos y previews, siempre reemplazando.
+        Agrega 'img' (que debe tener el modo y tamaño del spool) al final.
         """
-        if not os.path.exists(self.logo_path):
-            print(f"❌ No se encontró '{self.logo_filename}' en el directorio.")
-            return
-
-        try:
-            img = ImageIOManager.load_image(self.logo_path)
-        except Exception as e:
-            print(f"❌ Error abriendo '{self.logo_filename}': {e}")
-            return
+        if img.mode != self.mode or img.size != self.size:
+            raise ValueError("Todos los frames del spool deben tener el mismo modo y tamaño.")
+        img.save(self._writer, format="TIFF")
+        self._writer.newFrame()
+        self.durations.append(duration)
 
-        # Disparamos las subtareas en paralelo
-        tasks = [
-            self._generate_png_icons(img),
-            self._generate_favicon_ico(img),
-            self._generate_preview_images(img),
-        ]
-        await asyncio.gather(*tasks)
+    def __len__(self) -> int:
+        return len(self.durations)
 
-    async def _generate_png_icons(self, base_img: Image.Image) -> None:
+    @contextmanager
+    def open(self) -> Iterator[Image.Image]:
         """
-        Genera:
-            - favicon-16x16.png
-            - favicon-32x32.png
-            - apple-touch-icon.png (180x180)
-        Manteniendo transparencia en PNG si existe.
-        """
-        icon_targets = [
-            (FAVICON_16, FAVICON_16_SIZE),
-            (FAVICON_32, FAVICON_32_SIZE),
-            (APPLE_TOUCH_ICON, APPLE_TOUCH_ICON_SIZE),
-        ]
+        Expone los frames acumulados como una sola imagen de varios frames.
+        """
+        self._file.seek(0)
+        with Image.open(self._file) as img:
+            yield img
 
-        for filename, (w, h) in icon_targets:
-            out_path = os.path.join(self.script_dir, filename)
-            try:
-                # Asegurar modo RGBA para preservar transparencia
-                img_rgba = ImageModeConverter.ensure_rgba(base_img)
-                resized = ImageResizer.resize(img_rgba, (w, h))
-                ImageIOManager.save_image(resized, out_path, "PNG", quality=95)
-                print(f"✅ Generado (reemplazado si existía): {filename} ({w}x{h})")
-            except Exception as e:
-                print(f"❌ Error generando '{filename}': {e}")
+    def close(self) -> None:
+        self._file.close()
 
-    async def _generate_favicon_ico(self, base_img: Image.Image) -> None:
-        """
-        Genera el archivo .ico (favicon.ico) con múltiples tamaños (FAVICON_ICO_SIZES).
-        Mantiene transparencia si la hubiera.
-        """
-        ico_path = os.path.join(self.script_dir, FAVICON_ICO)
-        try:
-            img_rgba = ImageModeConverter.ensure_rgba(base_img)
-            icon_list = []
-            for size in FAVICON_ICO_SIZES:
-                resized = ImageResizer.resize(img_rgba, (size, size))
-                icon_list.append(resized)
 
-            ImageIOManager.save_image(
-                icon_list[0],
-                ico_path,
-                "ICO",
-                sizes=[(s, s) for s in FAVICON_ICO_SIZES],
-            )
-            print(f"✅ Generado (reemplazado si existía): {FAVICON_ICO}")
-        except Exception as e:
-            print(f"❌ Error generando '{FAVICON_ICO}': {e}")
+class ApngWriter:
+    """
+    Arma un APNG de a un frame: cada frame se comprime como PNG apenas llega
+    y sólo se guardan sus IDAT, así que nunca hay más de un frame decodificado
+    en memoria (el plugin APNG de Pillow copia todos los frames y recién los
+    escribe al final). Los frames van completos, sin recortar, y cada uno
+    reemplaza al anterior (dispose "none", blend "source").
+    """
 
-    async def _generate_preview_images(self, base_img: Image.Image) -> None:
+    def __init__(self, loop: int = 0):
+        self.loop = loop
+        self._ihdr: bytes | None = None
+        self._body = io.BytesIO()
+        self._frames = 0
+        self._sequence = 0
+
+    @staticmethod
+    def _chunk(chunk_type: bytes, body: bytes) -> bytes:
+        return len(body).to_bytes(4, "big") + chunk_type + body + zlib.crc32(chunk_type + body).to_bytes(4, "big")
+
+    @staticmethod
+    def _chunks(data: bytes) -> Iterator[tuple[bytes, bytes]]:
+        pos = len(MetadataStripper.PNG_SIGNATURE)
+        while pos + 8 <= len(data):
+            length = int.from_bytes(data[pos:pos + 4], "big")
+            yield data[pos + 4:pos + 8], data[pos + 8:pos + 8 + length]
+            pos += 12 + length
+
+    def add(self, img: Image.Image, duration: int) -> None:
+        """
+        Comprime 'img' (mismo modo y tamaño que el primer frame) y lo agrega
+        al final con 'duration' milisegundos.
+        """
+        chunks = list(self._chunks(ImageIOManager.encode_image(img, "PNG")))
+        ihdr = b"".join(body for chunk_type, body in chunks if chunk_type == b"IHDR")
+        if self._ihdr is None:
+            self._ihdr = ihdr
+        elif ihdr != self._ihdr:
+            raise ValueError("Todos los frames del APNG deben tener el mismo modo y tamaño.")
+        delay = max(0, min(int(duration), 0xFFFF))
+        control = (
+            self._sequence.to_bytes(4, "big") + img.width.to_bytes(4, "big") + img.height.to_bytes(4, "big")
+            + bytes(8) + delay.to_bytes(2, "big") + (1000).to_bytes(2, "big") + bytes(2)
+        )
+        self._body.write(self._chunk(b"fcTL", control))
+        self._sequence += 1
+        for chunk_type, body in chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if self._frames == 0:
+                self._body.write(self._chunk(b"IDAT", body))
+            else:
+                self._body.write(self._chunk(b"fdAT", self._sequence.to_bytes(4, "big") + body))
+                self._sequence += 1
+        self._frames += 1
+
+    def getvalue(self) -> bytes:
+        """
+        Bytes del APNG completo (acTL se escribe al final, cuando ya se sabe
+        cuántos frames hay).
+        """
+        if self._ihdr is None:
+            raise ValueError("El APNG no tiene frames.")
+        animation = self._frames.to_bytes(4, "big") + self.loop.to_bytes(4, "big")
+        return b"".join((
+            MetadataStripper.PNG_SIGNATURE,
+            self._chunk(b"IHDR", self._ihdr),
+            self._chunk(b"acTL", animation),
+            self._body.getvalue(),
+            self._chunk(b"IEND", b""),
+        ))
+
+###############################################################################
+# RESPONSABILIDAD: Centrar una imagen sobre un lienzo (zona segura, mosaicos)
+###############################################################################
+class IconCanvas:
+    """
+    Clase encargada de componer una imagen centrada sobre un lienzo más grande.
+    """
+
+    @staticmethod
+    def pad(img: Image.Image, canvas_size: tuple[int, int], background: tuple[int, int, int, int]) -> Image.Image:
+        """
+        Retorna un lienzo RGBA de 'canvas_size' relleno con 'background' y con
+        'img' centrada encima, respetando su transparencia.
+        """
+        canvas = Image.new("RGBA", canvas_size, background)
+        offset = ((canvas_size[0] - img.width) // 2, (canvas_size[1] - img.height) // 2)
+        canvas.alpha_composite(ImageModeConverter.ensure_rgba(img), dest=offset)
+        return canvas
+
+###############################################################################
+# RESPONSABILIDAD: Evitar salidas más grandes que su origen
+###############################################################################
+@dataclass(frozen=True)
+class SourceProbe:
+    """
+    Formato, modo, tamaño, cantidad de frames y perfil ICC de un origen,
+    leídos sólo del encabezado.
+    """
+    format: str | None
+    mode: str
+    size: tuple[int, int]
+    frames: int = 1
+    icc_profile: bytes | None = None
+
+
+class OutputSizeGuard:
+    """
+    Para destinos del mismo tamaño que su origen, decide si alcanza con copiar
+    los bytes del origen (sin recodificar) y, cuando hay que recodificar en el
+    mismo formato, se queda con la variante más chica.
+    """
+
+    # Modos que cada formato guarda sin pérdida de información útil; un origen
+    # en otro modo (p.e. PNG de 16 bits) obliga a recodificar.
+    PASSTHROUGH_MODES: dict[str, set[str]] = {
+        "PNG": {"RGBA", "RGB", "LA", "L", "P"},
+        "WEBP": {"RGBA", "RGB"},
+        "JPEG": {"RGB", "L"},
+    }
+
+    @staticmethod
+    def probe(data: bytes) -> SourceProbe:
+        """
+        Lee el encabezado de 'data' sin decodificar los píxeles.
+        """
+        with Image.open(io.BytesIO(data)) as img:
+            return SourceProbe(
+                img.format, img.mode, img.size, AnimationFrames.frame_count(img), img.info.get("icc_profile")
+            )
+
+    @classmethod
+    def can_passthrough(cls, probe: SourceProbe, img_format: str, size: tuple[int, int]) -> bool:
+        """
+        True si el destino es una copia del origen: mismo formato, mismo
+        tamaño, un solo frame y un modo que el formato ya representa tal cual.
+        """
+        return (
+            probe.frames == 1
+            and probe.format == img_format
+            and probe.size == tuple(size)
+            and probe.mode in cls.PASSTHROUGH_MODES.get(img_format, set())
+        )
+
+    @staticmethod
+    def pick_smaller(
+        name: str,
+        source_data: bytes,
+        probe: SourceProbe,
+        encoded: bytes,
+        img_format: str,
+        size: tuple[int, int],
+    ) -> bytes:
+        """
+        Si el origen sirve como salida (mismo formato y tamaño), retorna el más
+        chico entre origen y recodificación. Siempre informa la diferencia.
+        """
+        delta = len(encoded) - len(source_data)
+        percent = 100.0 * delta / len(source_data) if source_data else 0.0
+        same_target = probe.frames == 1 and probe.format == img_format and probe.size == tuple(size)
+        if same_target and delta > 0:
+            print(f"📏 {name}: la recodificación pesa {delta:+,} B ({percent:+.1f}%); se conserva el origen.")
+            return source_data
+        print(f"📏 {name}: {len(encoded):,} B ({delta:+,} B, {percent:+.1f}% respecto del origen).")
+        return encoded
+
+###############################################################################
+# RESPONSABILIDAD: Rasterizar SVG directamente a cada tamaño (con caché)
+###############################################################################
+class SvgRasterizer:
+    """
+    Rasteriza un SVG a un tamaño exacto con el primer rasterizador disponible
+    en la máquina: cairosvg (módulo de Python) o los ejecutables rsvg-convert,
+    inkscape o magick. Ninguno es obligatorio; si no hay ninguno, el modo SVG
+    no está disponible.
+    """
+
+    BACKENDS: tuple[str, ...] = ("cairosvg", "rsvg-convert", "inkscape", "magick")
+
+    @staticmethod
+    def available_backend() -> str | None:
+        """
+        Retorna el nombre del primer rasterizador disponible, o None.
+        """
+        for backend in SvgRasterizer.BACKENDS:
+            if backend == "cairosvg":
+                try:
+                    import cairosvg  # noqa: F401
+                except (ImportError, OSError):
+                    continue
+                return backend
+            if shutil.which(backend):
+                return backend
+        return None
+
+    @staticmethod
+    def render(svg_data: bytes, size: tuple[int, int], backend: str) -> bytes:
+        """
+        Rasteriza 'svg_data' a 'size' (w, h) y retorna los bytes PNG resultantes.
+        """
+        w, h = size
+        if backend == "cairosvg":
+            import cairosvg
+            return cairosvg.svg2png(bytestring=svg_data, output_width=w, output_height=h)
+
+        if backend == "rsvg-convert":
+            cmd = ["rsvg-convert", "--width", str(w), "--height", str(h), "--format", "png"]
+        elif backend == "inkscape":
+            cmd = ["inkscape", "--pipe", "--export-type=png", "--export-filename=-", "-w", str(w), "-h", str(h)]
+        elif backend == "magick":
+            cmd = ["magick", "-background", "none", "svg:-", "-resize", f"{w}x{h}!", "png:-"]
+        else:
+            raise ValueError(f"Rasterizador SVG desconocido: {backend}")
+
+        result = subprocess.run(cmd, input=svg_data, capture_output=True, check=False)
+        if result.returncode != 0 or not result.stdout:
+            detail = result.stderr.decode("utf-8", "replace").strip()
+            raise RuntimeError(f"{backend} falló al rasterizar {w}x{h}: {detail}")
+        return result.stdout
+
+
+class SvgRenderCache:
+    """
+    Caché en disco de los PNG rasterizados, con clave (hash del SVG,
+    rasterizador, tamaño). Un SVG sin cambios no se vuelve a rasterizar.
+    """
+
+    def __init__(self, cache_dir: str, tracker: ResourceTracker | None = None):
+        self.cache_dir = cache_dir
+        self.tracker = tracker
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, svg_hash: str, backend: str, size: tuple[int, int]) -> str:
+        return os.path.join(self.cache_dir, f"{svg_hash[:32]}-{backend}-{size[0]}x{size[1]}.png")
+
+    def render(self, svg_data: bytes, svg_hash: str, size: tuple[int, int], backend: str) -> bytes:
+        """
+        Retorna el PNG de 'size' desde la caché o, si no está, lo rasteriza y lo guarda.
+        """
+        path = self._path(svg_hash, backend, size)
+        if os.path.exists(path):
+            self.hits += 1
+            return ImageIOManager.read_bytes(path, self.tracker)
+
+        self.misses += 1
+        data = SvgRasterizer.render(svg_data, size, backend)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        ImageIOManager.write_batch([(path, data)], fsync=False, tracker=self.tracker)
+        return data
+
+###############################################################################
+# RESPONSABILIDAD: Compartir píxeles decodificados entre procesos sin copias
+###############################################################################
+@dataclass(frozen=True)
+class SharedFrameRef:
+    """
+    Descriptor liviano de un frame publicado con SharedFrame. Es lo único
+    que viaja serializado entre procesos.
+    """
+    path: str
+    mode: str
+    size: tuple[int, int]
+
+
+class SharedFrame:
+    """
+    Publica los píxeles de una imagen en un archivo mapeado en memoria (en
+    /dev/shm si existe). Los workers de otros procesos reconstruyen el Image
+    con 'Image.frombuffer' sobre el mapeo, sin copiar ni serializar el frame.
+    """
+
+    # Modos que Pillow puede mapear sin copia con el decodificador "raw"
+    ZERO_COPY_MODES: tuple[str, ...] = ("L", "P", "RGBA", "RGBX", "CMYK", "I", "F", "I;16")
+
+    def __init__(self, ref: SharedFrameRef):
+        self.ref = ref
+
+    @staticmethod
+    def _shared_dir() -> str:
+        return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+    @classmethod
+    def publish(cls, img: Image.Image) -> "SharedFrame":
+        """
+        Vuelca los píxeles de 'img' al área compartida y retorna el SharedFrame.
+        Quien publica es responsable de llamar a 'unlink' al terminar.
+        """
+        if img.mode not in cls.ZERO_COPY_MODES:
+            raise ValueError(f"El modo {img.mode} no admite mapeo sin copia.")
+        fd, path = tempfile.mkstemp(prefix="ico4x4-frame-", suffix=".raw", dir=cls._shared_dir())
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(img.tobytes())
+        except BaseException:
+            os.unlink(path)
+            raise
+        return cls(SharedFrameRef(path, img.mode, img.size))
+
+    def unlink(self) -> None:
+        """
+        Elimina el área compartida. Los mapeos ya abiertos siguen siendo válidos.
+        """
+        try:
+            os.unlink(self.ref.path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    @contextmanager
+    def attach(source: "Image.Image | SharedFrameRef") -> Iterator[Image.Image]:
+        """
+        Retorna (como administrador de contexto) un Image de sólo lectura apoyado
+        directamente sobre el área compartida. Si 'source' ya es un Image, se
+        retorna tal cual, lo que permite usar el mismo código con hilos.
+        """
+        if isinstance(source, Image.Image):
+            yield source
+            return
+
+        with open(source.path, "rb") as fh:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            img = Image.frombuffer(source.mode, source.size, mapped, "raw", source.mode, 0, 1)
+            try:
+                yield img
+            finally:
+                # Cerrar la imagen suelta la referencia al buffer antes de desmapear
+                img.close()
+        finally:
+            mapped.close()
+
+###############################################################################
+# RESPONSABILIDAD: Generar sidecars precomprimidos (.gz / .br)
+###############################################################################
+class SidecarCompressor:
+    """
+    Genera las variantes .gz y .br de cada salida comprimible, al máximo nivel.
+    Se omiten los formatos ya comprimidos y los sidecars que no ahorran al
+    menos SIDECAR_MIN_SAVING; en ese caso se elimina el sidecar viejo, si lo
+    hubiera, para que el servidor no sirva contenido desactualizado.
+    """
+
+    @staticmethod
+    def _brotli():
+        """
+        Retorna el módulo brotli si está instalado; es opcional.
+        """
+        try:
+            import brotli
+        except ImportError:
+            return None
+        return brotli
+
+    @staticmethod
+    def compress(data: bytes, encoding: str) -> bytes:
+        """
+        Comprime 'data' con 'encoding' ("gz" o "br") al máximo nivel.
+        El .gz no lleva fecha, así que es reproducible.
+        """
+        if encoding == "gz":
+            return gzip.compress(data, compresslevel=9, mtime=0)
+        if encoding == "br":
+            brotli = SidecarCompressor._brotli()
+            if brotli is None:
+                raise RuntimeError("El módulo 'brotli' no está instalado.")
+            return brotli.compress(data, quality=11)
+        raise ValueError(f"Codificación desconocida: {encoding}")
+
+    @staticmethod
+    def expand(
+        outputs: list[tuple[str, bytes]], min_saving: float = SIDECAR_MIN_SAVING
+    ) -> list[tuple[str, bytes | None]]:
+        """
+        Retorna 'outputs' más sus sidecars. Un sidecar que no conviene se
+        retorna como (ruta, None) para que la escritura lo elimine.
+        """
+        encodings = ["gz"] + (["br"] if SidecarCompressor._brotli() else [])
+        expanded: list[tuple[str, bytes | None]] = list(outputs)
+        for path, data in outputs:
+            if data is None or path.lower().endswith(SIDECAR_SKIP_EXTENSIONS):
+                continue
+            for encoding in encodings:
+                compressed = SidecarCompressor.compress(data, encoding)
+                worth_it = len(compressed) <= len(data) * (1.0 - min_saving)
+                expanded.append((f"{path}.{encoding}", compressed if worth_it else None))
+        return expanded
+
+###############################################################################
+# RESPONSABILIDAD: Métricas de las corridas (formato de texto de Prometheus)
+###############################################################################
+class PipelineMetrics:
+    """
+    Registro de contadores, gauges e histogramas de una corrida. Es seguro
+    entre hilos y se exporta en el formato de texto de Prometheus.
+    """
+
+    # nombre -> (tipo, ayuda); fija el orden de salida
+    DEFINITIONS: dict[str, tuple[str, str]] = {
+        "ico4x4_jobs": ("gauge", "Trabajos de la corrida actual"),
+        "ico4x4_jobs_completed_total": ("counter", "Trabajos terminados por estado"),
+        "ico4x4_files_written_total": ("counter", "Archivos escritos"),
+        "ico4x4_bytes_read_total": ("counter", "Bytes de origen leídos"),
+        "ico4x4_bytes_written_total": ("counter", "Bytes escritos"),
+        "ico4x4_stage_seconds": ("histogram", "Latencia por trabajo (o lote) de cada etapa"),
+        "ico4x4_queue_depth": ("gauge", "Elementos esperando en cada cola"),
+        "ico4x4_workers_busy": ("gauge", "Workers de codificación ocupados"),
+        "ico4x4_schedule_wait_seconds": ("histogram", "Espera de un slot de codificación por prioridad"),
+        "ico4x4_worker_utilization": ("gauge", "Fracción del tiempo de los workers de codificación en uso"),
+        "ico4x4_files_per_second": ("gauge", "Archivos escritos por segundo"),
+        "ico4x4_outputs_verified_total": ("counter", "Salidas releídas y verificadas por resultado"),
+        "ico4x4_cache_hits_total": ("counter", "Aciertos de caché"),
+        "ico4x4_cache_misses_total": ("counter", "Fallos de caché"),
+    }
+
+    def __init__(self, buckets: tuple[float, ...] = METRICS_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], list] = {}
+
+    def __getstate__(self) -> dict:
+        # Las métricas viven en el proceso principal: a los workers viaja vacío
+        return {"buckets": self.buckets}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["buckets"])
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple[str, tuple]:
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            # [conteos por bucket..., suma, cantidad]
+            hist = self._histograms.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> str:
+        """
+        Retorna todas las métricas en el formato de texto de Prometheus.
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+            histograms = sorted((k, list(v)) for k, v in self._histograms.items())
+        lines = []
+        for name, (kind, help_text) in self.DEFINITIONS.items():
+            samples = []
+            if kind == "histogram":
+                for (hist_name, labels), hist in histograms:
+                    if hist_name != name:
+                        continue
+                    for bound, count in zip(self.buckets, hist):
+                        le = f'le="{bound}"'
+                        samples.append(f"{name}_bucket{self._labels(labels, le)} {count}")
+                    le = 'le="+Inf"'
+                    samples.append(f"{name}_bucket{self._labels(labels, le)} {hist[-1]}")
+                    samples.append(f"{name}_sum{self._labels(labels)} {hist[-2]:.6f}")
+                    samples.append(f"{name}_count{self._labels(labels)} {hist[-1]}")
+            else:
+                samples = [
+                    f"{name}{self._labels(labels)} {int(value) if float(value).is_integer() else value}"
+                    for (value_name, labels), value in values if value_name == name
+                ]
+            if samples:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", *samples]
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Publica las métricas mientras dura una corrida: en un archivo .prom
+    (reemplazado atómicamente, apto para el textfile collector) y/o en un
+    endpoint HTTP local de sólo lectura.
+    """
+
+    def __init__(
+        self,
+        metrics: PipelineMetrics,
+        prom_file: str | None = METRICS_PROM_FILE,
+        http_port: int | None = METRICS_HTTP_PORT,
+    ):
+        self.metrics = metrics
+        self.prom_path = os.path.join(SCRIPT_DIR, prom_file) if prom_file else None
+        self.http_port = http_port
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self) -> None:
+        if self.http_port is None:
+            return
+        try:
+            self._server = await asyncio.start_server(self._serve, "127.0.0.1", self.http_port)
+            print(f"📡 Métricas en http://127.0.0.1:{self.http_port}/metrics")
+        except OSError as e:
+            print(f"⚠️ No se pudo abrir el endpoint de métricas: {e}")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        HTTP mínimo: cualquier GET recibe el texto de las métricas.
+        """
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if request_line.startswith(b"GET "):
+                body = self.metrics.render().encode("utf-8")
+                head = "HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            else:
+                body = b""
+                head = "HTTP/1.1 405 Method Not Allowed\r\n"
+            writer.write(f"{head}Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def write_file(self) -> None:
+        if not self.prom_path:
+            return
+        os.makedirs(os.path.dirname(self.prom_path), exist_ok=True)
+        data = self.metrics.render().encode("utf-8")
+        await asyncio.to_thread(ImageIOManager.write_batch, [(self.prom_path, data)], False)
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+class ProgressLine:
+    """
+    Línea de progreso compacta (hechos/total, archivos/s, errores, colas, ETA).
+    En una terminal se redibuja en el lugar; si no, se imprime como una línea más.
+    """
+
+    def __init__(self, enabled: bool = METRICS_PROGRESS, stream=None):
+        self.stream = stream or sys.stderr
+        self.enabled = enabled
+        self.live = enabled and self.stream.isatty()
+        self._drawn = False
+
+    @staticmethod
+    def format(metrics: PipelineMetrics, elapsed: float) -> str:
+        total = int(metrics.get("ico4x4_jobs"))
+        ok = int(metrics.get("ico4x4_jobs_completed_total", status="ok"))
+        failed = int(metrics.get("ico4x4_jobs_completed_total", status="failed"))
+        done = ok + failed
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if done and done < total and rate > 0:
+            eta = f"{int((total - done) / rate) // 60:02d}:{int((total - done) / rate) % 60:02d}"
+        else:
+            eta = "--:--"
+        percent = 100 * done // total if total else 100
+        return (
+            f"⏳ {done}/{total} ({percent}%) | {rate:.1f} trabajos/s | {failed} errores | "
+            f"colas {int(metrics.get('ico4x4_queue_depth', queue='read'))}/"
+            f"{int(metrics.get('ico4x4_queue_depth', queue='write'))} | "
+            f"workers {metrics.get('ico4x4_worker_utilization'):.0%} | ETA {eta}"
+        )
+
+    def show(self, line: str) -> None:
+        if not self.enabled:
+            return
+        if self.live:
+            self.stream.write(f"\r{line}\x1b[K")
+            self._drawn = True
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+
+    def clear(self) -> None:
+        """
+        Borra la línea en vivo para que otro mensaje no se mezcle con ella.
+        """
+        if self._drawn:
+            self.stream.write("\r\x1b[K")
+            self.stream.flush()
+            self._drawn = False
+
+    def finish(self, line: str) -> None:
+        self.show(line)
+        if self.live and self._drawn:
+            self.stream.write("\n")
+            self.stream.flush()
+            self._drawn = False
+
+###############################################################################
+# RESPONSABILIDAD: Perfilar cada trabajo (muestreo de pilas o cProfile)
+###############################################################################
+class StackSampler:
+    """
+    Muestrea cada 'interval' segundos la pila del hilo que lo usa y cuenta
+    cuántas veces aparece cada pila, en el formato "collapsed" de
+    flamegraph.pl / speedscope ("raíz;...;hoja" -> muestras).
+    Las funciones en C de Pillow no tienen frame propio: el tiempo se atribuye
+    a la función Python que las llamó (p.e. Image.convert).
+    """
+
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL, root_code=None):
+        self.interval = interval
+        self.root_code = root_code
+
+    @staticmethod
+    def frame_name(code) -> str:
+        return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+    @contextmanager
+    def sample(self) -> Iterator[dict[str, int]]:
+        """
+        Muestrea el hilo actual mientras dura el bloque 'with'. Las pilas se
+        cortan en 'root_code' para no repetir los frames del pipeline.
+        """
+        thread_id = threading.get_ident()
+        stacks: dict[str, int] = {}
+        stop = threading.Event()
+
+        def loop() -> None:
+            while not stop.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                names = []
+                while frame is not None and frame.f_code is not self.root_code:
+                    names.append(self.frame_name(frame.f_code))
+                    frame = frame.f_back
+                if names:
+                    key = ";".join(reversed(names))
+                    stacks[key] = stacks.get(key, 0) + 1
+
+        sampler = threading.Thread(target=loop, name="stack-sampler", daemon=True)
+        sampler.start()
+        try:
+            yield stacks
+        finally:
+            stop.set()
+            sampler.join()
+
+
+class JobProfiler:
+    """
+    Corre en el worker: ejecuta un trabajo bajo el perfilador elegido y
+    retorna sus salidas junto con el perfil, etiquetado con las dimensiones
+    y el modo de la imagen de origen.
+
+    Desde Python 3.12 sólo puede haber un cProfile activo por proceso (usa
+    sys.monitoring, que es global): con workers hilo los trabajos perfilados
+    con cProfile corren de a uno, los demás esperan el lock.
+    """
+
+    _cprofile_lock = threading.Lock()
+
+    @staticmethod
+    def source_tags(data: bytes | None, tags: dict[str, str]) -> dict[str, str]:
+        """
+        Completa las etiquetas con formato, tamaño y modo del origen leyendo
+        sólo el encabezado de 'data' (si el trabajo no las trae ya).
+        """
+        tags = dict(tags)
+        if data is not None and "size" not in tags:
+            try:
+                probe = OutputSizeGuard.probe(data)
+                tags.update({"format": str(probe.format), "size": f"{probe.size[0]}x{probe.size[1]}", "mode": probe.mode})
+            except Exception:
+                pass
+        return tags
+
+    @staticmethod
+    def run(mode: str, call: Callable[[], list], tags: dict[str, str]) -> tuple[list, dict]:
+        start = time.perf_counter()
+        profile: dict = {"tags": tags}
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            with JobProfiler._cprofile_lock:
+                start = time.perf_counter()
+                profiler.enable()
+                try:
+                    outputs = call()
+                finally:
+                    profiler.disable()
+            profiler.create_stats()
+            profile["pstats"] = marshal.dumps(profiler.stats)
+        else:
+            sampler = StackSampler(root_code=JobProfiler._call.__code__)
+            with sampler.sample() as stacks:
+                outputs = JobProfiler._call(call)
+            profile["stacks"] = stacks
+        profile["seconds"] = time.perf_counter() - start
+        return outputs, profile
+
+    @staticmethod
+    def _call(call: Callable[[], list]) -> list:
+        # Raíz de las pilas muestreadas: todo lo que está por encima se descarta
+        return call()
+
+
+class ProfileReport:
+    """
+    Junta en el proceso principal los perfiles de una corrida, los escribe en
+    PROFILE_OUTPUT_DIR y muestra un resumen con lo más caro de cada trabajo:
+      - muestreo: un único '<fecha>.collapsed' cuya raíz es el trabajo con
+        sus etiquetas (p.e. "favicon.ico [PNG 1024x1024 P]").
+      - cprofile: un '<fecha>-<trabajo>.prof' por trabajo (formato pstats).
+    """
+
+    def __init__(self, mode: str, output_dir: str = PROFILE_OUTPUT_DIR):
+        self.mode = mode
+        self.output_dir = os.path.join(SCRIPT_DIR, output_dir)
+        self.stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.profiles: list[tuple[str, dict]] = []
+
+    @staticmethod
+    def label(name: str, tags: dict[str, str]) -> str:
+        values = " ".join(tags[key] for key in ("format", "size", "mode") if key in tags)
+        return f"{name} [{values}]" if values else name
+
+    def add(self, name: str, profile: dict) -> None:
+        self.profiles.append((name, profile))
+
+    def outputs(self) -> list[tuple[str, bytes]]:
+        if self.mode == "cprofile":
+            return [
+                (os.path.join(self.output_dir, f"{self.stamp}-{re.sub(r'[^A-Za-z0-9._-]+', '_', name)}.prof"),
+                 profile["pstats"])
+                for name, profile in self.profiles
+            ]
+        lines = []
+        for name, profile in self.profiles:
+            root = self.label(name, profile["tags"]).replace(";", ",")
+            for stack, count in sorted(profile["stacks"].items()):
+                lines.append(f"{root};{stack} {count}")
+        return [(os.path.join(self.output_dir, f"{self.stamp}.collapsed"), ("\n".join(lines) + "\n").encode("utf-8"))]
+
+    def _hottest(self, profile: dict) -> str:
+        """
+        Función con más tiempo propio: la hoja más muestreada o, con
+        cProfile, la de mayor 'tottime'.
+        """
+        if self.mode == "cprofile":
+            stats = marshal.loads(profile["pstats"])
+            if not stats:
+                return "-"
+            (file_name, line, func), (_, _, tottime, _, _) = max(stats.items(), key=lambda item: item[1][2])
+            return f"{os.path.basename(file_name)}:{func} ({tottime:.3f}s)"
+        leaves: dict[str, int] = {}
+        for stack, count in profile["stacks"].items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + count
+        if not leaves:
+            return "-"
+        leaf, count = max(leaves.items(), key=lambda item: item[1])
+        return f"{leaf} ({count} muestras)"
+
+    async def write(self) -> None:
+        if not self.profiles:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        outputs = self.outputs()
+        await asyncio.to_thread(ImageIOManager.write_batch, outputs, False)
+        print(f"🔬 Perfiles ({self.mode}) en {os.path.relpath(os.path.dirname(outputs[0][0]), SCRIPT_DIR)}:")
+        for name, profile in sorted(self.profiles, key=lambda item: -item[1]["seconds"]):
+            print(f"   {self.label(name, profile['tags'])}: {profile['seconds']:.3f}s | más caro: {self._hottest(profile)}")
+
+###############################################################################
+# RESPONSABILIDAD: Aislar cada tarea en un proceso con topes que se puede matar
+###############################################################################
+class IsolatedExecutor:
+    """
+    Pool de procesos donde cada tarea corre con tope de tiempo y de memoria.
+    Cada worker tiene un hilo supervisor: si la tarea se cuelga, supera el
+    tope o el proceso muere (p.e. por el OOM killer), el supervisor mata al
+    worker, lo reemplaza y la tarea falla con TimeoutError, MemoryError o
+    ChildProcessError, sin afectar al resto del lote.
+
+    Expone 'submit' y el administrador de contexto, que es lo que usan
+    StagedPipeline y loop.run_in_executor. Al salir del bloque 'with' por una
+    excepción (p.e. Ctrl+C) se cancelan las pendientes y se matan las que corren.
+
+    Los workers se inician con "spawn": un fork copiaría un proceso que ya
+    tiene el loop de asyncio y los hilos de los pools andando (y los locks
+    que tuvieran tomados). Siguen siendo hijos de este proceso, así que su
+    CPU se cuenta en os.times().
+    """
+
+    POLL_SECONDS: float = 0.1
+    START_METHOD: str = "spawn"
+
+    def __init__(
+        self,
+        max_workers: int,
+        timeout: float | None = TASK_TIMEOUT_SECONDS,
+        memory_limit_mb: int | None = TASK_MEMORY_LIMIT_MB,
+    ):
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self._context = multiprocessing.get_context(self.START_METHOD)
+        self._tasks: queue.SimpleQueue = queue.SimpleQueue()
+        self._closing = threading.Event()
+        self._shutdown = False
+        self._supervisors = [
+            threading.Thread(target=self._supervise, name=f"isolated-{i}", daemon=True)
+            for i in range(max(1, max_workers))
+        ]
+        for supervisor in self._supervisors:
+            supervisor.start()
+
+    def __enter__(self) -> "IsolatedExecutor":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if self._shutdown:
+            raise RuntimeError("No se pueden enviar tareas a un pool cerrado.")
+        future: Future = Future()
+        self._tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        """
+        Cierra el pool. Con 'cancel_futures' las tareas pendientes se cancelan
+        y los workers ocupados se matan en lugar de esperarlos.
+        """
+        if cancel_futures:
+            self._closing.set()
+        if not self._shutdown:
+            self._shutdown = True
+            for _ in self._supervisors:
+                self._tasks.put(None)
+        if wait:
+            for supervisor in self._supervisors:
+                supervisor.join()
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=IsolatedExecutor._worker_main, args=(child_conn, self.memory_limit_mb), daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    @staticmethod
+    def _kill(process, conn) -> None:
+        if process.is_alive():
+            process.kill()
+        process.join()
+        conn.close()
+
+    def _supervise(self) -> None:
+        process = conn = None
+        try:
+            while (task := self._tasks.get()) is not None:
+                future, fn, args = task
+                if self._closing.is_set():
+                    future.cancel()
+                    continue
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if process is None:
+                        process, conn = self._spawn()
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+                try:
+                    conn.send((fn, args))
+                except Exception as e:
+                    # No se pudo serializar la tarea: el pipe sigue intacto
+                    future.set_exception(e)
+                    continue
+
+                try:
+                    outcome = self._wait(process, conn)
+                except Exception as e:
+                    outcome = ("error", e, True)
+                if outcome[0] == "ok":
+                    future.set_result(outcome[1])
+                    continue
+                if outcome[0] == "error":
+                    future.set_exception(outcome[1])
+                    if not outcome[2]:
+                        continue
+                elif outcome[0] == "timeout":
+                    future.set_exception(TimeoutError(f"superó el tope de {self.timeout:g}s"))
+                elif outcome[0] == "cancelled":
+                    future.set_exception(InterruptedError("tarea cancelada"))
+                else:
+                    process.join()
+                    future.set_exception(ChildProcessError(f"el worker murió (código {process.exitcode})"))
+                # El worker quedó inutilizable: se mata y la próxima tarea usa uno nuevo
+                self._kill(process, conn)
+                process = conn = None
+        finally:
+            if process is not None:
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+                process.join(timeout=1)
+                self._kill(process, conn)
+
+    def _wait(self, process, conn) -> tuple:
+        """
+        Espera el resultado en tramos cortos para poder reaccionar al tope de
+        tiempo, a la muerte del worker o a una cancelación.
+        """
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while True:
+            try:
+                ready = conn.poll(self.POLL_SECONDS)
+                if ready:
+                    return conn.recv()
+            except EOFError:
+                return ("died",)
+            except Exception as e:
+                # Pipe roto o resultado que no se puede deserializar: la tarea
+                # falla (sin culpar a la entrada) y el worker se descarta
+                return ("error", RuntimeError(f"no se pudo recibir el resultado: {type(e).__name__}: {e}"), True)
+            if not process.is_alive():
+                return ("died",)
+            if self._closing.is_set():
+                return ("cancelled",)
+            if deadline is not None and time.monotonic() > deadline:
+                return ("timeout",)
+
+    @staticmethod
+    def _worker_main(conn, memory_limit_mb: int | None) -> None:
+        """
+        Bucle del proceso worker: aplica el tope de memoria (RLIMIT_AS, sólo en
+        Unix) y el de píxeles, y ejecuta tareas hasta recibir None.
+        Tras un MemoryError el proceso termina para que lo reemplacen.
+        """
+        if memory_limit_mb:
+            try:
+                import resource
+                limit = memory_limit_mb * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            except (ImportError, ValueError, OSError):
+                pass
+        Image.MAX_IMAGE_PIXELS = TASK_MAX_IMAGE_PIXELS
+        warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+            fn, args = task
+            try:
+                outcome = ("ok", fn(*args))
+            except MemoryError:
+                outcome = ("error", MemoryError(f"superó el tope de {memory_limit_mb} MiB"), True)
+            except BaseException as e:
+                outcome = ("error", e, False)
+            try:
+                conn.send(outcome)
+            except Exception as e:
+                conn.send(("error", RuntimeError(f"{type(outcome[1]).__name__}: {e}"), False))
+            if outcome[0] == "error" and outcome[2]:
+                return
+
+###############################################################################
+# RESPONSABILIDAD: Ubicar la raíz del sitio (rutas públicas de las salidas)
+###############################################################################
+class SitePaths:
+    """
+    Traduce rutas del disco a rutas del sitio publicado. El script se copia
+    en varias carpetas de 'public/', así que las rutas públicas no pueden
+    salir de la carpeta del script sino de la raíz del sitio.
+    """
+
+    @staticmethod
+    def _find_site_root(start: str) -> str | None:
+        """
+        SITE_ROOT_DIR si está configurada; si no, la carpeta SITE_ROOT_DIRNAME
+        que contiene a 'start' (None si no está dentro de ninguna).
+        """
+        if SITE_ROOT_DIR:
+            return os.path.abspath(os.path.join(SCRIPT_DIR, SITE_ROOT_DIR))
+        directory = os.path.abspath(start)
+        while os.path.basename(directory) != SITE_ROOT_DIRNAME:
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+        return directory
+
+    @staticmethod
+    def site_root(start: str = SCRIPT_DIR) -> str:
+        """
+        Raíz del sitio que contiene a 'start' ('start' misma si no hay).
+        """
+        return SitePaths._find_site_root(start) or os.path.abspath(start)
+
+    @staticmethod
+    def repo_root(start: str = SCRIPT_DIR) -> str:
+        """
+        Carpeta que contiene a la raíz del sitio (la del repositorio), donde
+        viven los archivos que no se publican ('start' misma si no hay sitio).
+        """
+        root = SitePaths._find_site_root(start)
+        return os.path.dirname(root) if root else os.path.abspath(start)
+
+    @staticmethod
+    def relative(path: str, start: str = SCRIPT_DIR) -> str:
+        """
+        Ruta de 'path' relativa a la raíz del sitio, con '/' como separador.
+        """
+        root = SitePaths.site_root(start)
+        relative = os.path.relpath(os.path.abspath(path), root)
+        if relative == ".." or relative.startswith(".." + os.sep):
+            raise ValueError(f"'{path}' está fuera de {root}; no tiene ruta en el sitio.")
+        return relative.replace(os.sep, "/")
+
+    @staticmethod
+    def url_path(path: str, start: str = SCRIPT_DIR) -> str:
+        """
+        URL absoluta (desde "/") con la que el sitio sirve 'path'.
+        """
+        return "/" + SitePaths.relative(path, start)
+
+###############################################################################
+# RESPONSABILIDAD: Destinos de escritura (disco local u object store S3)
+###############################################################################
+class LocalStorage:
+    """
+    Destino por defecto: escribe cada lote en disco con ImageIOManager.
+    """
+
+    writes_local: bool = True
+
+    def write_batch(
+        self, outputs: list[tuple[str, bytes | None]], fsync: bool = True, tracker: ResourceTracker | None = None
+    ) -> tuple[int, int]:
+        """
+        Escribe el lote. Retorna (subidos, omitidos), que aquí siempre es (0, 0).
+        """
+        ImageIOManager.write_batch(outputs, fsync, tracker)
+        return 0, 0
+
+    def close(self) -> None:
+        pass
+
+
+class HttpConnectionPool:
+    """
+    Conexiones HTTP/1.1 persistentes reutilizables por varios hilos: cada
+    pedido toma una conexión libre (o abre una) y la devuelve al terminar,
+    evitando el handshake TCP/TLS por archivo.
+    """
+
+    def __init__(self, endpoint: str, size: int = S3_POOL_SIZE, timeout: float = 60.0):
+        parsed = urllib.parse.urlsplit(endpoint)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or (443 if self.https else 80)
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max(1, size))
+
+    @property
+    def netloc(self) -> str:
+        default = 443 if self.https else 80
+        return self.host if self.port == default else f"{self.host}:{self.port}"
+
+    @contextmanager
+    def connection(self) -> Iterator[http.client.HTTPConnection]:
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            factory = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = factory(self.host, self.port, timeout=self.timeout)
+        try:
+            yield conn
+        except BaseException:
+            # Una conexión que falló a mitad de pedido no se reutiliza
+            conn.close()
+            raise
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SigV4Signer:
+    """
+    Firma AWS Signature Version 4 para la API de S3 (también la aceptan
+    MinIO, R2, etc.). Sin credenciales, los pedidos van sin firmar.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, region: str):
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+
+    @staticmethod
+    def quote(value: str, safe: str = "-_.~") -> str:
+        return urllib.parse.quote(value, safe=safe)
+
+    def sign(self, method: str, path: str, query: dict[str, str], headers: dict[str, str], payload_hash: str) -> None:
+        """
+        Agrega a 'headers' x-amz-date, x-amz-content-sha256 y Authorization.
+        'path' ya debe venir codificado, tal como se envía.
+        """
+        headers["x-amz-content-sha256"] = payload_hash
+        if not self.access_key:
+            return
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        headers["x-amz-date"] = amz_date
+        signed = {k.lower(): " ".join(str(v).split()) for k, v in headers.items()}
+        signed_names = ";".join(sorted(signed))
+        canonical_query = "&".join(f"{self.quote(k)}={self.quote(v)}" for k, v in sorted(query.items()))
+        canonical_request = "\n".join([
+            method, path, canonical_query,
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_names, payload_hash,
+        ])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        key = f"AWS4{self.secret_key}".encode("utf-8")
+        for part in (amz_date[:8], self.region, "s3", "aws4_request"):
+            key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+            f"SignedHeaders={signed_names}, Signature={signature}"
+        )
+
+
+class S3Client:
+    """
+    Cliente mínimo de la API de S3 (estilo de ruta: /bucket/clave) sobre
+    http.client: HEAD, PUT, DELETE y subida multipart con partes en paralelo.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = S3_ENDPOINT,
+        bucket: str = S3_BUCKET,
+        region: str = S3_REGION,
+        access_key: str = S3_ACCESS_KEY,
+        secret_key: str = S3_SECRET_KEY,
+        pool_size: int = S3_POOL_SIZE,
+    ):
+        self.bucket = bucket
+        self.pool = HttpConnectionPool(endpoint, pool_size)
+        self.signer = SigV4Signer(access_key, secret_key, region)
+        self.pool_size = pool_size
+
+    @staticmethod
+    def expected_etag(data: bytes, threshold: int = S3_MULTIPART_THRESHOLD, part_size: int = S3_PART_SIZE) -> str:
+        """
+        ETag que S3 asignará a 'data': md5 si es un PUT simple, o
+        md5(md5 de cada parte) + "-N" si se sube en N partes.
+        """
+        if len(data) <= threshold:
+            return hashlib.md5(data).hexdigest()
+        digests = b"".join(
+            hashlib.md5(data[i:i + part_size]).digest() for i in range(0, len(data), part_size)
+        )
+        return f"{hashlib.md5(digests).hexdigest()}-{-(-len(data) // part_size)}"
+
+    def _request(
+        self, method: str, key: str, query: dict[str, str] | None = None,
+        body: bytes = b"", headers: dict[str, str] | None = None,
+    ) -> tuple[int, dict[str, str], bytes]:
+        query = query or {}
+        headers = dict(headers or {})
+        path = SigV4Signer.quote(f"/{self.bucket}/{key}", safe="/-_.~")
+        headers["Host"] = self.pool.netloc
+        headers["Content-Length"] = str(len(body))
+        self.signer.sign(method, path, query, headers, hashlib.sha256(body).hexdigest())
+        url = path + ("?" + urllib.parse.urlencode(sorted(query.items()), quote_via=urllib.parse.quote) if query else "")
+        # Un reintento: la conexión reutilizada pudo haber sido cerrada por el servidor
+        for attempt in (1, 2):
+            try:
+                with self.pool.connection() as conn:
+                    conn.request(method, url, body=body, headers=headers)
+                    response = conn.getresponse()
+                    payload = response.read()
+                    if response.getheader("Connection", "").lower() == "close":
+                        conn.close()
+                    return response.status, {k.lower(): v for k, v in response.getheaders()}, payload
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if attempt == 2:
+                    raise
+
+    def _check(self, status: int, payload: bytes, action: str, key: str) -> None:
+        if status >= 300:
+            detail = payload[:200].decode("utf-8", "replace")
+            raise OSError(f"S3 {action} '{key}' respondió {status}: {detail}")
+
+    def head_etag(self, key: str) -> str | None:
+        status, headers, payload = self._request("HEAD", key)
+        if status == 404:
+            return None
+        self._check(status, payload, "HEAD", key)
+        return headers.get("etag", "").strip('"') or None
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        if len(data) > S3_MULTIPART_THRESHOLD:
+            self._put_multipart(key, data, content_type)
+            return
+        status, _, payload = self._request("PUT", key, body=data, headers={"Content-Type": content_type})
+        self._check(status, payload, "PUT", key)
+
+    def delete(self, key: str) -> None:
+        status, _, payload = self._request("DELETE", key)
+        if status != 404:
+            self._check(status, payload, "DELETE", key)
+
+    def _put_multipart(self, key: str, data: bytes, content_type: str) -> None:
+        """
+        Subida multipart: las partes viajan en paralelo por el pool de
+        conexiones; si algo falla, la subida se aborta en el servidor.
+        """
+        status, _, payload = self._request("POST", key, {"uploads": ""}, headers={"Content-Type": content_type})
+        self._check(status, payload, "CreateMultipartUpload", key)
+        upload_id = re.search(rb"<UploadId>(.*?)</UploadId>", payload).group(1).decode("utf-8")
+
+        def upload_part(number: int) -> str:
+            chunk = data[(number - 1) * S3_PART_SIZE:number * S3_PART_SIZE]
+            status, headers, payload = self._request(
+                "PUT", key, {"partNumber": str(number), "uploadId": upload_id}, body=chunk
+            )
+            self._check(status, payload, f"UploadPart {number}", key)
+            return headers.get("etag", "")
+
+        numbers = range(1, -(-len(data) // S3_PART_SIZE) + 1)
+        try:
+            with ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="s3-part") as executor:
+                etags = list(executor.map(upload_part, numbers))
+            body = "<CompleteMultipartUpload>" + "".join(
+                f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>" for n, etag in zip(numbers, etags)
+            ) + "</CompleteMultipartUpload>"
+            status, _, payload = self._request("POST", key, {"uploadId": upload_id}, body=body.encode("utf-8"))
+            self._check(status, payload, "CompleteMultipartUpload", key)
+        except Exception:
+            # El error que cuenta es el de la subida: si el abort también
+            # falla, el servidor descarta las partes al vencer la subida
+            try:
+                self._request("DELETE", key, {"uploadId": upload_id})
+            except Exception as e:
+                print(f"⚠️ No se pudo abortar la subida multipart de '{key}': {e}")
+            raise
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class ObjectStorage:
+    """
+    Destino S3: publica cada salida desde memoria (sin releerla del disco),
+    con las subidas del lote en paralelo y omitiendo las que ya están con
+    el mismo ETag. La clave es S3_PREFIX más la ruta relativa a 'root_dir'
+    (la raíz del sitio), igual en todas las copias del script.
+    Con 'keep_local' además se escriben en disco, como LocalStorage.
+    """
+
+    CONTENT_TYPES: dict[str, str] = {".webmanifest": "application/manifest+json", ".ico": "image/x-icon"}
+
+    def __init__(self, client: S3Client, root_dir: str, prefix: str = S3_PREFIX, keep_local: bool = STORAGE_KEEP_LOCAL):
+        self.client = client
+        self.root_dir = os.path.abspath(root_dir)
+        self.prefix = prefix
+        self.keep_local = keep_local
+        self.writes_local = keep_local
+
+    def key_for(self, path: str) -> str:
+        return self.prefix + SitePaths.relative(path, self.root_dir)
+
+    def content_type(self, key: str) -> str:
+        extension = os.path.splitext(key)[1].lower()
+        return self.CONTENT_TYPES.get(extension) or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def _publish(self, output: tuple[str, bytes | None]) -> bool:
+        """
+        Sube (o borra) una salida. Retorna False si ya estaba igual en el bucket.
+        """
+        path, data = output
+        key = self.key_for(path)
+        if data is None:
+            self.client.delete(key)
+            return True
+        if self.client.head_etag(key) == S3Client.expected_etag(data):
+            return False
+        self.client.put(key, data, self.content_type(key))
+        return True
+
+    def write_batch(
+        self, outputs: list[tuple[str, bytes | None]], fsync: bool = True, tracker: ResourceTracker | None = None
+    ) -> tuple[int, int]:
+        """
+        Publica el lote y retorna (subidos, omitidos por ETag igual).
+        """
+        if self.keep_local:
+            ImageIOManager.write_batch(outputs, fsync, tracker)
+        with ThreadPoolExecutor(max_workers=self.client.pool_size, thread_name_prefix="s3") as executor:
+            results = list(executor.map(self._publish, outputs))
+        uploaded = sum(results)
+        return uploaded, len(results) - uploaded
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class StorageBackends:
+    """
+    Crea el destino de escritura configurado en STORAGE_BACKEND.
+    """
+
+    @staticmethod
+    def from_settings(root_dir: str | None = None) -> LocalStorage | ObjectStorage:
+        if STORAGE_BACKEND == "s3":
+            return ObjectStorage(S3Client(), root_dir or SitePaths.site_root())
+        if STORAGE_BACKEND != "local":
+            raise ValueError(f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND!r}")
+        return LocalStorage()
+
+###############################################################################
+# RESPONSABILIDAD: Servidor S3 local de prueba (stand-in del object store)
+###############################################################################
+class LocalObjectStoreServer:
+    """
+    Servidor mínimo compatible con la API de S3 que usa S3Client (HEAD, GET,
+    PUT, DELETE y multipart), con los objetos guardados en 'data_dir'.
+    Sirve para probar el destino "s3" sin credenciales ni red; no valida
+    firmas. Mantiene las conexiones abiertas (keep-alive) como S3.
+    """
+
+    def __init__(self, data_dir: str, host: str = "127.0.0.1", port: int = 9000):
+        self.data_dir = os.path.abspath(data_dir)
+        self.host = host
+        self.port = port
+        self._uploads: dict[str, dict[int, tuple[bytes, str]]] = {}
+
+    def _object_path(self, bucket: str, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.data_dir, bucket, key))
+        if not path.startswith(self.data_dir + os.sep):
+            raise ValueError("clave fuera del almacén")
+        return path
+
+    def _meta_path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.data_dir, ".meta", bucket, f"{key}.json")
+
+    def _store(self, bucket: str, key: str, data: bytes, etag: str, content_type: str) -> None:
+        meta = json.dumps({"etag": etag, "content_type": content_type}).encode("utf-8")
+        for path, payload in ((self._object_path(bucket, key), data), (self._meta_path(bucket, key), meta)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            ImageIOManager.write_batch([(path, payload)], fsync=False)
+
+    def _load_meta(self, bucket: str, key: str) -> dict | None:
+        try:
+            with open(self._meta_path(bucket, key), "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def handle(self, method: str, target: str, headers: dict[str, str], body: bytes) -> tuple[int, dict[str, str], bytes]:
+        """
+        Atiende un pedido ya leído y retorna (estado, headers, cuerpo).
+        """
+        parsed = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(parsed.query, keep_blank_values=True))
+        bucket, _, key = urllib.parse.unquote(parsed.path).lstrip("/").partition("/")
+        if not bucket or not key:
+            return 400, {}, b"<Error><Code>InvalidRequest</Code></Error>"
+        xml = {"Content-Type": "application/xml"}
+
+        if method == "POST" and "uploads" in query:
+            upload_id = hashlib.sha256(f"{bucket}/{key}/{time.time_ns()}".encode()).hexdigest()[:32]
+            self._uploads[upload_id] = {}
+            return 200, xml, f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>".encode()
+        if "uploadId" in query:
+            parts = self._uploads.get(query["uploadId"])
+            if parts is None:
+                return 404, xml, b"<Error><Code>NoSuchUpload</Code></Error>"
+            if method == "PUT":
+                etag = hashlib.md5(body).hexdigest()
+                parts[int(query["partNumber"])] = (body, etag)
+                return 200, {"ETag": f'"{etag}"'}, b""
+            if method == "DELETE":
+                del self._uploads[query["uploadId"]]
+                return 204, {}, b""
+            if method == "POST":
+                del self._uploads[query["uploadId"]]
+                ordered = [parts[number] for number in sorted(parts)]
+                digest = hashlib.md5(b"".join(bytes.fromhex(etag) for _, etag in ordered)).hexdigest()
+                etag = f"{digest}-{len(ordered)}"
+                self._store(bucket, key, b"".join(chunk for chunk, _ in ordered), etag, "application/octet-stream")
+                return 200, xml, f'<CompleteMultipartUploadResult><ETag>"{etag}"</ETag></CompleteMultipartUploadResult>'.encode()
+
+        if method == "PUT":
+            etag = hashlib.md5(body).hexdigest()
+            self._store(bucket, key, body, etag, headers.get("content-type", "application/octet-stream"))
+            return 200, {"ETag": f'"{etag}"'}, b""
+        if method in ("GET", "HEAD"):
+            meta = self._load_meta(bucket, key)
+            if meta is None:
+                return 404, xml, b"" if method == "HEAD" else b"<Error><Code>NoSuchKey</Code></Error>"
+            data = ImageIOManager.read_bytes(self._object_path(bucket, key))
+            response = {"ETag": f'"{meta["etag"]}"', "Content-Type": meta["content_type"]}
+            return 200, response, data
+        if method == "DELETE":
+            for path in (self._object_path(bucket, key), self._meta_path(bucket, key)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            return 204, {}, b""
+        return 405, {}, b""
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0")))
+                try:
+                    status, response_headers, payload = await asyncio.to_thread(self.handle, method, target, headers, body)
+                except Exception as e:
+                    status, response_headers, payload = 500, {}, str(e).encode("utf-8")
+                length = len(payload)
+                if method == "HEAD":
+                    payload = b""
+                head = f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+                head += "".join(f"{k}: {v}\r\n" for k, v in response_headers.items())
+                writer.write(f"{head}Content-Length: {length}\r\n\r\n".encode("latin-1") + payload)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self) -> None:
+        server = await asyncio.start_server(self._serve, self.host, self.port)
+        print(f"🪣 Object store local en http://{self.host}:{self.port} (datos en {self.data_dir})")
+        async with server:
+            await server.serve_forever()
+
+###############################################################################
+# RESPONSABILIDAD: Repartir los workers de codificación por prioridad
+###############################################################################
+class PriorityScheduler:
+    """
+    Slots de codificación compartidos por todas las corridas del proceso.
+    Cada trabajo pide un slot con su clase (interactive, normal, bulk) y su
+    costo estimado en píxeles; los slots libres se entregan por clase y,
+    dentro de la clase, al más barato primero (shortest-job-first).
+    Reparto justo sin dejar slots ociosos: una clase sólo se limita a su
+    fracción de los slots (SCHEDULER_SHARES) mientras una clase más
+    prioritaria tiene pedidos esperando; si no, usa todos los libres. Los que
+    toma prestados los devuelve al terminar cada trabajo (el siguiente slot
+    libre es del más prioritario), y "interactive" tiene además slots extra
+    (SCHEDULER_INTERACTIVE_BURST) para no esperar a que termine el lote.
+    """
+
+    def __init__(
+        self,
+        slots: int = SCHEDULER_SLOTS,
+        shares: dict[str, float] = SCHEDULER_SHARES,
+        burst: int = SCHEDULER_INTERACTIVE_BURST,
+    ):
+        self.slots = max(1, slots)
+        self.burst = max(0, burst)
+        self.limits = {priority: max(1, int(shares[priority] * self.slots)) for priority in SCHEDULER_CLASSES}
+        self.running = dict.fromkeys(SCHEDULER_CLASSES, 0)
+        self._waiting: list[tuple[int, int, int, str, asyncio.Future]] = []
+        self._sequence = 0
+
+    def _admissible(self, priority: str, contended: bool) -> bool:
+        """
+        True si hay un slot libre para 'priority'. El cupo de la clase sólo
+        se aplica con 'contended' (una clase más prioritaria está esperando).
+        """
+        capacity = self.slots + (self.burst if priority == "interactive" else 0)
+        if sum(self.running.values()) >= capacity:
+            return False
+        return not contended or self.running[priority] < self.limits[priority]
+
+    def _dispatch(self) -> None:
+        """
+        Entrega slots en orden (clase, costo, llegada). Un pedido que no entra
+        por el cupo de su clase no bloquea a los de otras clases.
+        """
+        blocked = []
+        while self._waiting:
+            entry = heapq.heappop(self._waiting)
+            rank, priority, future = entry[0], entry[3], entry[4]
+            if future.done():
+                continue
+            # El heap sale por clase: los bloqueados hasta acá son de clases
+            # iguales o más prioritarias
+            if self._admissible(priority, any(other[0] < rank for other in blocked)):
+                self.running[priority] += 1
+                future.set_result(None)
+            else:
+                blocked.append(entry)
+        for entry in blocked:
+            heapq.heappush(self._waiting, entry)
+
+    def _release(self, priority: str) -> None:
+        self.running[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "normal", cost: int = 0) -> AsyncIterator[None]:
+        """
+        Espera un slot para un trabajo de clase 'priority' y costo 'cost'.
+        """
+        if priority not in self.running:
+            raise ValueError(f"Prioridad desconocida: {priority!r} (válidas: {', '.join(SCHEDULER_CLASSES)})")
+        future = asyncio.get_running_loop().create_future()
+        self._sequence += 1
+        heapq.heappush(self._waiting, (SCHEDULER_CLASSES.index(priority), cost, self._sequence, priority, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Cancelado justo después de recibir el slot: se devuelve
+            if future.done() and not future.cancelled():
+                self._release(priority)
+            raise
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @staticmethod
+    def estimate_cost(data: bytes) -> int:
+        """
+        Píxeles del origen según el encabezado de sus bytes ya leídos (sin
+        decodificar). Si no son una imagen legible lanza el error de Pillow
+        (UnidentifiedImageError, SyntaxError u OSError al crear el decodificador).
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            with Image.open(io.BytesIO(data)) as img:
+                return img.width * img.height * AnimationFrames.frame_count(img)
+
+###############################################################################
+# RESPONSABILIDAD: Verificar las salidas ya escritas (releerlas del disco)
+###############################################################################
+@dataclass(frozen=True)
+class OutputSpec:
+    """
+    Lo que debe cumplir una salida: formato, tamaño, si tiene alpha y, para
+    los .ico, los tamaños de su directorio. None = no se controla.
+    """
+    format: str | None = None
+    size: tuple[int, int] | None = None
+    alpha: bool | None = None
+    ico_sizes: tuple[tuple[int, int], ...] | None = None
+
+
+class OutputVerifier:
+    """
+    Relee del disco cada salida escrita y la compara con los bytes que se
+    codificaron (largo y hash: detecta archivos truncados o a medias) y con
+    su OutputSpec (encabezado). Con 'full' además decodifica la imagen
+    completa (cada tamaño de un .ico, cada frame de una animación).
+    """
+
+    FORMATS: dict[str, str] = {".png": "PNG", ".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".ico": "ICO"}
+
+    @staticmethod
+    def full_decode(path: str, mode: str | None, sample_rate: float = VERIFY_SAMPLE_RATE) -> bool:
+        """
+        True si 'path' se decodifica por completo en el modo dado. La muestra
+        es determinista (hash de la ruta), así que siempre son los mismos.
+        """
+        if mode == "all":
+            return True
+        if mode != "sample":
+            return False
+        bucket = int.from_bytes(hashlib.sha256(path.encode("utf-8")).digest()[:4], "big")
+        return bucket < sample_rate * 2 ** 32
+
+    @staticmethod
+    def check(path: str, data: bytes | None, spec: OutputSpec | None, full: bool) -> str | None:
+        """
+        Retorna None si la salida está bien, o una descripción del problema.
+        """
+        if data is None:
+            return "debía eliminarse y sigue existiendo" if os.path.exists(path) else None
+        try:
+            written = ImageIOManager.read_bytes(path)
+        except FileNotFoundError:
+            return "no existe"
+        if len(written) != len(data):
+            return f"tiene {len(written)} bytes y se escribieron {len(data)} (¿truncado?)"
+        if written != data:
+            return "el contenido no coincide con lo escrito"
+
+        extension = os.path.splitext(path)[1].lower()
+        if extension in OutputVerifier.FORMATS:
+            spec = spec or OutputSpec(format=OutputVerifier.FORMATS[extension])
+            return OutputVerifier._check_image(written, spec, full)
+        if full and extension == ".gz":
+            try:
+                gzip.decompress(written)
+            except (OSError, EOFError) as e:
+                return f"gzip inválido: {e}"
+        if full and extension in (".json", ".webmanifest"):
+            try:
+                json.loads(written)
+            except ValueError as e:
+                return f"JSON inválido: {e}"
+        return None
+
+    @staticmethod
+    def _check_image(data: bytes, spec: OutputSpec, full: bool) -> str | None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                if spec.format and img.format != spec.format:
+                    return f"formato {img.format}, se esperaba {spec.format}"
+                if spec.size and img.size != spec.size:
+                    return f"tamaño {img.width}x{img.height}, se esperaba {spec.size[0]}x{spec.size[1]}"
+                alpha = "A" in img.mode or "transparency" in img.info
+                if spec.alpha is not None and alpha != spec.alpha:
+                    return f"modo {img.mode} " + ("sin alpha" if spec.alpha else "con alpha inesperado")
+                sizes = sorted(img.info.get("sizes", ()))
+                if spec.ico_sizes and sizes != sorted(spec.ico_sizes):
+                    found = ", ".join(f"{w}x{h}" for w, h in sizes)
+                    return f"el .ico trae [{found}], se esperaban {len(spec.ico_sizes)} tamaños"
+                if full:
+                    if img.format == "ICO":
+                        for size in sizes:
+                            img.ico.getimage(size).load()
+                    else:
+                        for _, frame in AnimationFrames.iter_frames(img):
+                            frame.load()
+        except (OSError, SyntaxError, ValueError) as e:
+            return f"no se puede {'decodificar' if full else 'leer el encabezado'}: {e}"
+        return None
+
+###############################################################################
+# RESPONSABILIDAD: Encadenar lectura, codificación y escritura en etapas
+###############################################################################
+@dataclass
+class PipelineJob:
+    """
+    Unidad de trabajo del pipeline:
+      - name: etiqueta usada en los mensajes.
+      - source_path: imagen a leer en la etapa de lectura (None si no aplica).
+      - encode: recibe los bytes leídos (o None) y retorna la lista de
+        (ruta_destino, bytes_codificados). Si el pipeline usa procesos,
+        debe poder serializarse con pickle.
+      - tags: etiquetas del origen (format, size, mode) para los perfiles;
+        si faltan se leen del encabezado de los bytes leídos.
+      - priority: clase del trabajo para el PriorityScheduler.
+      - cost: píxeles a procesar (orden shortest-job-first); con 0 y un
+        'source_path' se estima en la etapa de lectura, con el encabezado
+        de los bytes leídos.
+    """
+    name: str
+    source_path: str | None
+    encode: Callable[[bytes | None], list[tuple[str, bytes]]]
+    tags: dict[str, str] = field(default_factory=dict)
+    priority: str = "normal"
+    cost: int = 0
+
+
+@dataclass
+class PipelineStats:
+    """
+    Tiempo ocupado acumulado por etapa y totales de una corrida del pipeline.
+    """
+    read_seconds: float = 0.0
+    encode_seconds: float = 0.0
+    write_seconds: float = 0.0
+    # Espera de un slot del PriorityScheduler (no cuenta como codificación)
+    wait_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    written: int = 0
+    failed: int = 0
+    written_paths: list[str] = field(default_factory=list)
+    # (ruta de origen, motivo) de las entradas cuyo trabajo falló al codificar
+    quarantined: list[tuple[str, str]] = field(default_factory=list)
+    # Con destino S3: salidas subidas y omitidas por tener ya el mismo ETag
+    uploaded: int = 0
+    upload_skipped: int = 0
+    # Verificación posterior a la escritura
+    verified: int = 0
+    verify_retried: int = 0
+    verify_failed: list[tuple[str, str]] = field(default_factory=list)
+
+    def report(self) -> str:
+        """
+        Retorna un resumen legible de la corrida.
+        """
+        return (
+            f"⏱️ Lectura {self.read_seconds:.2f}s | codificación {self.encode_seconds:.2f}s | "
+            f"escritura {self.write_seconds:.2f}s | "
+            + (f"espera de slot {self.wait_seconds:.2f}s | " if self.wait_seconds >= 0.01 else "")
+            + f"total {self.wall_seconds:.2f}s | "
+            f"{self.written} escritos, {self.failed} con error"
+            + (f", {len(self.quarantined)} en cuarentena" if self.quarantined else "")
+            + (f" | {self.uploaded} subidos, {self.upload_skipped} sin cambios en el bucket"
+               if self.uploaded or self.upload_skipped else "")
+            + (f" | {self.verified} verificados, {self.verify_retried} reescritos, "
+               f"{len(self.verify_failed)} con fallas" if self.verified or self.verify_failed else "")
+        )
+
+
+class StagedPipeline:
+    """
+    Pipeline de tres etapas unidas por colas acotadas:
+      1) Lectura: prefetch asíncrono de los bytes de origen.
+      2) Codificación: decodificar/redimensionar/codificar en un pool de workers
+         (y, opcionalmente, generar los sidecars .gz/.br de cada salida).
+      3) Escritura: agrupa los resultados en lotes y los entrega al destino
+         ('storage': disco con fsync, o bucket S3 con subidas en paralelo).
+      4) Verificación (opcional): relee cada salida escrita y la controla
+         contra lo codificado y contra 'expect' (OutputSpec por nombre de
+         archivo), mientras las etapas anteriores siguen trabajando.
+    Las colas acotadas dan backpressure: si una etapa se atrasa, las anteriores
+    esperan, así que el rendimiento queda limitado por la etapa más lenta y no
+    por la suma de todas.
+    Los trabajos se leen en orden (prioridad, costo) y cada codificación pide
+    un slot al PriorityScheduler compartido, así que dos corridas simultáneas
+    se reparten los workers según la prioridad de sus trabajos.
+    """
+
+    scheduler: PriorityScheduler = PriorityScheduler()
+    # Fallas de la codificación atribuibles a la entrada (se cuelga, agota la
+    # memoria, mata al worker o es una bomba de descompresión): la entrada va
+    # a cuarentena
+    QUARANTINE_ERRORS: tuple[type[BaseException], ...] = (
+        TimeoutError,
+        MemoryError,
+        ChildProcessError,
+        Image.DecompressionBombError,
+        Image.DecompressionBombWarning,
+    )
+    # Orígenes corruptos: Pillow no los identifica o no puede crear su
+    # decodificador. Sólo se atrapan al abrir el encabezado de los bytes ya
+    # leídos, en la etapa de lectura (sin E/S de por medio), así un error
+    # real de disco no manda el archivo a cuarentena
+    SOURCE_ERRORS: tuple[type[BaseException], ...] = (
+        UnidentifiedImageError,
+        SyntaxError,
+        OSError,
+        Image.DecompressionBombError,
+    )
+
+    def __init__(
+        self,
+        read_workers: int = PIPELINE_READ_WORKERS,
+        encode_workers: int = PIPELINE_ENCODE_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        write_batch: int = PIPELINE_WRITE_BATCH,
+        fsync: bool = PIPELINE_FSYNC,
+        use_processes: bool = PIPELINE_USE_PROCESSES,
+        tracker: ResourceTracker | None = None,
+        sidecars: bool = PRECOMPRESS_SIDECARS,
+        metrics: PipelineMetrics | None = None,
+        progress: ProgressLine | None = None,
+        profile_mode: str | None = None,
+        isolate: bool = False,
+        storage: LocalStorage | ObjectStorage | None = None,
+        verify: str | None = None,
+        expect: dict[str, OutputSpec] | None = None,
+    ):
+        self.read_workers = max(1, read_workers)
+        self.encode_workers = max(1, encode_workers)
+        self.queue_size = max(1, queue_size)
+        self.write_batch = max(1, write_batch)
+        self.fsync = fsync
+        self.use_processes = use_processes
+        self.tracker = tracker
+        self.sidecars = sidecars
+        self.metrics = metrics or PipelineMetrics()
+        self.progress = progress or ProgressLine()
+        self.profile_mode = profile_mode or PROFILE_MODE
+        self.isolate = isolate
+        self.storage = storage or StorageBackends.from_settings()
+        self.verify = (verify or VERIFY_OUTPUTS) if self.storage.writes_local else None
+        self.expect = expect or {}
+
+    def _log(self, message: str) -> None:
+        self.progress.clear()
+        print(message)
+
+    def _make_executor(self) -> Executor | IsolatedExecutor:
+        if self.isolate:
+            return IsolatedExecutor(self.encode_workers)
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.encode_workers)
+        return ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix="encode")
+
+    async def run(self, jobs: list[PipelineJob]) -> PipelineStats:
+        """
+        Procesa 'jobs' a través de las tres etapas y retorna las estadísticas.
+        Los errores de un trabajo se informan y no detienen al resto.
+        """
+        stats = PipelineStats()
+        metrics = self.metrics
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        read_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        verify_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size * self.write_batch)
+        pending = iter(await asyncio.to_thread(StagedPipeline._schedule_order, jobs))
+        profiles = ProfileReport(self.profile_mode) if self.profile_mode else None
+        metrics.set("ico4x4_jobs", len(jobs))
+        metrics.set("ico4x4_workers_busy", 0)
+
+        async def reader() -> None:
+            for job in pending:
+                data = None
+                if job.source_path:
+                    t0 = time.perf_counter()
+                    try:
+                        data = await asyncio.to_thread(
+                            ImageIOManager.read_bytes, job.source_path, self.tracker
+                        )
+                    except Exception as e:
+                        stats.failed += 1
+                        metrics.inc("ico4x4_jobs_completed_total", status="failed")
+                        self._log(f"❌ Error leyendo '{job.name}': {e}")
+                        continue
+                    finally:
+                        stats.read_seconds += time.perf_counter() - t0
+                        metrics.observe("ico4x4_stage_seconds", time.perf_counter() - t0, stage="read")
+                    metrics.inc("ico4x4_bytes_read_total", len(data))
+                    try:
+                        cost = await asyncio.to_thread(PriorityScheduler.estimate_cost, data)
+                    except Exception as e:
+                        stats.failed += 1
+                        metrics.inc("ico4x4_jobs_completed_total", status="failed")
+                        self._log(f"❌ Error abriendo '{job.name}': {type(e).__name__}: {e}")
+                        if isinstance(e, self.SOURCE_ERRORS):
+                            stats.quarantined.append((job.source_path, f"{type(e).__name__}: {e}"))
+                        continue
+                    job.cost = job.cost or cost
+                await read_queue.put((job, data))
+
+        async def encoder(executor: Executor) -> None:
+            while (item := await read_queue.get()) is not None:
+                job, data = item
+                queued = time.perf_counter()
+                t0 = None
+                try:
+                    async with self.scheduler.slot(job.priority, job.cost):
+                        t0 = time.perf_counter()
+                        stats.wait_seconds += t0 - queued
+                        metrics.observe("ico4x4_schedule_wait_seconds", t0 - queued, priority=job.priority)
+                        metrics.inc("ico4x4_workers_busy")
+                        try:
+                            outputs, profile, usage = await loop.run_in_executor(
+                                executor, StagedPipeline._run_encode,
+                                job.encode, self.sidecars, self.profile_mode, job.tags, data,
+                            )
+                            ResourceTracker.merge_remote(usage)
+                        finally:
+                            metrics.inc("ico4x4_workers_busy", -1)
+                except Exception as e:
+                    stats.failed += 1
+                    metrics.inc("ico4x4_jobs_completed_total", status="failed")
+                    self._log(f"❌ Error generando '{job.name}': {type(e).__name__}: {e}")
+                    if job.source_path and isinstance(e, self.QUARANTINE_ERRORS):
+                        stats.quarantined.append((job.source_path, f"{type(e).__name__}: {e}"))
+                    continue
+                finally:
+                    # Sólo el tiempo con slot: la espera ya quedó en wait_seconds
+                    if t0 is not None:
+                        stats.encode_seconds += time.perf_counter() - t0
+                        metrics.observe("ico4x4_stage_seconds", time.perf_counter() - t0, stage="encode")
+                if profiles:
+                    profiles.add(job.name, profile)
+                await write_queue.put((job, outputs))
+
+        async def writer() -> None:
+            while True:
+                batch = [await write_queue.get()]
+                while batch[-1] is not None and len(batch) < self.write_batch and not write_queue.empty():
+                    batch.append(write_queue.get_nowait())
+                finished = batch[-1] is None
+                batch = [item for item in batch if item is not None]
+                if batch:
+                    written = await self._write(batch, stats)
+                    if self.verify:
+                        for output in written:
+                            await verify_queue.put(output)
+                if finished:
+                    return
+
+        async def verifier() -> None:
+            while (output := await verify_queue.get()) is not None:
+                await self._verify(*output, stats)
+
+        def sample() -> float:
+            """
+            Actualiza los gauges derivados y retorna el tiempo transcurrido.
+            """
+            elapsed = time.perf_counter() - start
+            metrics.set("ico4x4_queue_depth", read_queue.qsize(), queue="read")
+            metrics.set("ico4x4_queue_depth", write_queue.qsize(), queue="write")
+            if elapsed > 0:
+                metrics.set("ico4x4_files_per_second", stats.written / elapsed)
+                metrics.set("ico4x4_worker_utilization",
+                            min(1.0, stats.encode_seconds / (elapsed * self.encode_workers)))
+            return elapsed
+
+        async def monitor() -> None:
+            while True:
+                await asyncio.sleep(METRICS_INTERVAL)
+                self.progress.show(ProgressLine.format(metrics, sample()))
+                await exporter.write_file()
+
+        exporter = MetricsExporter(metrics)
+        await exporter.start()
+        monitor_task = asyncio.create_task(monitor())
+        try:
+            with self._make_executor() as executor:
+                readers = [asyncio.create_task(reader()) for _ in range(self.read_workers)]
+                encoders = [asyncio.create_task(encoder(executor)) for _ in range(self.encode_workers)]
+                writer_task = asyncio.create_task(writer())
+                verifiers = [asyncio.create_task(verifier()) for _ in range(VERIFY_WORKERS if self.verify else 0)]
+                try:
+                    await asyncio.gather(*readers)
+                    for _ in encoders:
+                        await read_queue.put(None)
+                    await asyncio.gather(*encoders)
+                    await write_queue.put(None)
+                    await writer_task
+                    for _ in verifiers:
+                        await verify_queue.put(None)
+                    await asyncio.gather(*verifiers)
+                finally:
+                    # Si la corrida se interrumpe, ninguna etapa sigue trabajando
+                    for task in (*readers, *encoders, writer_task, *verifiers):
+                        task.cancel()
+        finally:
+            monitor_task.cancel()
+            stats.wall_seconds = sample()
+            if len(jobs) > 1:
+                self.progress.finish(ProgressLine.format(metrics, stats.wall_seconds))
+            await exporter.write_file()
+            await exporter.stop()
+            self.storage.close()
+        if profiles:
+            await profiles.write()
+        for path, problem in stats.verify_failed:
+            self._log(f"❌ Verificación fallida de '{os.path.basename(path)}': {problem}")
+        return stats
+
+    async def _write(
+        self, batch: list[tuple[PipelineJob, list[tuple[str, bytes]]]], stats: PipelineStats
+    ) -> list[tuple[str, bytes | None]]:
+        """
+        Etapa de escritura: vuelca un lote completo en un solo paso. Retorna
+        las salidas escritas (vacío si el lote falló).
+        """
+        outputs = [output for _, job_outputs in batch for output in job_outputs]
+        t0 = time.perf_counter()
+        try:
+            uploaded, skipped = await asyncio.to_thread(
+                self.storage.write_batch, outputs, self.fsync, self.tracker
+            )
+        except Exception as e:
+            stats.failed += len(batch)
+            self.metrics.inc("ico4x4_jobs_completed_total", len(batch), status="failed")
+            names = ", ".join(job.name for job, _ in batch)
+            self._log(f"❌ Error escribiendo el lote ({names}): {e}")
+            return []
+        finally:
+            stats.write_seconds += time.perf_counter() - t0
+            self.metrics.observe("ico4x4_stage_seconds", time.perf_counter() - t0, stage="write")
+
+        stats.uploaded += uploaded
+        stats.upload_skipped += skipped
+        self.metrics.inc("ico4x4_jobs_completed_total", len(batch), status="ok")
+        for path, data in outputs:
+            if data is None:
+                continue
+            stats.written += 1
+            stats.written_paths.append(path)
+            self.metrics.inc("ico4x4_files_written_total")
+            self.metrics.inc("ico4x4_bytes_written_total", len(data))
+            self._log(f"✅ Generado (reemplazado si existía): {os.path.basename(path)}")
+        return outputs
+
+    async def _verify(self, path: str, data: bytes | None, stats: PipelineStats) -> None:
+        """
+        Etapa de verificación: controla una salida escrita y, si está mal, la
+        reescribe desde memoria hasta VERIFY_RETRIES veces.
+        """
+        spec = self.expect.get(os.path.basename(path))
+        full = OutputVerifier.full_decode(path, self.verify)
+        for attempt in range(VERIFY_RETRIES + 1):
+            t0 = time.perf_counter()
+            problem = await asyncio.to_thread(OutputVerifier.check, path, data, spec, full)
+            self.metrics.observe("ico4x4_stage_seconds", time.perf_counter() - t0, stage="verify")
+            if problem is None:
+                stats.verified += 1
+                stats.verify_retried += attempt > 0
+                self.metrics.inc("ico4x4_outputs_verified_total", result="retried" if attempt else "ok")
+                return
+            if attempt == VERIFY_RETRIES:
+                break
+            self._log(f"⚠️ '{os.path.basename(path)}' {problem}; se reescribe ({attempt + 1}/{VERIFY_RETRIES}).")
+            try:
+                await asyncio.to_thread(self.storage.write_batch, [(path, data)], self.fsync, self.tracker)
+            except Exception as e:
+                problem = f"no se pudo reescribir: {e}"
+                break
+        stats.verify_failed.append((path, problem))
+        self.metrics.inc("ico4x4_outputs_verified_total", result="failed")
+
+    @staticmethod
+    def _schedule_order(jobs: list[PipelineJob]) -> list[PipelineJob]:
+        """
+        Ordena los trabajos por (prioridad, costo), conservando el orden
+        original entre iguales. Los que no traen costo se ordenan por el
+        tamaño del origen (un stat, sin abrirlo): el costo en píxeles se
+        calcula después, en la etapa de lectura, sin demorar la primera.
+        """
+        def size(job: PipelineJob) -> int:
+            try:
+                return os.path.getsize(job.source_path) if job.source_path else 0
+            except OSError:
+                return 0
+
+        return sorted(jobs, key=lambda job: (SCHEDULER_CLASSES.index(job.priority), job.cost or size(job)))
+
+    @staticmethod
+    def _run_encode(
+        encode: Callable[[bytes | None], list[tuple[str, bytes]]],
+        sidecars: bool,
+        profile_mode: str | None,
+        tags: dict[str, str],
+        data: bytes | None,
+    ) -> tuple[list[tuple[str, bytes | None]], dict | None, dict[str, tuple[int, int]]]:
+        """
+        Corre en el worker: codifica el trabajo y, si corresponde, agrega los
+        sidecars precomprimidos en el mismo paso, en paralelo con el resto.
+        Con 'profile_mode' el paso completo se perfila y se retorna el perfil.
+        También retorna lo medido por los trackers recibidos (vacío si el
+        worker es un hilo del mismo proceso).
+        """
+        def call() -> list[tuple[str, bytes | None]]:
+            outputs = encode(data)
+            return SidecarCompressor.expand(outputs) if sidecars else outputs
+
+        if not profile_mode:
+            return call(), None, ResourceTracker.collect_received()
+        outputs, profile = JobProfiler.run(profile_mode, call, JobProfiler.source_tags(data, tags))
+        return outputs, profile, ResourceTracker.collect_received()
+
+###############################################################################
+# RESPONSABILIDAD: Detectar con git qué orígenes cambiaron (builds incrementales)
+###############################################################################
+class GitChangeDetector:
+    """
+    Pregunta a git qué archivos cambiaron desde INCREMENTAL_SINCE, así el
+    trabajo de cada corrida es proporcional al diff y no al directorio. Se
+    cuentan los cambios commiteados desde la referencia, los del índice y del
+    árbol de trabajo ('git diff REF' compara contra el árbol, usando el stat
+    del índice) y los archivos nuevos sin seguimiento. Las salidas que no
+    existen también cuentan como cambio (p.e. en un clon nuevo, si no se
+    versionan): no aparecen en el diff, pero hay que generarlas. Si git no
+    está, el directorio no es un repositorio o cambió el propio script (sus
+    constantes afectan a todas las salidas), se procesa todo.
+    """
+
+    _scopes: dict[str, set[str] | None] = {}
+
+    @staticmethod
+    def _git(directory: str, *args: str) -> bytes | None:
+        """
+        Salida de 'git -C directory args...' (None si git falla o no existe).
+        """
+        try:
+            result = subprocess.run(
+                ["git", "-C", directory, *args],
+                capture_output=True,
+                check=True,
+                timeout=GIT_TIMEOUT_SECONDS,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout
+
+    @staticmethod
+    def changed_files(directory: str, since: str) -> set[str] | None:
+        """
+        Rutas absolutas de los archivos bajo 'directory' que cambiaron desde
+        'since' (incluye borrados y ambos lados de un renombre).
+        None si no se puede consultar a git o la referencia no existe.
+        """
+        diff = GitChangeDetector._git(
+            directory, "diff", "--name-only", "-z", "--no-renames", "--relative", since, "--", "."
+        )
+        untracked = GitChangeDetector._git(directory, "ls-files", "-z", "--others", "--exclude-standard", "--", ".")
+        if diff is None or untracked is None:
+            return None
+        return {
+            os.path.normpath(os.path.join(directory, os.fsdecode(name)))
+            for name in (diff + untracked).split(b"\0")
+            if name
+        }
+
+    @staticmethod
+    def scope(directory: str) -> set[str] | None:
+        """
+        Archivos cambiados que deben reprocesarse, o None para procesar todo
+        (sin INCREMENTAL_SINCE, sin git o con el script modificado). Se
+        consulta una sola vez por directorio y corrida.
+        """
+        if INCREMENTAL_SINCE is None:
+            return None
+        directory = os.path.abspath(directory)
+        if directory in GitChangeDetector._scopes:
+            return GitChangeDetector._scopes[directory]
+        changed = GitChangeDetector.changed_files(directory, INCREMENTAL_SINCE)
+        if changed is None:
+            print(f"⚠️ No se pudo consultar a git desde '{INCREMENTAL_SINCE}'; se procesa todo.")
+        elif os.path.abspath(__file__) in changed:
+            print("🔎 Cambió el script; se procesa todo.")
+            changed = None
+        else:
+            print(f"🔎 {len(changed)} archivo(s) cambiados desde '{INCREMENTAL_SINCE}'.")
+        GitChangeDetector._scopes[directory] = changed
+        return changed
+
+    @staticmethod
+    def touches(changed: set[str], directory: str, file_names) -> bool:
+        """
+        True si alguno de 'file_names' (relativos a 'directory') cambió.
+        """
+        directory = os.path.abspath(directory)
+        return any(os.path.normpath(os.path.join(directory, name)) in changed for name in file_names)
+
+    @staticmethod
+    def missing(directory: str, file_names) -> list[str]:
+        """
+        Los de 'file_names' (relativos a 'directory') que no existen.
+        """
+        return [name for name in file_names if not os.path.exists(os.path.join(directory, name))]
+
+    @staticmethod
+    def names_in(changed: set[str], directory: str, extensions: tuple[str, ...]) -> set[str]:
+        """
+        Nombres de los archivos cambiados que están directamente en
+        'directory' y terminan en alguna de 'extensions'.
+        """
+        directory = os.path.abspath(directory)
+        return {
+            os.path.basename(path)
+            for path in changed
+            if os.path.dirname(path) == directory and path.lower().endswith(extensions)
+        }
+
+###############################################################################
+# RESPONSABILIDAD: Convertir todos los archivos .webp a .ico
+###############################################################################
+class WebpToIcoConverter:
+    """
+    Convierte todos los .webp encontrados en el directorio en .ico,
+    siempre reemplazando si ya existía el archivo .ico.
+
+    Con 'isolate' cada archivo se convierte en un proceso con topes de tiempo
+    y memoria (IsolatedExecutor). Los archivos que fallan quedan en una lista
+    de cuarentena y se omiten en las corridas siguientes hasta que cambien.
+    """
+
+    def __init__(
+        self,
+        script_dir: str,
+        ico_size: int = 64,
+        tracker: ResourceTracker | None = None,
+        frame_selection: str | int = ANIMATION_FRAME_SELECTION,
+        isolate: bool = TASK_ISOLATION,
+    ):
+        self.script_dir = script_dir
+        self.ico_size = ico_size
+        self.tracker = tracker or ResourceTracker()
+        self.frame_selection = frame_selection
+        self.isolate = isolate
+        self.quarantine_path = os.path.join(script_dir, QUARANTINE_FILE)
+        self.decoded_cache = DecodedSourceCache(os.path.join(script_dir, DECODED_CACHE_DIR)) if DECODED_CACHE else None
+
+    async def convert_all_webp_to_ico(self) -> PipelineStats | None:
+        """
+        Busca todos los .webp en el directorio y los convierte a .ico
+        con el mismo nombre base, siempre sobrescribiendo el .ico.
+        Con INCREMENTAL_SINCE sólo se toman los que git reporta como cambiados.
+        La lectura, la codificación y la escritura corren en etapas solapadas.
+        Retorna las estadísticas del pipeline (None si no hubo nada que hacer).
+        """
+        changed = GitChangeDetector.scope(self.script_dir)
+        if changed is not None:
+            webp_files = self._changed_webp(changed)
+            if not webp_files:
+                print("🔎 Ningún .webp (ni su .ico) cambió; no hay nada que convertir.")
+                return
+        else:
+            webp_files = [
+                f for f in os.listdir(self.script_dir) if f.lower().endswith(".webp")
+            ]
+        if not webp_files:
+            print("No se encontraron archivos .webp en el directorio.")
+            return
+
+        quarantine = self._load_quarantine()
+        skipped = [f for f in webp_files if self._still_quarantined(quarantine, f)]
+        if skipped:
+            print(f"⏭️ {len(skipped)} archivo(s) en cuarentena sin cambios; se omiten (ver {QUARANTINE_FILE}).")
+            webp_files = [f for f in webp_files if f not in skipped]
+            if not webp_files:
+                return
+
+        size = (self.ico_size, self.ico_size)
+        expect = {
+            f"{os.path.splitext(f)[0]}.ico": OutputSpec("ICO", size, alpha=True, ico_sizes=(size,))
+            for f in webp_files
+        }
+        pipeline = StagedPipeline(tracker=self.tracker, isolate=self.isolate, expect=expect)
+        jobs = [
+            PipelineJob(
+                name=file_name,
+                source_path=os.path.join(self.script_dir, file_name),
+                encode=partial(
+                    WebpToIcoConverter._convert_single_webp,
+                    os.path.join(self.script_dir, f"{os.path.splitext(file_name)[0]}.ico"),
+                    self.ico_size,
+                    self.tracker,
+                    self.frame_selection,
+                    self.decoded_cache,
+                ),
+                priority="bulk",
+            )
+            for file_name in webp_files
+        ]
+        stats = await pipeline.run(jobs)
+        for path, reason in stats.quarantined:
+            print(f"🚫 En cuarentena: {os.path.basename(path)} ({reason})")
+        self._update_quarantine(quarantine, webp_files, stats)
+        print(stats.report())
+        print(self.tracker.report())
+        return stats
+
+    def _changed_webp(self, changed: set[str]) -> list[str]:
+        """
+        .webp a convertir en modo incremental: los que cambiaron y los que
+        tienen su .ico modificado, borrado o todavía sin generar. Los .webp
+        borrados se ignoran, igual que en la corrida completa.
+        """
+        names = GitChangeDetector.names_in(changed, self.script_dir, (".webp",))
+        for ico_name in GitChangeDetector.names_in(changed, self.script_dir, (".ico",)):
+            base = os.path.splitext(ico_name)[0]
+            names.update(f"{base}{ext}" for ext in (".webp", ".WEBP"))
+        webp_files = [f for f in os.listdir(self.script_dir) if f.lower().endswith(".webp")]
+        icos = {f"{os.path.splitext(f)[0]}.ico": f for f in webp_files}
+        names.update(icos[ico_name] for ico_name in GitChangeDetector.missing(self.script_dir, icos))
+        return sorted(f for f in names if os.path.isfile(os.path.join(self.script_dir, f)))
+
+    @staticmethod
+    def clear_quarantine(script_dir: str) -> int:
+        """
+        Vacía la cuarentena para que todos los archivos se reintenten.
+        Retorna cuántos había.
+        """
+        path = os.path.join(script_dir, QUARANTINE_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                count = len(json.load(fh))
+        except FileNotFoundError:
+            return 0
+        except ValueError:
+            count = 0
+        os.remove(path)
+        return count
+
+    def _load_quarantine(self) -> dict[str, dict]:
+        try:
+            with open(self.quarantine_path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _still_quarantined(self, quarantine: dict[str, dict], file_name: str) -> bool:
+        """
+        True si el archivo está en cuarentena y no cambió desde que falló.
+        """
+        entry = quarantine.get(file_name)
+        if not entry:
+            return False
+        stat = os.stat(os.path.join(self.script_dir, file_name))
+        return entry["mtime_ns"] == stat.st_mtime_ns and entry["bytes"] == stat.st_size
+
+    def _update_quarantine(self, quarantine: dict[str, dict], processed: list[str], stats: PipelineStats) -> None:
+        """
+        Quita de la cuarentena los archivos procesados (o borrados) y agrega
+        los que fallaron en esta corrida. Sólo escribe si algo cambió.
+        """
+        updated = {
+            file_name: entry for file_name, entry in quarantine.items()
+            if file_name not in processed and os.path.exists(os.path.join(self.script_dir, file_name))
+        }
+        for path, reason in stats.quarantined:
+            stat = os.stat(path)
+            updated[os.path.basename(path)] = {
+                "reason": reason, "mtime_ns": stat.st_mtime_ns, "bytes": stat.st_size,
+            }
+        if updated == quarantine:
+            return
+        os.makedirs(os.path.dirname(self.quarantine_path), exist_ok=True)
+        data = json.dumps(updated, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+        ImageIOManager.write_batch([(self.quarantine_path, data)], fsync=False)
+
+    @staticmethod
+    def _convert_single_webp(
+        ico_path: str,
+        ico_size: int,
+        tracker: ResourceTracker | None,
+        frame_selection: str | int,
+        decoded_cache: DecodedSourceCache | None,
+        data: bytes,
+    ) -> list[tuple[str, bytes]]:
+        """
+        Lógica interna para convertir un .webp (ya leído en 'data') en .ico,
+        redimensionado a 'ico_size', conservando transparencia.
+        Si el .webp es animado se usa el frame elegido por 'frame_selection'.
+        Con 'decoded_cache' los píxeles RGBA se toman de (o se guardan en) la
+        caché de decodificados.
+        Cada buffer intermedio se libera en cuanto deja de necesitarse.
+        Retorna la salida codificada para la etapa de escritura.
+        """
+        tracker = tracker or ResourceTracker()
+        cache_key = DecodedSourceCache.key(data, frame_selection) if decoded_cache else None
+        img = img_rgba = resized = None
+        try:
+            if cache_key:
+                img_rgba = decoded_cache.load(cache_key)
+            if img_rgba is not None:
+                tracker.track(img_rgba)
+            else:
+                img = ImageIOManager.decode_bytes(data, tracker)
+                AnimationFrames.seek_representative(img, frame_selection)
+
+                # Convertir a RGBA para mantener alpha si existe
+                img_rgba = tracker.track(ImageModeConverter.ensure_rgba(img))
+                if img_rgba is not img:
+                    tracker.release(img)
+                if cache_key:
+                    decoded_cache.store(cache_key, img_rgba)
+
+            # Redimensionar (por defecto a 64x64, salvo que se cambie la constante)
+            resized = tracker.track(ImageResizer.resize(img_rgba, (ico_size, ico_size)))
+            tracker.release(img_rgba)
+
+            # Codificar .ico (un solo tamaño)
+            return [(ico_path, ImageIOManager.encode_image(resized, "ICO", sizes=[(ico_size, ico_size)]))]
+        finally:
+            tracker.release(img, img_rgba, resized)
+
+###############################################################################
+# RESPONSABILIDAD: Generar íconos y previsualizaciones desde 'logo.png'
+###############################################################################
+class LogoAssetsGenerator:
+    """
+    Genera:
+      - favicon-16x16.png (16x16)
+      - favicon-32x32.png (32x32)
+      - apple-touch-icon.png (180x180)
+      - favicon.ico con múltiples tamaños (16,32,48,64)
+      - android-chrome-192x192.png / 512x512 (purpose "any")
+      - android-chrome-maskable-192x192.png / 512x512 (purpose "maskable")
+      - mstile-*.png (mosaicos de Windows)
+      - site.webmanifest (manifest PWA que referencia los íconos anteriores)
+      - preview.png  (mismo tamaño, manteniendo transparencia)
+      - preview.jpg  (mismo tamaño, sin transparencia, JPG no soporta alpha)
+      - preview.webp (mismo tamaño, manteniendo transparencia)
+    Siempre sobrescribe si el archivo ya existe.
+
+    El logo se decodifica y se pasa a RGBA una única vez. A partir de esa copia
+    se arma una pirámide con cada tamaño distinto que piden los destinos, y
+    esos frames se comparten entre todos (p.e. el 16x16 sirve al PNG y al ICO).
+    Con procesos, la base y la pirámide se publican como SharedFrame y cada
+    worker las mapea sin que los frames viajen serializados.
+
+    En modo SVG no se reduce ningún bitmap: cada frame de la pirámide se
+    rasteriza directamente a su tamaño desde 'logo.svg' (con caché en disco).
+    """
+
+    def __init__(
+        self,
+        script_dir: str,
+        logo_filename: str = "logo.png",
+        tracker: ResourceTracker | None = None,
+        use_processes: bool = PIPELINE_USE_PROCESSES,
+        svg_filename: str | None = None,
+    ):
+        self.script_dir = script_dir
+        self.logo_filename = logo_filename
+        self.logo_path = os.path.join(script_dir, logo_filename)
+        self.tracker = tracker or ResourceTracker()
+        self.use_processes = use_processes
+        self.svg_filename = svg_filename
+        self.svg_path = os.path.join(script_dir, svg_filename) if svg_filename else None
+        self.svg_cache = SvgRenderCache(os.path.join(script_dir, SVG_RENDER_CACHE_DIR), self.tracker)
+        self.decoded_cache = DecodedSourceCache(os.path.join(script_dir, DECODED_CACHE_DIR)) if DECODED_CACHE else None
+        self.metrics = PipelineMetrics()
+
+    async def generate_all_assets(self) -> PipelineStats | None:
+        """
+        Genera todos los archivos de íconos y previews, siempre reemplazando.
+        Cada destino se codifica en paralelo y se escribe en la etapa de escritura.
+        Con INCREMENTAL_SINCE se omite si no cambió el logo ni ninguna salida
+        y todas las salidas existen.
+        Retorna las estadísticas del pipeline (None si no se pudo abrir el logo).
+        """
+        svg_backend = self._svg_backend()
+        source_name = self.svg_filename if svg_backend else self.logo_filename
+        if not svg_backend and not os.path.exists(self.logo_path):
+            print(f"❌ No se encontró '{self.logo_filename}' en el directorio.")
+            return
+        raster_source = None if svg_backend else self.logo_path
+        changed = GitChangeDetector.scope(self.script_dir)
+        if changed is not None:
+            missing = GitChangeDetector.missing(self.script_dir, self._outputs(raster_source))
+            if missing:
+                print(f"🔎 Faltan {len(missing)} salida(s) (p.e. '{missing[0]}'); se regenera el set.")
+            elif not GitChangeDetector.touches(changed, self.script_dir, self._dependencies()):
+                print("🔎 El logo y sus salidas no cambiaron; no hay nada que regenerar.")
+                return
+
+        frames: dict = {}
+        tags: dict[str, str] = {}
+        try:
+            if svg_backend:
+                await self._render_svg_frames(frames, svg_backend)
+                tags = {"format": "SVG", "size": "x".join(map(str, SVG_PREVIEW_SIZE)), "mode": svg_backend}
+            else:
+                data = await asyncio.to_thread(ImageIOManager.read_bytes, self.logo_path, self.tracker)
+                tags = JobProfiler.source_tags(data, tags)
+                frames["base"] = await asyncio.to_thread(self._decode_rgba, data)
+                frames.update(await self._build_pyramid(frames["base"]))
+        except Exception as e:
+            self.tracker.release(*frames.values())
+            print(f"❌ Error abriendo '{source_name}': {e}")
+            return
+
+        pipeline = StagedPipeline(
+            use_processes=self.use_processes, tracker=self.tracker, metrics=self.metrics,
+            expect=self._expected_outputs(),
+        )
+        shared: list[SharedFrame] = []
+        try:
+            if self.use_processes:
+                # Los workers mapean los píxeles; las copias locales ya no hacen falta
+                sources = {}
+                for key, img in frames.items():
+                    shared.append(SharedFrame.publish(img))
+                    sources[key] = shared[-1].ref
+                    self.tracker.release(img)
+            else:
+                sources = frames
+            stats = await pipeline.run(self._build_jobs(sources, raster_source, tags))
+        finally:
+            self.tracker.release(*frames.values())
+            for frame in shared:
+                frame.unlink()
+        print(stats.report())
+        print(self.tracker.report())
+        return stats
+
+    def _decode_rgba(self, data: bytes) -> Image.Image:
+        """
+        Decodifica el logo y lo deja en RGBA, liberando el original si hizo falta convertir.
+        Con la caché de decodificados activa, se mapea desde ahí si ya estaba.
+        """
+        cache_key = DecodedSourceCache.key(data, ANIMATION_FRAME_SELECTION) if self.decoded_cache else None
+        if cache_key:
+            cached = self.decoded_cache.load(cache_key)
+            self.metrics.inc(f"ico4x4_cache_{'hits' if cached else 'misses'}_total", cache="decoded")
+            if cached is not None:
+                return self.tracker.track(cached)
+        img = ImageIOManager.decode_bytes(data, self.tracker)
+        try:
+            AnimationFrames.seek_representative(img, ANIMATION_FRAME_SELECTION)
+            img_rgba = self.tracker.track(ImageModeConverter.ensure_rgba(img))
+        except BaseException:
+            self.tracker.release(img)
+            raise
+        if img_rgba is not img:
+            self.tracker.release(img)
+        if cache_key:
+            self.decoded_cache.store(cache_key, img_rgba)
+        return img_rgba
+
+    @staticmethod
+    def _maskable_inner_size(size: int) -> tuple[int, int]:
+        """
+        Tamaño del logo dentro de un ícono maskable de 'size' px: el cuadrado
+        cuya diagonal entra en el círculo seguro (se redondea hacia abajo).
+        """
+        inner = max(1, int(size * 2 * MASKABLE_SAFE_ZONE_RADIUS / 2 ** 0.5))
+        return (inner, inner)
+
+    @staticmethod
+    def _expected_outputs() -> dict[str, OutputSpec]:
+        """
+        Formato, tamaño y alpha de cada ícono, para verificarlos tras escribirlos.
+        Los previews se controlan sólo por formato (dependen del logo).
+        """
+        expect = {
+            filename: OutputSpec("PNG", size, alpha=True)
+            for filename, size in [
+                (FAVICON_16, FAVICON_16_SIZE),
+                (FAVICON_32, FAVICON_32_SIZE),
+                (APPLE_TOUCH_ICON, APPLE_TOUCH_ICON_SIZE),
+            ]
+        }
+        ico_sizes = tuple((s, s) for s in FAVICON_ICO_SIZES)
+        expect[FAVICON_ICO] = OutputSpec("ICO", max(ico_sizes), alpha=True, ico_sizes=ico_sizes)
+        for size in PWA_ICON_SIZES:
+            expect[PWA_ICON_PATTERN.format(size=size)] = OutputSpec("PNG", (size, size), alpha=True)
+            expect[PWA_MASKABLE_PATTERN.format(size=size)] = OutputSpec("PNG", (size, size))
+        for filename, canvas_size, _ in MSTILE_TARGETS:
+            expect[filename] = OutputSpec("PNG", canvas_size)
+        expect[PREVIEW_JPG] = OutputSpec("JPEG", alpha=False)
+        return expect
+
+    def _outputs(self, raster_source: str | None) -> list[str]:
+        """
+        Archivos que escribe una corrida completa; los previews animados,
+        sólo si el logo raster es animado.
+        """
+        outputs = [*LogoAssetsGenerator._expected_outputs(), PREVIEW_PNG, PREVIEW_WEBP, WEB_MANIFEST]
+        if raster_source and self._is_animated(raster_source):
+            outputs += [ANIMATED_PREVIEW_WEBP, ANIMATED_PREVIEW_APNG]
+        return outputs
+
+    def _dependencies(self) -> list[str]:
+        """
+        Archivos que obligan a regenerar todo el set: los orígenes (PNG y SVG)
+        y cada salida (si alguien la editó o borró).
+        """
+        return [
+            self.logo_filename,
+            *([self.svg_filename] if self.svg_filename else []),
+            *LogoAssetsGenerator._expected_outputs(),
+            PREVIEW_PNG,
+            PREVIEW_WEBP,
+            ANIMATED_PREVIEW_WEBP,
+            ANIMATED_PREVIEW_APNG,
+            WEB_MANIFEST,
+        ]
+
+    def _pyramid_sizes(self) -> set[tuple[int, int]]:
+        """
+        Todos los tamaños distintos del logo que necesitan los destinos.
+        """
+        sizes = {FAVICON_16_SIZE, FAVICON_32_SIZE, APPLE_TOUCH_ICON_SIZE}
+        sizes.update((s, s) for s in FAVICON_ICO_SIZES)
+        sizes.update((s, s) for s in PWA_ICON_SIZES)
+        sizes.update(self._maskable_inner_size(s) for s in PWA_ICON_SIZES)
+        sizes.update(logo_size for _, _, logo_size in MSTILE_TARGETS)
+        return sizes
+
+    async def _build_pyramid(self, img_rgba: Image.Image) -> dict[tuple[int, int], Image.Image]:
+        """
+        Etapa de pirámide: calcula en paralelo cada tamaño una única vez. Los
+        que salen del logo comparten una única copia premultiplicada; los
+        chicos se derivan del tamaño ya calculado más cercano.
+        """
+        parents = ImageResizer.chain_sources(img_rgba.size, list(self._pyramid_sizes()))
+        # La copia premultiplicada se registra en el tracker, así que el pico
+        # registrado suma un logo completo más; en cambio reemplaza la copia
+        # RGBa que Pillow hace por dentro en cada resize de RGBA (una por
+        # tarea en paralelo, que el tracker no ve), y el RSS real baja.
+        source = self.tracker.track(await asyncio.to_thread(ImageResizer.premultiply, img_rgba))
+        tasks: dict[tuple[int, int], asyncio.Task] = {}
+
+        async def derive(size: tuple[int, int]) -> Image.Image:
+            parent = parents[size]
+            base = source if parent is None else await tasks[parent]
+            return await asyncio.to_thread(ImageResizer.resize, base, size)
+
+        for size in parents:
+            tasks[size] = asyncio.create_task(derive(size))
+        try:
+            resized = await asyncio.gather(*tasks.values())
+        finally:
+            if source is not img_rgba:
+                self.tracker.release(source)
+        return {size: self.tracker.track(img) for size, img in zip(tasks, resized)}
+
+    def _svg_backend(self) -> str | None:
+        """
+        Retorna el rasterizador a usar si corresponde el modo SVG, o None para
+        trabajar desde el logo raster.
+        """
+        if not self.svg_path:
+            return None
+        if not os.path.exists(self.svg_path):
+            print(f"⚠️ No se encontró '{self.svg_filename}'; se usa '{self.logo_filename}'.")
+            return None
+        backend = SvgRasterizer.available_backend()
+        if not backend:
+            print(
+                "⚠️ No hay rasterizador SVG disponible (cairosvg, rsvg-convert, inkscape o magick); "
+                f"se usa '{self.logo_filename}'."
+            )
+        return backend
+
+    async def _render_svg_frames(self, frames: dict, backend: str) -> None:
+        """
+        Modo SVG: rasteriza la base de los previews y cada tamaño de la pirámide
+        directamente desde el SVG, en paralelo y pasando por la caché en disco.
+        Completa 'frames' en el lugar para que el llamador pueda liberar lo ya
+        decodificado si algo falla.
+        """
+        svg_data = await asyncio.to_thread(ImageIOManager.read_bytes, self.svg_path, self.tracker)
+        svg_hash = hashlib.sha256(svg_data).hexdigest()
+
+        def render(size: tuple[int, int]) -> Image.Image:
+            return self._decode_rgba(self.svg_cache.render(svg_data, svg_hash, size, backend))
+
+        keys = ["base", *sorted(self._pyramid_sizes())]
+        sizes = [SVG_PREVIEW_SIZE if key == "base" else key for key in keys]
+        results = await asyncio.gather(
+            *(asyncio.to_thread(render, size) for size in sizes), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for key, result in zip(keys, results):
+            if not isinstance(result, BaseException):
+                frames[key] = result
+        print(f"🖼️ SVG rasterizado con {backend}: {self.svg_cache.hits} en caché, {self.svg_cache.misses} nuevos")
+        self.metrics.inc("ico4x4_cache_hits_total", self.svg_cache.hits, cache="svg")
+        self.metrics.inc("ico4x4_cache_misses_total", self.svg_cache.misses, cache="svg")
+        if errors:
+            raise errors[0]
+
+    def _build_jobs(
+        self, sources: dict, raster_source: str | None = None, tags: dict[str, str] | None = None
+    ) -> list[PipelineJob]:
+        """
+        Arma un trabajo por destino, pasando sólo los frames que cada uno usa.
+        Los previews van en un único trabajo porque guardan directamente la
+        imagen base y Pillow no admite guardar el mismo objeto desde dos hilos
+        a la vez. 'tags' describe el logo de origen para los perfiles.
+        """
+        tags = tags or {}
+
+        def job(name: str, target: Callable, keys: list, args: tuple = (), source_path: str | None = None) -> PipelineJob:
+            needed = {key: sources[key] for key in keys}
+            with_data = source_path is not None
+            cost = sum(frame.size[0] * frame.size[1] for frame in needed.values())
+            return PipelineJob(
+                name, source_path, partial(self._run_on_frames, target, needed, args, with_data), tags,
+                priority="interactive", cost=cost,
+            )
+
+        jobs = [
+            job(filename, self._generate_png_icon, [size], (filename, size))
+            for filename, size in [
+                (FAVICON_16, FAVICON_16_SIZE),
+                (FAVICON_32, FAVICON_32_SIZE),
+                (APPLE_TOUCH_ICON, APPLE_TOUCH_ICON_SIZE),
+            ]
+        ]
+        jobs.append(job(FAVICON_ICO, self._generate_favicon_ico, [(s, s) for s in FAVICON_ICO_SIZES]))
+        for size in PWA_ICON_SIZES:
+            filename = PWA_ICON_PATTERN.format(size=size)
+            jobs.append(job(filename, self._generate_png_icon, [(size, size)], (filename, (size, size))))
+            filename = PWA_MASKABLE_PATTERN.format(size=size)
+            jobs.append(job(filename, self._generate_maskable_icon, [self._maskable_inner_size(size)], (filename, size)))
+        for filename, canvas_size, logo_size in MSTILE_TARGETS:
+            jobs.append(job(filename, self._generate_mstile, [logo_size], (filename, canvas_size, logo_size)))
+        jobs.append(job(WEB_MANIFEST, self._generate_web_manifest, []))
+        # Los previews reciben los bytes del logo raster (si lo hay) para poder
+        # copiarlos tal cual o compararlos con la recodificación
+        jobs.append(job("previews", self._generate_preview_images, ["base"], source_path=raster_source))
+        if raster_source and self._is_animated(raster_source):
+            jobs.append(PipelineJob(
+                "previews animados", raster_source, self._generate_animated_previews, tags, priority="interactive"
+            ))
+        return jobs
+
+    @staticmethod
+    def _is_animated(path: str) -> bool:
+        """
+        True si el logo tiene más de un frame (sólo lee el encabezado).
+        False si no se puede abrir: el error se informa al decodificarlo.
+        """
+        try:
+            with Image.open(path) as img:
+                return AnimationFrames.frame_count(img) > 1
+        except (OSError, SyntaxError):
+            return False
+
+    def _generate_animated_previews(self, data: bytes) -> list[tuple[str, bytes]]:
+        """
+        Genera 'preview-animated.webp' y 'preview-animated.png' (APNG) reducidos
+        a ANIMATED_PREVIEW_MAX_SIDE. Los frames se decodifican y se reducen de a
+        uno: el APNG se comprime frame por frame (ApngWriter) y, para el WebP,
+        cada frame se vuelca al FrameSpool, que libwebp recorre al final de a
+        un frame, guardando sólo los ya comprimidos. La memoria crece con el
+        tamaño de las salidas comprimidas, no con los píxeles de la animación.
+        """
+        img = ImageIOManager.decode_bytes(data, self.tracker)
+        spool = None
+        try:
+            scale = min(1.0, ANIMATED_PREVIEW_MAX_SIDE / max(img.size))
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            spool = FrameSpool("RGBA", size)
+            loop = img.info.get("loop", 0)
+            apng_writer = ApngWriter(loop)
+            for _, frame in AnimationFrames.iter_frames(img):
+                frame_rgba = ImageModeConverter.ensure_rgba(frame)
+                resized = ImageResizer.resize(frame_rgba, size)
+                duration = frame.info.get("duration", 100)
+                spool.append(resized, duration)
+                apng_writer.add(resized, duration)
+                resized.close()
+                if frame_rgba is not frame:
+                    frame_rgba.close()
+            self.tracker.release(img)
+
+            with spool.open() as frames:
+                webp = ImageIOManager.encode_image(
+                    frames, "WEBP", quality=90, save_all=True, duration=spool.durations, loop=loop
+                )
+            apng = apng_writer.getvalue()
+            return [
+                (os.path.join(self.script_dir, ANIMATED_PREVIEW_WEBP), webp),
+                (os.path.join(self.script_dir, ANIMATED_PREVIEW_APNG), apng),
+            ]
+        finally:
+            self.tracker.release(img)
+            if spool:
+                spool.close()
+
+    def _run_on_frames(
+        self,
+        target: Callable[..., list[tuple[str, bytes]]],
+        sources: dict,
+        args: tuple,
+        with_data: bool = False,
+        data: bytes | None = None,
+    ) -> list[tuple[str, bytes]]:
+        """
+        Ejecuta 'target' con los frames pedidos, ya sean los compartidos en
+        memoria (hilos) o los mapeados desde SharedFrame (procesos). Con
+        'with_data', además recibe los bytes leídos por la etapa de lectura.
+        """
+        with ExitStack() as stack:
+            frames = {key: stack.enter_context(SharedFrame.attach(src)) for key, src in sources.items()}
+            return target(frames, *args, *((data,) if with_data else ()))
+
+    def _encode_png(self, img: Image.Image, filename: str) -> list[tuple[str, bytes]]:
+        """
+        Codifica 'img' como PNG en 'filename' y libera la imagen.
+        """
+        out_path = os.path.join(self.script_dir, filename)
+        try:
+            return [(out_path, ImageIOManager.encode_image(img, "PNG", quality=95))]
+        finally:
+            self.tracker.release(img)
+
+    def _generate_png_icon(self, frames: dict, filename: str, size: tuple[int, int]) -> list[tuple[str, bytes]]:
+        """
+        Genera un ícono PNG (favicon-16x16.png, apple-touch-icon.png,
+        android-chrome-*.png, ...), manteniendo transparencia si existe.
+        Se codifica una copia porque el frame de la pirámide es compartido.
+        """
+        return self._encode_png(self.tracker.track(frames[size].copy()), filename)
+
+    def _generate_maskable_icon(self, frames: dict, filename: str, size: int) -> list[tuple[str, bytes]]:
+        """
+        Genera un ícono "maskable": el logo reducido a la zona segura y
+        centrado sobre un fondo opaco que cubre todo el ícono.
+        """
+        canvas = IconCanvas.pad(frames[self._maskable_inner_size(size)], (size, size), MASKABLE_BACKGROUND)
+        return self._encode_png(self.tracker.track(canvas), filename)
+
+    def _generate_mstile(
+        self, frames: dict, filename: str, canvas_size: tuple[int, int], logo_size: tuple[int, int]
+    ) -> list[tuple[str, bytes]]:
+        """
+        Genera un mosaico de Windows con el logo centrado sobre fondo transparente.
+        """
+        canvas = IconCanvas.pad(frames[logo_size], canvas_size, (0, 0, 0, 0))
+        return self._encode_png(self.tracker.track(canvas), filename)
+
+    def _generate_web_manifest(self, frames: dict) -> list[tuple[str, bytes]]:
+        """
+        Genera 'site.webmanifest' con los íconos "any" y "maskable". Las URLs
+        salen de la ruta de cada ícono dentro del sitio (ver SitePaths), así
+        que sirven desde cualquier carpeta de 'public/'.
+        """
+        icons = []
+        for size in PWA_ICON_SIZES:
+            for pattern, purpose in ((PWA_ICON_PATTERN, "any"), (PWA_MASKABLE_PATTERN, "maskable")):
+                icon_path = os.path.join(self.script_dir, pattern.format(size=size))
+                icons.append({
+                    "src": SitePaths.url_path(icon_path, self.script_dir),
+                    "sizes": f"{size}x{size}",
+                    "type": "image/png",
+                    "purpose": purpose,
+                })
+        manifest = {
+            "name": WEB_MANIFEST_NAME,
+            "short_name": WEB_MANIFEST_SHORT_NAME,
+            "icons": icons,
+            "theme_color": WEB_MANIFEST_THEME_COLOR,
+            "background_color": WEB_MANIFEST_BACKGROUND_COLOR,
+            "display": "standalone",
+        }
+        data = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8") + b"\n"
+        return [(os.path.join(self.script_dir, WEB_MANIFEST), data)]
+
+    def _generate_favicon_ico(self, frames: dict) -> list[tuple[str, bytes]]:
+        """
+        Genera el archivo .ico (favicon.ico) con múltiples tamaños (FAVICON_ICO_SIZES).
+        Mantiene transparencia si la hubiera.
+        """
+        ico_path = os.path.join(self.script_dir, FAVICON_ICO)
+        # Pillow guarda cada frame adjunto, así que se trabaja sobre copias
+        icon_list = [self.tracker.track(frames[(s, s)].copy()) for s in FAVICON_ICO_SIZES]
+        try:
+            # Pillow descarta los tamaños mayores que la imagen base, así que se
+            # guarda desde el frame más grande y se adjuntan los ya redimensionados.
+            largest = max(icon_list, key=lambda frame: frame.width)
+            data = ImageIOManager.encode_image(
+                largest,
+                "ICO",
+                sizes=[(s, s) for s in FAVICON_ICO_SIZES],
+                append_images=[frame for frame in icon_list if frame is not largest],
+            )
+            return [(ico_path, data)]
+        finally:
+            self.tracker.release(*icon_list)
+
+    def _generate_preview_images(self, frames: dict, source_data: bytes | None = None) -> list[tuple[str, bytes]]:
+        """
+        Genera:
+          - preview.png  (mismo tamaño que el original, conservando transparencia)
+          - preview.jpg  (mismo tamaño, sin transparencia, JPG no la soporta)
+          - preview.webp (mismo tamaño, manteniendo transparencia)
+        Siempre sobrescribe si existían. Con 'source_data' (bytes del logo
+        raster) cada preview pasa por OutputSizeGuard.
+        """
+        img_rgba = frames["base"]
+        probe = OutputSizeGuard.probe(source_data) if source_data else None
+        return (
+            self._generate_preview_png(img_rgba, source_data, probe)
+            + self._generate_preview_jpg(img_rgba, source_data, probe)
+            + self._generate_preview_webp(img_rgba, source_data, probe)
+        )
+
+    def _guarded_encode(
+        self,
+        img: Image.Image,
+        img_format: str,
+        name: str,
+        source_data: bytes | None,
+        probe: "SourceProbe | None",
+        **kwargs,
+    ) -> bytes:
+        """
+        Codifica 'img' salvo que el origen ya sirva tal cual; si se recodifica
+        en el mismo formato, se queda con la variante más chica. Con
+        DETERMINISTIC_OUTPUT el origen también se usa sin metadatos, salvo
+        que eso le quite un perfil ICC que no es sRGB: entonces siempre se
+        recodifica 'img' (ya convertida a sRGB).
+        """
+        if probe and DETERMINISTIC_OUTPUT and MetadataStripper.drops_color_profile(probe.icc_profile):
+            if probe.format == img_format:
+                print(f"🎨 {name}: el origen tiene un perfil ICC que no es sRGB y se quitaría; se recodifica en sRGB.")
+            probe = None
+        if probe and DETERMINISTIC_OUTPUT:
+            source_data = MetadataStripper.strip(source_data, probe.format)
+        if probe and OutputSizeGuard.can_passthrough(probe, img_format, img.size):
+            print(f"⏩ {name}: mismo tamaño y formato que el origen; se copian sus bytes sin recodificar.")
+            return source_data
+        encoded = ImageIOManager.encode_image(img, img_format, **kwargs)
+        if probe:
+            return OutputSizeGuard.pick_smaller(name, source_data, probe, encoded, img_format, img.size)
+        return encoded
+
+    def _generate_preview_png(
+        self, img_rgba: Image.Image, source_data: bytes | None = None, probe: "SourceProbe | None" = None
+    ) -> list[tuple[str, bytes]]:
+        """
+        Crea 'preview.png' con el mismo tamaño y manteniendo transparencia.
+        """
+        out_path = os.path.join(self.script_dir, PREVIEW_PNG)
+        # Se deja el mismo tamaño; no se redimensiona
+        data = self._guarded_encode(img_rgba, "PNG", PREVIEW_PNG, source_data, probe, quality=95)
+        return [(out_path, data)]
+
+    def _generate_preview_jpg(
+        self, img_rgba: Image.Image, source_data: bytes | None = None, probe: "SourceProbe | None" = None
+    ) -> list[tuple[str, bytes]]:
+        """
+        Crea 'preview.jpg' con el mismo tamaño.
+        El formato JPG no soporta transparencia, así que se pasa a RGB.
+        """
+        out_path = os.path.join(self.script_dir, PREVIEW_JPG)
+        img_rgb = self.tracker.track(ImageModeConverter.ensure_rgb(img_rgba))
+        try:
+            data = self._guarded_encode(img_rgb, "JPEG", PREVIEW_JPG, source_data, probe, quality=95)
+            return [(out_path, data)]
+        finally:
+            self.tracker.release(img_rgb)
+
+    def _generate_preview_webp(
+        self, img_rgba: Image.Image, source_data: bytes | None = None, probe: "SourceProbe | None" = None
+    ) -> list[tuple[str, bytes]]:
+        """
+        Crea 'preview.webp' con el mismo tamaño y mantiene transparencia (WEBP sí soporta).
+        """
+        out_path = os.path.join(self.script_dir, PREVIEW_WEBP)
+        data = self._guarded_encode(img_rgba, "WEBP", PREVIEW_WEBP, source_data, probe, quality=95)
+        return [(out_path, data)]
+
+
+###############################################################################
+# RESPONSABILIDAD: Leer el front matter de los posts del blog
+###############################################################################
+class PostFrontMatter:
+    """
+    Lector mínimo del front matter YAML de los posts (bloque entre '---').
+    Sólo interpreta pares 'clave: valor' de una línea, que es lo que usan
+    los posts de /blogs; las listas (p.e. keywords) se ignoran.
+    """
+
+    @staticmethod
+    def parse(text: str) -> dict[str, str]:
+        """
+        Retorna el front matter de 'text' como diccionario de cadenas.
+        """
+        lines = text.lstrip("﻿").splitlines()
+        if not lines or lines[0].strip() != "---":
+            return {}
+        values: dict[str, str] = {}
+        for line in lines[1:]:
+            if line.strip() == "---":
+                break
+            key, sep, value = line.partition(":")
+            if not sep or line[:1].isspace() or not value.strip():
+                continue
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            values[key.strip()] = value
+        return values
+
+    @staticmethod
+    def slug(file_name: str) -> str:
+        """
+        Slug del post igual al que arma services/blog/blogService.js:
+        sin extensión y sin el prefijo numérico ("10. Mi-Post.md" -> "Mi-Post").
+        """
+        base_name = re.sub(r"\.(md|mdx)$", "", file_name)
+        return re.sub(r"^(\d+)\.\s*", "", base_name)
+
+###############################################################################
+# RESPONSABILIDAD: Generar tarjetas Open Graph por post del blog
+###############################################################################
+class SocialCardGenerator:
+    """
+    Genera una tarjeta social (1200x630 por defecto) por cada post de /blogs,
+    con fondo, logo, título, descripción y autor/fecha del front matter.
+
+    Las tarjetas se codifican en paralelo con el mismo pipeline por etapas y
+    se cachean por hash del contenido del post (más el logo y el diseño), de
+    modo que sólo se vuelven a generar los posts editados.
+    """
+
+    def __init__(
+        self,
+        script_dir: str,
+        posts_dir: str = SOCIAL_CARDS_POSTS_DIR,
+        output_dir: str = SOCIAL_CARDS_OUTPUT_DIR,
+        logo_filename: str = LOGO_FILENAME,
+        tracker: ResourceTracker | None = None,
+        use_processes: bool = PIPELINE_USE_PROCESSES,
+    ):
+        self.script_dir = script_dir
+        self.posts_dir = os.path.normpath(os.path.join(SitePaths.repo_root(script_dir), posts_dir))
+        self.output_dir = os.path.normpath(os.path.join(script_dir, output_dir))
+        self.logo_path = os.path.join(script_dir, logo_filename)
+        self.cache_path = os.path.join(script_dir, SOCIAL_CARDS_CACHE_FILE)
+        self.tracker = tracker or ResourceTracker()
+        self.use_processes = use_processes
+
+    async def generate_all_cards(self) -> PipelineStats | None:
+        """
+        Genera (o reutiliza desde la caché) la tarjeta de cada post.
+        Retorna las estadísticas del pipeline (None si no hubo nada que generar).
+        """
+        if not os.path.isdir(self.posts_dir):
+            print(f"❌ No se encontró la carpeta de posts: {self.posts_dir}")
+            return
+
+        try:
+            logo_data = await asyncio.to_thread(ImageIOManager.read_bytes, self.logo_path, self.tracker)
+        except Exception as e:
+            print(f"❌ Error abriendo el logo para las tarjetas: {e}")
+            return
+
+        posts = await asyncio.to_thread(self._discover_posts, logo_data)
+        cache = self._load_cache()
+        pending = [
+            post for post in posts
+            if cache.get(post["slug"]) != post["hash"] or not os.path.exists(post["out_path"])
+        ]
+        print(f"🃏 {len(posts)} posts, {len(posts) - len(pending)} tarjetas al día, {len(pending)} por generar.")
+        metrics = PipelineMetrics()
+        metrics.inc("ico4x4_cache_hits_total", len(posts) - len(pending), cache="og-cards")
+        metrics.inc("ico4x4_cache_misses_total", len(pending), cache="og-cards")
+        if not pending:
+            return
+
+        logo = frame = None
+        try:
+            logo = await asyncio.to_thread(self._prepare_logo, logo_data)
+            if self.use_processes:
+                frame = SharedFrame.publish(logo)
+                self.tracker.release(logo)
+                logo_source = frame.ref
+            else:
+                logo_source = logo
+
+            os.makedirs(self.output_dir, exist_ok=True)
+            jobs = [
+                PipelineJob(
+                    post["file_name"],
+                    None,
+                    partial(SocialCardGenerator._render_card, post["front_matter"], logo_source, post["out_path"]),
+                )
+                for post in pending
+            ]
+            pipeline = StagedPipeline(use_processes=self.use_processes, tracker=self.tracker, metrics=metrics)
+            stats = await pipeline.run(jobs)
+        finally:
+            self.tracker.release(logo)
+            if frame:
+                frame.unlink()
+
+        # Las que no pasaron la verificación se regeneran en la próxima corrida
+        written = set(stats.written_paths) - {path for path, _ in stats.verify_failed}
+        for post in pending:
+            if post["out_path"] in written:
+                cache[post["slug"]] = post["hash"]
+        self._save_cache(cache)
+        print(stats.report())
+        print(self.tracker.report())
+        return stats
+
+    def _discover_posts(self, logo_data: bytes) -> list[dict]:
         """
-        Genera:
-          - preview.png  (mismo tamaño que el original, conservando transparencia)
-          - preview.jpg  (mismo tamaño, sin transparencia, JPG no la soporta)
-          - preview.webp (mismo tamaño, manteniendo transparencia)
-        Siempre sobrescribe si existían.
+        Lista los posts .md/.mdx y calcula la clave de caché de cada uno:
+        contenido del post + logo + parámetros de diseño y de codificación.
         """
-        await self._generate_preview_png(base_img)
-        await self._generate_preview_jpg(base_img)
-        await self._generate_preview_webp(base_img)
+        design = repr((SOCIAL_CARD_SIZE, SOCIAL_CARD_BACKGROUND, SOCIAL_CARD_TEXT_COLOR,
+                       SOCIAL_CARD_MUTED_COLOR, SOCIAL_CARD_LOGO_SIZE, SOCIAL_CARD_FONT,
+                       OUTPUT_ENCODER_OPTIONS.get("PNG"))).encode("utf-8")
+        base_hash = hashlib.sha256(logo_data + design).digest()
+
+        posts = []
+        for file_name in sorted(os.listdir(self.posts_dir)):
+            if not file_name.endswith((".md", ".mdx")):
+                continue
+            content = ImageIOManager.read_bytes(os.path.join(self.posts_dir, file_name), self.tracker)
+            slug = PostFrontMatter.slug(file_name)
+            posts.append({
+                "file_name": file_name,
+                "slug": slug,
+                "hash": hashlib.sha256(base_hash + content).hexdigest(),
+                "front_matter": PostFrontMatter.parse(content.decode("utf-8", "replace")),
+                "out_path": os.path.join(self.output_dir, f"{slug}.png"),
+            })
+        return posts
 
-    async def _generate_preview_png(self, base_img: Image.Image) -> None:
+    def _prepare_logo(self, logo_data: bytes) -> Image.Image:
         """
-        Crea 'preview.png' con el mismo tamaño y manteniendo transparencia.
+        Decodifica el logo una sola vez y lo deja al tamaño de la tarjeta.
         """
-        out_path = os.path.join(self.script_dir, PREVIEW_PNG)
+        img = ImageIOManager.decode_bytes(logo_data, self.tracker)
+        img_rgba = self.tracker.track(ImageModeConverter.ensure_rgba(img))
         try:
-            # Aseguramos RGBA para un PNG con alpha si aplica
-            img_rgba = ImageModeConverter.ensure_rgba(base_img)
-            # Se deja el mismo tamaño; no se redimensiona
-            ImageIOManager.save_image(img_rgba, out_path, "PNG", quality=95)
-            print(f"✅ Generado (reemplazado): {PREVIEW_PNG}")
-        except Exception as e:
-            print(f"❌ Error generando '{PREVIEW_PNG}': {e}")
+            return self.tracker.track(ImageResizer.resize(img_rgba, (SOCIAL_CARD_LOGO_SIZE, SOCIAL_CARD_LOGO_SIZE)))
+        finally:
+            self.tracker.release(img, img_rgba)
+
+    def _load_cache(self) -> dict[str, str]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: dict[str, str]) -> None:
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        data = json.dumps(cache, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+        ImageIOManager.write_batch([(self.cache_path, data)], fsync=False)
 
-    async def _generate_preview_jpg(self, base_img: Image.Image) -> None:
+    @staticmethod
+    def _load_font(size: int) -> ImageFont.ImageFont:
         """
-        Crea 'preview.jpg' con el mismo tamaño.
-        El formato JPG no soporta transparencia, así que se pasa a RGB.
+        Carga SOCIAL_CARD_FONT (o una fuente TrueType común) en 'size' px.
+        Si no hay ninguna, usa la fuente por defecto de Pillow.
         """
-        out_path = os.path.join(self.script_dir, PREVIEW_JPG)
+        candidates = [SOCIAL_CARD_FONT] if SOCIAL_CARD_FONT else []
+        candidates += [
+            "DejaVuSans-Bold.ttf",
+            "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+            "Arial Bold.ttf",
+            "arialbd.ttf",
+        ]
+        for candidate in candidates:
+            try:
+                return ImageFont.truetype(candidate, size)
+            except OSError:
+                continue
+        return ImageFont.load_default(size=size)
+
+    @staticmethod
+    def _wrap(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, width: int, max_lines: int) -> list[str]:
+        """
+        Parte 'text' en líneas que entran en 'width' px; corta con '…' si sobra.
+        """
+        lines: list[str] = []
+        current = ""
+        for word in text.split():
+            candidate = f"{current} {word}".strip()
+            if draw.textlength(candidate, font=font) <= width or not current:
+                current = candidate
+            else:
+                lines.append(current)
+                current = word
+        if current:
+            lines.append(current)
+        if len(lines) > max_lines:
+            lines = lines[:max_lines]
+            lines[-1] = lines[-1].rstrip(".,;: ") + "…"
+        return lines
+
+    @staticmethod
+    def _render_card(
+        front_matter: dict[str, str],
+        logo_source: "Image.Image | SharedFrameRef",
+        out_path: str,
+        _data: None = None,
+    ) -> list[tuple[str, bytes]]:
+        """
+        Compone la tarjeta de un post y la retorna codificada como PNG.
+        """
+        width, height = SOCIAL_CARD_SIZE
+        margin = 64
+        card = Image.new("RGBA", SOCIAL_CARD_SIZE, SOCIAL_CARD_BACKGROUND)
         try:
-            img_rgb = ImageModeConverter.ensure_rgb(base_img)
-            ImageIOManager.save_image(img_rgb, out_path, "JPEG", quality=95)
-            print(f"✅ Generado (reemplazado): {PREVIEW_JPG}")
-        except Exception as e:
-            print(f"❌ Error generando '{PREVIEW_JPG}': {e}")
+            with SharedFrame.attach(logo_source) as logo:
+                card.alpha_composite(logo, dest=(margin, margin))
+
+            draw = ImageDraw.Draw(card)
+            text_width = width - 2 * margin
+            y = margin + SOCIAL_CARD_LOGO_SIZE + 32
+
+            title_font = SocialCardGenerator._load_font(60)
+            title = front_matter.get("title") or "Artículo sin título"
+            for line in SocialCardGenerator._wrap(draw, title, title_font, text_width, 3):
+                draw.text((margin, y), line, font=title_font, fill=SOCIAL_CARD_TEXT_COLOR)
+                y += 72
+
+            description = front_matter.get("description", "")
+            if description:
+                body_font = SocialCardGenerator._load_font(30)
+                y += 12
+                for line in SocialCardGenerator._wrap(draw, description, body_font, text_width, 2):
+                    draw.text((margin, y), line, font=body_font, fill=SOCIAL_CARD_MUTED_COLOR)
+                    y += 40
+
+            footer = " · ".join(v for v in (front_matter.get("author"), front_matter.get("date")) if v)
+            if footer:
+                footer_font = SocialCardGenerator._load_font(26)
+                draw.text((margin, height - margin - 26), footer, font=footer_font, fill=SOCIAL_CARD_MUTED_COLOR)
+
+            return [(out_path, ImageIOManager.encode_image(card, "PNG"))]
+        finally:
+            card.close()
+
+
+###############################################################################
+# RESPONSABILIDAD: Empaquetar rectángulos en hojas (sprite sheets)
+###############################################################################
+@dataclass
+class PackedSprite:
+    """
+    Posición de un sprite dentro de su hoja.
+    """
+    name: str
+    sheet: int
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class ShelfPacker:
+    """
+    Empaquetado por estantes ("shelf next-fit"): se ordenan los rectángulos
+    por alto y se colocan de izquierda a derecha; cuando no entran, se abre un
+    estante nuevo y, si la hoja se llena, una hoja nueva. Es O(n log n) y, con
+    íconos de tamaño parecido, deja muy poco espacio sin usar.
+    """
 
-    async def _generate_preview_webp(self, base_img: Image.Image) -> None:
+    @staticmethod
+    def pack(
+        rects: list[tuple[str, int, int]],
+        max_size: tuple[int, int],
+        padding: int = 0,
+    ) -> tuple[list[PackedSprite], list[tuple[int, int]]]:
         """
-        Crea 'preview.webp' con el mismo tamaño y mantiene transparencia (WEBP sí soporta).
+        Empaqueta 'rects' (nombre, ancho, alto) en hojas de a lo sumo 'max_size'.
+        Retorna los sprites ubicados y el tamaño ajustado de cada hoja.
         """
-        out_path = os.path.join(self.script_dir, PREVIEW_WEBP)
+        max_w, max_h = max_size
+        sprites: list[PackedSprite] = []
+        sheets: list[tuple[int, int]] = []
+        sheet = x = y = shelf_h = used_w = 0
+        for name, w, h in sorted(rects, key=lambda r: (-r[2], -r[1], r[0])):
+            if w > max_w or h > max_h:
+                raise ValueError(f"'{name}' ({w}x{h}) no entra en una hoja de {max_w}x{max_h}.")
+            if x + w > max_w:
+                x, y, shelf_h = 0, y + shelf_h + padding, 0
+            if y + h > max_h:
+                sheets.append((used_w, y - padding))
+                sheet, x, y, shelf_h, used_w = sheet + 1, 0, 0, 0, 0
+            sprites.append(PackedSprite(name, sheet, x, y, w, h))
+            x += w + padding
+            shelf_h = max(shelf_h, h)
+            used_w = max(used_w, x - padding)
+        if sprites:
+            sheets.append((used_w, y + shelf_h))
+        return sprites, sheets
+
+###############################################################################
+# RESPONSABILIDAD: Generar sprite sheets (atlas) con su mapa de coordenadas
+###############################################################################
+class SpriteAtlasGenerator:
+    """
+    Reduce un conjunto de íconos a ATLAS_ICON_SIZE (manteniendo proporción),
+    los empaqueta en una o más hojas PNG y genera el mapa de coordenadas en
+    JSON y en CSS. Un solo pedido HTTP reemplaza a decenas de íconos sueltos.
+    """
+
+    def __init__(
+        self,
+        script_dir: str,
+        icon_size: int = ATLAS_ICON_SIZE,
+        tracker: ResourceTracker | None = None,
+        use_processes: bool = PIPELINE_USE_PROCESSES,
+    ):
+        self.script_dir = script_dir
+        self.icon_size = icon_size
+        self.tracker = tracker or ResourceTracker()
+        self.use_processes = use_processes
+
+    async def generate_atlas(self) -> PipelineStats | None:
+        """
+        Genera las hojas, 'sprites.json' y 'sprites.css', siempre reemplazando.
+        Con INCREMENTAL_SINCE se omite si no cambió ningún ícono ni el mapa y
+        el mapa existe (las hojas se reempaquetan completas: un ícono nuevo
+        mueve a los demás).
+        Retorna las estadísticas del pipeline (None si no hubo íconos).
+        """
+        changed = GitChangeDetector.scope(self.script_dir)
+        if changed is not None and not (
+            GitChangeDetector.names_in(changed, self.script_dir, ATLAS_SOURCE_EXTENSIONS)
+            or GitChangeDetector.touches(changed, self.script_dir, (ATLAS_MAP_JSON, ATLAS_MAP_CSS))
+            or GitChangeDetector.missing(self.script_dir, (ATLAS_MAP_JSON, ATLAS_MAP_CSS))
+        ):
+            print("🔎 Ningún ícono del atlas cambió; no hay nada que reempaquetar.")
+            return
+        sources = sorted(
+            f for f in os.listdir(self.script_dir) if f.lower().endswith(ATLAS_SOURCE_EXTENSIONS)
+        )
+        if not sources:
+            print("No se encontraron íconos para el atlas en el directorio.")
+            return
+
+        # Etapa de reducción: cada ícono se lee y se reduce en paralelo
+        results = await asyncio.gather(
+            *(asyncio.to_thread(self._load_icon, file_name) for file_name in sources),
+            return_exceptions=True,
+        )
+        icons: dict[str, Image.Image] = {}
+        for file_name, result in zip(sources, results):
+            if isinstance(result, BaseException):
+                print(f"❌ Error cargando '{file_name}' para el atlas: {result}")
+                continue
+            name = self._css_name(file_name)
+            if name in icons:
+                print(f"⚠️ '{file_name}' repite el nombre '{name}'; se omite.")
+                self.tracker.release(result)
+                continue
+            icons[name] = result
+        if not icons:
+            return
+
+        sheets: list[Image.Image] = []
         try:
-            img_rgba = ImageModeConverter.ensure_rgba(base_img)
-            ImageIOManager.save_image(img_rgba, out_path, "WEBP", quality=95)
-            print(f"✅ Generado (reemplazado): {PREVIEW_WEBP}")
-        except Exception as e:
-            print(f"❌ Error generando '{PREVIEW_WEBP}': {e}")
+            rects = [(name, img.width, img.height) for name, img in icons.items()]
+            sprites, sheet_sizes = ShelfPacker.pack(rects, ATLAS_MAX_SHEET_SIZE, ATLAS_PADDING)
+            sheets = [self.tracker.track(Image.new("RGBA", size, (0, 0, 0, 0))) for size in sheet_sizes]
+            for sprite in sprites:
+                sheets[sprite.sheet].alpha_composite(icons[sprite.name], dest=(sprite.x, sprite.y))
+        finally:
+            self.tracker.release(*icons.values())
+
+        try:
+            jobs = [
+                PipelineJob(self._sheet_name(index), None, partial(self._encode_sheet, sheet, index))
+                for index, sheet in enumerate(sheets)
+            ]
+            jobs.append(PipelineJob(ATLAS_MAP_JSON, None, partial(self._encode_maps, sprites, sheet_sizes)))
+            jobs.append(PipelineJob("hojas obsoletas", None, partial(self._stale_sheets, len(sheets))))
+            # Las hojas se comparten por referencia con los workers, así que se usan hilos
+            pipeline = StagedPipeline(use_processes=False, tracker=self.tracker)
+            stats = await pipeline.run(jobs)
+        finally:
+            self.tracker.release(*sheets)
+        print(f"🧩 {len(sprites)} íconos en {len(sheets)} hoja(s).")
+        print(stats.report())
+        print(self.tracker.report())
+        return stats
+
+    @staticmethod
+    def _css_name(file_name: str) -> str:
+        base_name, _ = os.path.splitext(file_name)
+        return re.sub(r"[^A-Za-z0-9_-]+", "-", base_name).strip("-").lower() or "icon"
+
+    @staticmethod
+    def _sheet_name(index: int) -> str:
+        return ATLAS_SHEET_PATTERN.format(index=index)
+
+    def _load_icon(self, file_name: str) -> Image.Image:
+        """
+        Lee un ícono y lo reduce para que entre en 'icon_size' sin deformarlo.
+        """
+        with ImageIOManager.open_image(os.path.join(self.script_dir, file_name), self.tracker) as img:
+            AnimationFrames.seek_representative(img, ANIMATION_FRAME_SELECTION)
+            img_rgba = ImageModeConverter.ensure_rgba(img)
+            try:
+                size = ImageResizer.fit_size(img_rgba.size, (self.icon_size, self.icon_size))
+                return self.tracker.track(ImageResizer.resize(img_rgba, size))
+            finally:
+                if img_rgba is not img:
+                    img_rgba.close()
+
+    def _encode_sheet(self, sheet: Image.Image, index: int, _data: None = None) -> list[tuple[str, bytes]]:
+        out_path = os.path.join(self.script_dir, self._sheet_name(index))
+        return [(out_path, ImageIOManager.encode_image(sheet, "PNG"))]
+
+    def _encode_maps(
+        self, sprites: list[PackedSprite], sheet_sizes: list[tuple[int, int]], _data: None = None
+    ) -> list[tuple[str, bytes]]:
+        """
+        Genera 'sprites.json' (coordenadas) y 'sprites.css' (una clase por ícono).
+        """
+        atlas = {
+            "sheets": [
+                {"file": self._sheet_name(i), "width": w, "height": h} for i, (w, h) in enumerate(sheet_sizes)
+            ],
+            "sprites": {
+                s.name: {"sheet": s.sheet, "x": s.x, "y": s.y, "width": s.width, "height": s.height}
+                for s in sorted(sprites, key=lambda s: s.name)
+            },
+        }
+        css = [".sprite {\n  display: inline-block;\n  background-repeat: no-repeat;\n}\n"]
+        for s in sorted(sprites, key=lambda s: s.name):
+            css.append(
+                f".sprite-{s.name} {{\n"
+                f"  width: {s.width}px;\n"
+                f"  height: {s.height}px;\n"
+                f"  background-image: url(\"{self._sheet_name(s.sheet)}\");\n"
+                f"  background-position: -{s.x}px -{s.y}px;\n"
+                f"}}\n"
+            )
+        return [
+            (os.path.join(self.script_dir, ATLAS_MAP_JSON),
+             json.dumps(atlas, indent=2).encode("utf-8") + b"\n"),
+            (os.path.join(self.script_dir, ATLAS_MAP_CSS), "\n".join(css).encode("utf-8")),
+        ]
+
+    def _stale_sheets(self, sheet_count: int, _data: None = None) -> list[tuple[str, None]]:
+        """
+        Marca para eliminar las hojas de corridas anteriores que ya no se usan.
+        """
+        pattern = re.compile(re.escape(ATLAS_SHEET_PATTERN).replace(r"\{index\}", r"(\d+)") + "$")
+        stale = []
+        for file_name in os.listdir(self.script_dir):
+            match = pattern.match(file_name)
+            if match and int(match.group(1)) >= sheet_count:
+                stale.append((os.path.join(self.script_dir, file_name), None))
+        return stale
+
+###############################################################################
+# RESPONSABILIDAD: Calcular hashes perceptuales (aHash / dHash)
+###############################################################################
+class PerceptualHasher:
+    """
+    Huella visual de una imagen: se reduce a una grilla diminuta en escala de
+    grises y se codifica en bits. Dos re-codificaciones (otro formato, otro
+    tamaño) de la misma imagen quedan a pocos bits de distancia.
+    """
+
+    @staticmethod
+    def hashes(data: bytes, hash_size: int = PHASH_HASH_SIZE) -> dict:
+        """
+        Decodifica 'data' y retorna aHash, dHash (hex) y dimensiones originales.
+        Con JPEG se usa 'draft' para decodificar ya reducido.
+        """
+        with Image.open(io.BytesIO(data)) as img:
+            size = img.size
+            AnimationFrames.seek_representative(img, ANIMATION_FRAME_SELECTION)
+            img.draft("RGB", (hash_size * 8, hash_size * 8))
+            gray = PerceptualHasher._flatten_gray(img)
+        try:
+            return {
+                "width": size[0],
+                "height": size[1],
+                "ahash": PerceptualHasher._ahash(gray, hash_size),
+                "dhash": PerceptualHasher._dhash(gray, hash_size),
+            }
+        finally:
+            gray.close()
+
+    @staticmethod
+    def _flatten_gray(img: Image.Image) -> Image.Image:
+        """
+        Escala de grises sobre fondo blanco: los píxeles transparentes no
+        aportan su color "oculto" a la huella.
+        """
+        if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+            img_rgba = ImageModeConverter.ensure_rgba(img)
+            background = Image.new("RGBA", img_rgba.size, (255, 255, 255, 255))
+            background.alpha_composite(img_rgba)
+            if img_rgba is not img:
+                img_rgba.close()
+            gray = background.convert("L")
+            background.close()
+            return gray
+        return img.convert("L")
+
+    @staticmethod
+    def _bits_to_hex(bits: list[bool], hash_size: int) -> str:
+        value = 0
+        for bit in bits:
+            value = (value << 1) | int(bit)
+        return f"{value:0{hash_size * hash_size // 4}x}"
+
+    @staticmethod
+    def _ahash(gray: Image.Image, hash_size: int) -> str:
+        small = gray.resize((hash_size, hash_size), Image.BOX)
+        pixels = small.tobytes()
+        small.close()
+        mean = sum(pixels) / len(pixels)
+        return PerceptualHasher._bits_to_hex([p > mean for p in pixels], hash_size)
+
+    @staticmethod
+    def _dhash(gray: Image.Image, hash_size: int) -> str:
+        small = gray.resize((hash_size + 1, hash_size), Image.BOX)
+        pixels = small.tobytes()
+        small.close()
+        row = hash_size + 1
+        bits = [
+            pixels[y * row + x] > pixels[y * row + x + 1]
+            for y in range(hash_size)
+            for x in range(hash_size)
+        ]
+        return PerceptualHasher._bits_to_hex(bits, hash_size)
+
+    @staticmethod
+    def distance(hash_a: str, hash_b: str) -> int:
+        """
+        Distancia de Hamming entre dos hashes en hex.
+        """
+        return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+###############################################################################
+# RESPONSABILIDAD: Índice persistente de hashes y grupos de casi-duplicados
+###############################################################################
+class PerceptualHashIndex:
+    """
+    Recorre el árbol de assets, calcula en paralelo el hash perceptual de cada
+    imagen y lo guarda en un índice en disco. En corridas siguientes sólo se
+    vuelven a hashear los archivos cuyo mtime o tamaño cambió.
+
+    Con el índice al día agrupa las imágenes visualmente iguales (aunque estén
+    en otro formato o tamaño) y reporta cuántos bytes ocupan las copias.
+    """
+
+    def __init__(
+        self,
+        script_dir: str,
+        index_file: str = PHASH_INDEX_FILE,
+        max_distance: int = PHASH_MAX_DISTANCE,
+        tracker: ResourceTracker | None = None,
+    ):
+        self.script_dir = script_dir
+        self.index_path = os.path.join(script_dir, index_file)
+        self.max_distance = max_distance
+        self.tracker = tracker or ResourceTracker()
+
+    async def build_index(self) -> None:
+        """
+        Actualiza el índice y muestra los grupos de casi-duplicados.
+        """
+        files = await asyncio.to_thread(self._discover)
+        if not files:
+            print("No se encontraron imágenes para indexar.")
+            return
 
+        previous = self._load_index()
+        entries: dict[str, dict] = {}
+        pending: list[tuple[str, os.stat_result]] = []
+        for rel_path, stat in files:
+            entry = previous.get(rel_path)
+            if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["bytes"] == stat.st_size:
+                entries[rel_path] = entry
+            else:
+                pending.append((rel_path, stat))
+        print(f"🔎 {len(files)} imágenes, {len(entries)} sin cambios, {len(pending)} por hashear.")
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=PIPELINE_ENCODE_WORKERS) as executor:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(executor, self._hash_file, rel_path, stat) for rel_path, stat in pending),
+                return_exceptions=True,
+            )
+        for (rel_path, _), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                print(f"❌ Error hasheando '{rel_path}': {result}")
+                continue
+            entries[rel_path] = result
+        if pending:
+            print(f"⏱️ Hashes calculados en {time.perf_counter() - start:.2f}s.")
+
+        self._save_index(entries)
+        self._report(self.clusters(entries, self.max_distance), entries)
+        print(self.tracker.report())
+
+    def _discover(self) -> list[tuple[str, os.stat_result]]:
+        """
+        Lista las imágenes bajo 'script_dir' (sin carpetas ocultas ni cachés).
+        """
+        files = []
+        for root, dirs, names in os.walk(self.script_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and d != "__pycache__")
+            for name in sorted(names):
+                if name.lower().endswith(PHASH_SOURCE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    files.append((os.path.relpath(path, self.script_dir), os.stat(path)))
+        return files
+
+    def _hash_file(self, rel_path: str, stat: os.stat_result) -> dict:
+        data = ImageIOManager.read_bytes(os.path.join(self.script_dir, rel_path), self.tracker)
+        entry = PerceptualHasher.hashes(data)
+        entry.update({
+            "mtime_ns": stat.st_mtime_ns,
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+        return entry
+
+    @staticmethod
+    def clusters(entries: dict[str, dict], max_distance: int) -> list[list[str]]:
+        """
+        Agrupa (unión-búsqueda) los archivos cuyo aHash y dHash están ambos a
+        'max_distance' bits o menos. Sólo se retornan grupos de 2 o más.
+        """
+        paths = sorted(entries)
+        parent = list(range(len(paths)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        ahashes = [int(entries[p]["ahash"], 16) for p in paths]
+        dhashes = [int(entries[p]["dhash"], 16) for p in paths]
+        for i in range(len(paths)):
+            for j in range(i + 1, len(paths)):
+                if ((ahashes[i] ^ ahashes[j]).bit_count() <= max_distance
+                        and (dhashes[i] ^ dhashes[j]).bit_count() <= max_distance):
+                    parent[find(j)] = find(i)
+
+        groups: dict[int, list[str]] = {}
+        for i, path in enumerate(paths):
+            groups.setdefault(find(i), []).append(path)
+        return [group for group in groups.values() if len(group) > 1]
+
+    @staticmethod
+    def _report(clusters: list[list[str]], entries: dict[str, dict]) -> None:
+        """
+        Muestra cada grupo con la imagen de mayor resolución primero; el resto
+        son candidatas a podarse (las idénticas byte a byte se marcan).
+        """
+        if not clusters:
+            print("✅ No se encontraron imágenes casi duplicadas.")
+            return
+        redundant_bytes = 0
+        for number, group in enumerate(clusters, start=1):
+            group.sort(key=lambda p: (-entries[p]["width"] * entries[p]["height"], entries[p]["bytes"], p))
+            print(f"🖼️ Grupo {number} ({len(group)} archivos):")
+            first_by_sha: dict[str, str] = {}
+            for index, path in enumerate(group):
+                entry = entries[path]
+                original = first_by_sha.setdefault(entry["sha256"], path)
+                if index == 0:
+                    note = "referencia"
+                else:
+                    redundant_bytes += entry["bytes"]
+                    note = f"idéntico a {original}" if original != path else "re-codificado"
+                print(f"   {path} ({entry['width']}x{entry['height']}, {entry['bytes']} bytes) - {note}")
+        print(f"📊 {len(clusters)} grupos; {redundant_bytes} bytes en copias redundantes.")
+
+    def _load_index(self) -> dict[str, dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as fh:
+                index = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # Si cambió el tamaño del hash, los valores guardados no son comparables
+        if index.get("hash_size") != PHASH_HASH_SIZE:
+            return {}
+        return index.get("entries", {})
+
+    def _save_index(self, entries: dict[str, dict]) -> None:
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        index = {"hash_size": PHASH_HASH_SIZE, "entries": entries}
+        data = json.dumps(index, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+        ImageIOManager.write_batch([(self.index_path, data)], fsync=False)
+
+###############################################################################
+# RESPONSABILIDAD: Generar un corpus sintético de imágenes de prueba
+###############################################################################
+class FixtureCorpus:
+    """
+    Imágenes de prueba deterministas (gradientes y figuras, sin azar) que
+    cubren los casos delicados: alpha parcial, paleta con transparencia,
+    escala de grises, JPEG CMYK, WebP animado y dimensiones enormes.
+    """
+
+    @staticmethod
+    def base(size: tuple[int, int]) -> Image.Image:
+        """
+        RGBA con color en gradiente, figuras opacas y un alpha radial
+        (opaco al centro, transparente en los bordes).
+        """
+        red = Image.linear_gradient("L").resize(size)
+        green = Image.linear_gradient("L").transpose(Image.Transpose.ROTATE_90).resize(size)
+        blue = Image.radial_gradient("L").resize(size)
+        alpha = ImageChops.invert(Image.radial_gradient("L").resize(size))
+        img = Image.merge("RGBA", (red, green, blue, alpha))
+        draw = ImageDraw.Draw(img)
+        w, h = size
+        draw.ellipse((w // 4, h // 4, w // 2, h // 2), fill=(220, 40, 40, 255))
+        draw.rectangle((w // 2, h // 2, 3 * w // 4, 3 * h // 4), fill=(30, 30, 200, 255))
+        return img
+
+    @staticmethod
+    def build(directory: str) -> dict[str, str]:
+        """
+        Escribe el corpus en 'directory' y retorna {fixture: archivo}.
+        Cada fixture también se guarda como .webp para el conversor a .ico.
+        Además escribe SELF_CHECK_CORRUPT_WEBP (un .webp truncado), que no
+        forma parte del resultado: lo usa sólo el escenario de cuarentena.
+        """
+        base = FixtureCorpus.base
+        fixtures = {
+            "rgba-alpha": ("rgba-alpha.png", base((512, 512)), {}),
+            "paletted": ("paletted.png", base((256, 256)).quantize(64), {}),
+            "grayscale": ("grayscale.png", base((384, 256)).convert("L"), {}),
+            "cmyk-jpeg": ("cmyk.jpg", base((400, 400)).convert("CMYK"), {"quality": 90}),
+            "huge": ("huge.png", base(SELF_CHECK_HUGE_SIZE).convert("RGB"), {"compress_level": 1}),
+        }
+        files = {}
+        for name, (file_name, img, options) in fixtures.items():
+            img.save(os.path.join(directory, file_name), **options)
+            webp_options = {"quality": 90} if name == "huge" else {"lossless": True}
+            img.save(os.path.join(directory, f"{name}.webp"), **webp_options)
+            img.close()
+            files[name] = file_name
+
+        frames = [base((256, 256)).rotate(angle) for angle in (0, 120, 240)]
+        frames[0].save(
+            os.path.join(directory, "animated.webp"),
+            save_all=True, append_images=frames[1:], duration=100, loop=0, lossless=True,
+        )
+        for frame in frames:
+            frame.close()
+        files["animated"] = "animated.webp"
+
+        with open(os.path.join(directory, "rgba-alpha.webp"), "rb") as fh:
+            data = fh.read()
+        with open(os.path.join(directory, SELF_CHECK_CORRUPT_WEBP), "wb") as fh:
+            fh.write(data[:len(data) // 2])
+        return files
+
+###############################################################################
+# RESPONSABILIDAD: Firmar salidas y compararlas con las de referencia (golden)
+###############################################################################
+class GoldenSignature:
+    """
+    Firma compacta de un archivo generado: formato, tamaño, modo, frames,
+    tamaños del .ico y una miniatura RGBA (que conserva el alpha). Las
+    salidas que no son imágenes se firman con su sha256.
+    """
+
+    @staticmethod
+    def signature(data: bytes) -> dict:
+        try:
+            img = Image.open(io.BytesIO(data))
+        except UnidentifiedImageError:
+            return {"sha256": hashlib.sha256(data).hexdigest()}
+        with img:
+            signature = {
+                "format": img.format,
+                "size": list(img.size),
+                "mode": img.mode,
+                "frames": AnimationFrames.frame_count(img),
+            }
+            if img.format == "ICO":
+                signature["sizes"] = sorted(list(size) for size in img.info.get("sizes", ()))
+            img_rgba = ImageModeConverter.ensure_rgba(img)
+            thumb = img_rgba.resize(SELF_CHECK_THUMB_SIZE, Image.BOX)
+            signature["thumb"] = base64.b64encode(thumb.tobytes()).decode("ascii")
+            thumb.close()
+            if img_rgba is not img:
+                img_rgba.close()
+        return signature
+
+    @staticmethod
+    def compare(expected: dict, actual: dict, tolerance: int) -> list[str]:
+        """
+        Lista las diferencias; la miniatura admite 'tolerance' niveles por canal.
+        """
+        problems = [
+            f"{key}: esperado {expected.get(key)}, obtenido {actual.get(key)}"
+            for key in ("sha256", "format", "size", "mode", "frames", "sizes")
+            if expected.get(key) != actual.get(key)
+        ]
+        if "thumb" in expected and "thumb" in actual:
+            diff = max(
+                abs(a - b)
+                for a, b in zip(base64.b64decode(expected["thumb"]), base64.b64decode(actual["thumb"]))
+            )
+            if diff > tolerance:
+                problems.append(f"píxeles difieren hasta {diff} niveles (tolerancia {tolerance})")
+        return problems
+
+###############################################################################
+# RESPONSABILIDAD: Autoverificación de resultados y presupuestos de rendimiento
+###############################################################################
+class SelfCheck:
+    """
+    Corre WebpToIcoConverter y LogoAssetsGenerator sobre el corpus sintético
+    y compara cada salida con SELF_CHECK_GOLDEN_FILE. También controla, por
+    escenario, el tiempo de cada etapa del pipeline y el CPU total (medidos en
+    unidades de un bucle de calibración, para que valgan en otra máquina) y el
+    pico de píxeles vivos, contra lo registrado en la referencia.
+
+    Con 'update' se regeneran las referencias en lugar de compararlas.
+    """
+
+    def __init__(self, script_dir: str, update: bool = False, golden_path: str | None = None):
+        self.golden_path = golden_path or os.path.join(SitePaths.repo_root(script_dir), SELF_CHECK_GOLDEN_FILE)
+        self.update = update
+
+    @staticmethod
+    def calibrate(rounds: int = SELF_CHECK_CALIBRATION_ROUNDS) -> float:
+        """
+        Segundos del bucle de calibración (el mejor de 'rounds'): reducir,
+        convertir y codificar una imagen fija, como hace el pipeline.
+        """
+        img = FixtureCorpus.base((1024, 1024))
+        best = float("inf")
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for size in (512, 180, 64, 16):
+                small = ImageResizer.resize(img, (size, size))
+                ImageIOManager.encode_image(small, "PNG")
+                small.close()
+            rgb = ImageModeConverter.ensure_rgb(img)
+            ImageIOManager.encode_image(rgb, "JPEG", quality=90)
+            rgb.close()
+            best = min(best, time.perf_counter() - t0)
+        img.close()
+        return best
+
+    @staticmethod
+    def _scenarios(fixtures: dict[str, str]) -> list[tuple[str, list[str], Callable]]:
+        """
+        (nombre, archivos del corpus que usa, fábrica de la corrida en un directorio).
+        """
+        webp_files = [f"{name}.webp" for name in fixtures if name != "animated"] + ["animated.webp"]
+        scenarios = [(
+            "webp-to-ico",
+            webp_files,
+            lambda directory, tracker: WebpToIcoConverter(directory, WEBP_TO_ICO_SIZE, tracker).convert_all_webp_to_ico(),
+        ), (
+            "webp-to-ico:corrupto",
+            ["rgba-alpha.webp", SELF_CHECK_CORRUPT_WEBP],
+            lambda directory, tracker: WebpToIcoConverter(directory, WEBP_TO_ICO_SIZE, tracker).convert_all_webp_to_ico(),
+        )]
+        for file_name in fixtures.values():
+            scenarios.append((
+                f"logo:{file_name}",
+                [file_name],
+                lambda directory, tracker, file_name=file_name:
+                    LogoAssetsGenerator(directory, file_name, tracker).generate_all_assets(),
+            ))
+        scenarios.append((
+            "logo:incremental-sin-salidas",
+            [fixtures["rgba-alpha"]],
+            lambda directory, tracker: SelfCheck._fresh_clone(directory, tracker, fixtures["rgba-alpha"]),
+        ))
+        return scenarios
+
+    @staticmethod
+    async def _fresh_clone(directory: str, tracker: ResourceTracker, file_name: str) -> PipelineStats | None:
+        """
+        Como un clon nuevo: el logo está commiteado y sus salidas no existen.
+        Con '--since HEAD' no hay diff, pero las salidas faltantes se generan.
+        """
+        global INCREMENTAL_SINCE
+        identity = ("-c", "user.name=ico4x4", "-c", "user.email=ico4x4@localhost", "-c", "commit.gpgsign=false")
+        for args in (("init", "-q"), ("add", file_name), (*identity, "commit", "-q", "-m", "logo")):
+            GitChangeDetector._git(directory, *args)
+        previous, INCREMENTAL_SINCE = INCREMENTAL_SINCE, "HEAD"
+        try:
+            return await LogoAssetsGenerator(directory, file_name, tracker).generate_all_assets()
+        finally:
+            INCREMENTAL_SINCE = previous
+
+    @staticmethod
+    def _cpu_seconds() -> float:
+        """
+        CPU del proceso más el de sus hijos ya terminados (workers aislados).
+        """
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    async def _run_scenario(self, corpus_dir: str, files: list[str], factory: Callable) -> dict:
+        """
+        Corre un escenario en un directorio propio y retorna firmas y mediciones.
+        """
+        with tempfile.TemporaryDirectory(prefix="ico4x4-check-") as directory:
+            for file_name in files:
+                shutil.copy(os.path.join(corpus_dir, file_name), directory)
+            tracker = ResourceTracker()
+            captured = io.StringIO()
+            cpu_start = self._cpu_seconds()
+            with redirect_stdout(captured), redirect_stderr(captured):
+                stats = await factory(directory, tracker)
+            cpu_seconds = self._cpu_seconds() - cpu_start
+
+            outputs = {}
+            for file_name in sorted(os.listdir(directory)):
+                if file_name not in files and os.path.isfile(os.path.join(directory, file_name)):
+                    data = ImageIOManager.read_bytes(os.path.join(directory, file_name))
+                    outputs[file_name] = GoldenSignature.signature(data)
+        errors = [line for line in captured.getvalue().splitlines() if line.startswith("❌")]
+        return {
+            "outputs": outputs,
+            "seconds": {
+                "read": stats.read_seconds if stats else 0.0,
+                "encode": stats.encode_seconds if stats else 0.0,
+                "write": stats.write_seconds if stats else 0.0,
+                "cpu": cpu_seconds,
+            },
+            "peak_pixel_bytes": tracker.peak_pixel_bytes,
+            "quarantined": sorted(os.path.basename(path) for path, _ in stats.quarantined) if stats else [],
+            "errors": errors,
+        }
+
+    @staticmethod
+    def _check_concurrent_profiling(workers: int = 4) -> list[str]:
+        """
+        Perfila con cProfile varios trabajos a la vez en hilos, como el
+        pipeline con PROFILE_MODE="cprofile": ninguno debe fallar ni quedarse
+        sin salidas o sin perfil.
+        """
+        def job(index: int) -> list[tuple[str, bytes]]:
+            img = FixtureCorpus.base((256, 256))
+            try:
+                return [(f"{index}.png", ImageIOManager.encode_image(img, "PNG"))]
+            finally:
+                img.close()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="check") as executor:
+            futures = [
+                executor.submit(JobProfiler.run, "cprofile", partial(job, index), {})
+                for index in range(workers * 2)
+            ]
+        problems = []
+        for index, future in enumerate(futures):
+            try:
+                outputs, profile = future.result()
+            except Exception as e:
+                problems.append(f"trabajo {index}: {type(e).__name__}: {e}")
+                continue
+            if not outputs or not marshal.loads(profile["pstats"]):
+                problems.append(f"trabajo {index}: sin salidas o sin perfil")
+        return problems
+
+    @staticmethod
+    def _check(name: str, expected: dict, result: dict, unit: float) -> list[str]:
+        quarantined = expected.get("quarantined", [])
+        problems = [
+            f"error durante la corrida: {line}" for line in result["errors"]
+            if not any(f"'{file_name}'" in line for file_name in quarantined)
+        ]
+        if result["quarantined"] != quarantined:
+            problems.append(f"cuarentena: esperado {quarantined}, obtenido {result['quarantined']}")
+        expected_outputs = expected.get("outputs", {})
+        for file_name in sorted(set(expected_outputs) | set(result["outputs"])):
+            if file_name not in result["outputs"]:
+                problems.append(f"{file_name}: no se generó")
+            elif file_name not in expected_outputs:
+                problems.append(f"{file_name}: salida nueva sin referencia")
+            else:
+                for problem in GoldenSignature.compare(
+                    expected_outputs[file_name], result["outputs"][file_name], SELF_CHECK_PIXEL_TOLERANCE
+                ):
+                    problems.append(f"{file_name}: {problem}")
+
+        for stage, baseline in expected.get("budgets", {}).items():
+            measured = result["seconds"][stage] / unit
+            allowed = max(baseline * SELF_CHECK_TIME_TOLERANCE, SELF_CHECK_TIME_FLOOR)
+            if measured > allowed:
+                problems.append(f"tiempo de {stage}: {measured:.2f} unidades (presupuesto {allowed:.2f})")
+        baseline_peak = expected.get("peak_pixel_bytes")
+        if baseline_peak is not None:
+            allowed_peak = baseline_peak * SELF_CHECK_MEMORY_TOLERANCE
+            if result["peak_pixel_bytes"] > allowed_peak:
+                problems.append(
+                    f"pico de píxeles: {result['peak_pixel_bytes'] / 2**20:.1f} MiB "
+                    f"(presupuesto {allowed_peak / 2**20:.1f} MiB)"
+                )
+        return problems
+
+    async def run(self) -> int:
+        """
+        Ejecuta todos los escenarios. Retorna 0 si todo coincide y 1 si no.
+        """
+        golden = {}
+        if not self.update:
+            try:
+                with open(self.golden_path, "r", encoding="utf-8") as fh:
+                    golden = json.load(fh)
+            except FileNotFoundError:
+                print(f"❌ No existe '{self.golden_path}'. Genérelo con --update-golden.")
+                return 1
+
+        unit = await asyncio.to_thread(self.calibrate)
+        print(f"🧪 Unidad de calibración: {unit * 1000:.1f} ms")
+        failures = 0
+        scenarios_out = {}
+        with tempfile.TemporaryDirectory(prefix="ico4x4-corpus-") as corpus_dir:
+            fixtures = await asyncio.to_thread(FixtureCorpus.build, corpus_dir)
+            for name, files, factory in self._scenarios(fixtures):
+                result = await self._run_scenario(corpus_dir, files, factory)
+                timing = " | ".join(f"{stage} {seconds / unit:.2f}" for stage, seconds in result["seconds"].items())
+                if self.update:
+                    scenarios_out[name] = {
+                        "outputs": result["outputs"],
+                        "budgets": {stage: round(seconds / unit, 3) for stage, seconds in result["seconds"].items()},
+                        "peak_pixel_bytes": result["peak_pixel_bytes"],
+                        **({"quarantined": result["quarantined"]} if result["quarantined"] else {}),
+                    }
+                    print(f"📝 {name}: {len(result['outputs'])} salidas | {timing}")
+                    continue
+                expected = golden.get("scenarios", {}).get(name)
+                problems = self._check(name, expected, result, unit) if expected else ["escenario sin referencia"]
+                if problems:
+                    failures += 1
+                    print(f"❌ {name}:")
+                    for problem in problems:
+                        print(f"   - {problem}")
+                else:
+                    print(f"✅ {name}: {len(result['outputs'])} salidas | {timing}")
+
+        if self.update:
+            data = json.dumps({"scenarios": scenarios_out}, indent=1, sort_keys=True).encode("utf-8") + b"\n"
+            ImageIOManager.write_batch([(self.golden_path, data)], fsync=False)
+            print(f"✅ Referencias actualizadas en {self.golden_path}")
+            return 0
+
+        problems = await asyncio.to_thread(self._check_concurrent_profiling)
+        if problems:
+            failures += 1
+            print("❌ perfilado concurrente (cprofile):")
+            for problem in problems:
+                print(f"   - {problem}")
+        else:
+            print("✅ perfilado concurrente (cprofile): sin errores")
+        print(f"📊 {len(golden.get('scenarios', {})) + 1} escenarios, {failures} con diferencias.")
+        return 1 if failures else 0
+
+###############################################################################
+# RESPONSABILIDAD: Medir costo y calidad (SSIM) de la estrategia de resize
+###############################################################################
+class ResizeBenchmark:
+    """
+    Compara, para los tamaños de la pirámide del logo, la estrategia
+    adaptativa de ImageResizer (reduce + LANCZOS y derivación encadenada)
+    contra una pasada LANCZOS completa desde el original: tiempo de CPU y
+    SSIM de cada salida respecto de la de referencia.
+    """
+
+    def __init__(self, script_dir: str, logo_filename: str = LOGO_FILENAME):
+        self.logo_path = os.path.join(script_dir, logo_filename)
+
+    @staticmethod
+    def ssim(a: Image.Image, b: Image.Image, block: int = 8) -> float:
+        """
+        SSIM medio por bloques de 'block' x 'block' (sin solapamiento) sobre
+        todos los canales. 1.0 = idénticas. Con alpha se comparan los colores
+        premultiplicados (lo que se ve al componer), así los píxeles casi
+        transparentes no pesan como si fueran opacos.
+        """
+        a, b = ImageResizer.premultiply(a), ImageResizer.premultiply(b)
+        c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+        width, height = a.size
+        block = max(1, min(block, width, height))
+        total = count = 0
+        for band_a, band_b in zip(a.split(), b.split()):
+            pixels_a, pixels_b = band_a.tobytes(), band_b.tobytes()
+            for y0 in range(0, height - block + 1, block):
+                for x0 in range(0, width - block + 1, block):
+                    xs, ys = [], []
+                    for y in range(y0, y0 + block):
+                        row = y * width + x0
+                        xs.extend(pixels_a[row:row + block])
+                        ys.extend(pixels_b[row:row + block])
+                    n = len(xs)
+                    mean_x, mean_y = sum(xs) / n, sum(ys) / n
+                    var_x = sum((v - mean_x) ** 2 for v in xs) / n
+                    var_y = sum((v - mean_y) ** 2 for v in ys) / n
+                    cov = sum((p - mean_x) * (q - mean_y) for p, q in zip(xs, ys)) / n
+                    total += ((2 * mean_x * mean_y + c1) * (2 * cov + c2)) / (
+                        (mean_x ** 2 + mean_y ** 2 + c1) * (var_x + var_y + c2)
+                    )
+                    count += 1
+        return total / max(1, count)
+
+    def _sources(self) -> list[tuple[str, Image.Image]]:
+        sources = []
+        if os.path.exists(self.logo_path):
+            with Image.open(self.logo_path) as img:
+                sources.append((os.path.basename(self.logo_path), ImageModeConverter.ensure_rgba(img)))
+        sources.append(("sintético " + "x".join(map(str, SELF_CHECK_HUGE_SIZE)), FixtureCorpus.base(SELF_CHECK_HUGE_SIZE)))
+        return sources
+
+    def _compare(self, img: Image.Image, sizes: list[tuple[int, int]]) -> tuple[float, float, float]:
+        """
+        Retorna (segundos de referencia, segundos adaptativos, SSIM mínimo).
+        """
+        t0 = time.process_time()
+        reference = {size: img.resize(size, Image.LANCZOS) for size in sizes}
+        reference_seconds = time.process_time() - t0
+
+        t0 = time.process_time()
+        parents = ImageResizer.chain_sources(img.size, sizes)
+        source = ImageResizer.premultiply(img)
+        adaptive: dict[tuple[int, int], Image.Image] = {}
+        for size, parent in parents.items():
+            adaptive[size] = ImageResizer.resize(source if parent is None else adaptive[parent], size)
+        if source is not img:
+            source.close()
+        adaptive_seconds = time.process_time() - t0
+
+        worst = 1.0
+        for size in sizes:
+            score = self.ssim(reference[size], adaptive[size])
+            worst = min(worst, score)
+            origin = "x".join(map(str, parents[size])) if parents[size] else "original"
+            mark = "✅" if score >= RESIZE_MIN_SSIM else "❌"
+            print(f"   {mark} {size[0]}x{size[1]} desde {origin}: SSIM {score:.4f}")
+            reference[size].close()
+            adaptive[size].close()
+        return reference_seconds, adaptive_seconds, worst
+
+    async def run(self) -> int:
+        """
+        Imprime el informe y retorna 1 si alguna salida queda por debajo de
+        RESIZE_MIN_SSIM, 0 si no.
+        """
+        sizes = sorted(LogoAssetsGenerator(os.path.dirname(self.logo_path), LOGO_FILENAME)._pyramid_sizes(),
+                       reverse=True)
+        failed = False
+        for name, img in self._sources():
+            print(f"📐 {name} ({img.width}x{img.height}) -> {len(sizes)} tamaños")
+            reference_seconds, adaptive_seconds, worst = await asyncio.to_thread(self._compare, img, sizes)
+            img.close()
+            speedup = reference_seconds / adaptive_seconds if adaptive_seconds else float("inf")
+            print(
+                f"   ⏱️ LANCZOS directo {reference_seconds:.2f}s | adaptativo {adaptive_seconds:.2f}s "
+                f"({speedup:.1f}x) | SSIM mínimo {worst:.4f}"
+            )
+            failed = failed or worst < RESIZE_MIN_SSIM
+        return 1 if failed else 0
 
 ###############################################################################
 # RESPONSABILIDAD: Orquestar la ejecución según la opción seleccionada
 ###############################################################################
-async def main() -> None:
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Opciones de línea de comandos; la acción se sigue eligiendo en el menú.
+    """
+    parser = argparse.ArgumentParser(description="Genera íconos, previews y assets derivados.")
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const=PROFILE_MODES[0],
+        choices=PROFILE_MODES,
+        help="perfilar cada trabajo (por defecto 'sampling': pilas para flamegraph)",
+    )
+    parser.add_argument(
+        "--self-check",
+        action="store_true",
+        help="verificar salidas y tiempos contra las referencias (sin menú)",
+    )
+    parser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="regenerar las referencias de --self-check",
+    )
+    parser.add_argument(
+        "--golden",
+        metavar="RUTA",
+        help=f"referencias de --self-check (por defecto {SELF_CHECK_GOLDEN_FILE} en la raíz del repositorio)",
+    )
+    parser.add_argument(
+        "--benchmark-resize",
+        action="store_true",
+        help="comparar tiempo y SSIM del resize adaptativo contra LANCZOS directo (sin menú)",
+    )
+    parser.add_argument(
+        "--clear-quarantine",
+        action="store_true",
+        help=f"vaciar la cuarentena de .webp ({QUARANTINE_FILE}) antes de la acción elegida",
+    )
+    parser.add_argument(
+        "--since",
+        nargs="?",
+        const="HEAD",
+        metavar="REF",
+        help="procesar sólo lo que cambió en git desde REF (sin REF: cambios sin commitear)",
+    )
+    parser.add_argument(
+        "--decoded-cache",
+        action="store_true",
+        help=f"reutilizar los orígenes ya decodificados (en {DECODED_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--verify",
+        nargs="?",
+        const="sample",
+        choices=(*VERIFY_MODES, "none"),
+        help="verificar las salidas escritas (sin modo: 'sample'; por defecto VERIFY_OUTPUTS)",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=("local", "s3"),
+        help="destino de las salidas (por defecto STORAGE_BACKEND)",
+    )
+    parser.add_argument(
+        "--object-store-server",
+        metavar="DIR",
+        help="servir un bucket S3 local de prueba con los datos en DIR (sin menú)",
+    )
+    parser.add_argument(
+        "--object-store-port",
+        type=int,
+        default=urllib.parse.urlsplit(S3_ENDPOINT).port or 9000,
+        help="puerto del bucket S3 local de prueba",
+    )
+    return parser.parse_args(argv)
+
+
+async def main(args: argparse.Namespace | None = None) -> int | None:
     """
     Función principal asíncrona. Solicita al usuario:
       1) Convertir .webp -> .ico
-      2) Generar favicon y apple-touch-icon + previews desde 'LOGO_FILENAME'
+      2) Generar favicon, apple-touch-icon, íconos PWA + previews desde 'LOGO_FILENAME'
+      3) Generar tarjetas Open Graph para los posts del blog
+      4) Generar sprite sheets (atlas) con los .webp del directorio
+      5) Indexar hashes perceptuales y reportar imágenes casi duplicadas
+      6) 1 y 2 en simultáneo, repartiendo los workers por prioridad
+    Con '--profile' cada trabajo del pipeline se perfila (ver ProfileReport).
+    Con '--since REF' las opciones 1, 2, 4 y 6 sólo procesan lo que cambió en git.
+    Con '--self-check' / '--update-golden' no hay menú: se retorna el código
+    de salida de la autoverificación.
+    Con '--object-store-server' sólo se sirve el bucket S3 local de prueba.
+    Con '--verify' retorna 1 si alguna salida no pasó la verificación posterior
+    a la escritura.
     """
+    global PROFILE_MODE, STORAGE_BACKEND, VERIFY_OUTPUTS, DECODED_CACHE, INCREMENTAL_SINCE
+    if args and args.profile:
+        PROFILE_MODE = args.profile
+    if args and args.decoded_cache:
+        DECODED_CACHE = True
+    if args and args.since:
+        INCREMENTAL_SINCE = args.since
+    if args and args.clear_quarantine:
+        count = WebpToIcoConverter.clear_quarantine(SCRIPT_DIR)
+        print(f"🧹 Cuarentena vaciada ({count} archivo(s) se reintentarán).")
+    if args and args.verify:
+        VERIFY_OUTPUTS = None if args.verify == "none" else args.verify
+    if args and args.storage:
+        STORAGE_BACKEND = args.storage
+    if args and args.benchmark_resize:
+        return await ResizeBenchmark(SCRIPT_DIR).run()
+    if args and args.object_store_server:
+        await LocalObjectStoreServer(args.object_store_server, port=args.object_store_port).serve_forever()
+        return None
+    if args and (args.self_check or args.update_golden):
+        return await SelfCheck(SCRIPT_DIR, update=args.update_golden, golden_path=args.golden).run()
+
     print("¿Qué acción desea realizar?")
     print("1) Convertir TODOS los archivos .webp a .ico (mismo nombre base).")
-    print("2) Generar favicon, apple-touch-icon y previews a partir de 'logo.png'.")
-    opcion = input("Ingrese 1 o 2 y presione [Enter]: ").strip()
+    print("2) Generar favicon, apple-touch-icon, íconos PWA y previews a partir de 'logo.png'.")
+    print("3) Generar tarjetas Open Graph (1200x630) para los posts del blog.")
+    print("4) Generar sprite sheets (atlas) con los .webp del directorio.")
+    print("5) Detectar imágenes casi duplicadas (índice de hashes perceptuales).")
+    print("6) Hacer 1 y 2 a la vez (los íconos del logo pasan delante del lote de .webp).")
+    opcion = input("Ingrese 1, 2, 3, 4, 5 o 6 y presione [Enter]: ").strip()
 
+    runs: list[PipelineStats | None] = []
     if opcion == "1":
         converter = WebpToIcoConverter(SCRIPT_DIR, WEBP_TO_ICO_SIZE)
-        await converter.convert_all_webp_to_ico()
+        runs.append(await converter.convert_all_webp_to_ico())
     elif opcion == "2":
-        generator = LogoAssetsGenerator(SCRIPT_DIR, LOGO_FILENAME)
-        await generator.generate_all_assets()
+        generator = LogoAssetsGenerator(
+            SCRIPT_DIR, LOGO_FILENAME, svg_filename=LOGO_SVG_FILENAME if USE_SVG_SOURCE else None
+        )
+        runs.append(await generator.generate_all_assets())
+    elif opcion == "3":
+        cards = SocialCardGenerator(SCRIPT_DIR)
+        runs.append(await cards.generate_all_cards())
+    elif opcion == "4":
+        atlas = SpriteAtlasGenerator(SCRIPT_DIR, ATLAS_ICON_SIZE)
+        runs.append(await atlas.generate_atlas())
+    elif opcion == "5":
+        index = PerceptualHashIndex(SCRIPT_DIR)
+        await index.build_index()
+    elif opcion == "6":
+        # Las dos corridas comparten el PriorityScheduler de StagedPipeline:
+        # los trabajos "interactive" del logo toman el próximo slot libre
+        converter = WebpToIcoConverter(SCRIPT_DIR, WEBP_TO_ICO_SIZE)
+        generator = LogoAssetsGenerator(
+            SCRIPT_DIR, LOGO_FILENAME, svg_filename=LOGO_SVG_FILENAME if USE_SVG_SOURCE else None
+        )
+        runs.extend(await asyncio.gather(converter.convert_all_webp_to_ico(), generator.generate_all_assets()))
     else:
         print("Opción no válida. Saliendo...")
 
+    verify_failed = sum(len(stats.verify_failed) for stats in runs if stats)
+    if verify_failed:
+        print(f"❌ {verify_failed} salida(s) no pasaron la verificación.")
+        return 1
+    return None
+
 
 ###############################################################################
 #                            PUNTO DE ENTRADA
 ###############################################################################
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        sys.exit(asyncio.run(main(parse_args())))
+    except KeyboardInterrupt:
+        # Las tareas en curso ya se cancelaron y sus workers se mataron
+        print("\n⚠️ Interrumpido por el usuario.")
+        sys.exit(130)